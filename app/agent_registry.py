@@ -0,0 +1,193 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+
+
+class AgentView():
+    '''
+    One player's entry in an AgentRegistry, read and written like the dict each entry of agent_info used
+    to be: view['xy'], view['has_flag'] = True, ... The values themselves live in the registry's arrays.
+    '''
+    __slots__ = ('registry', 'slot')
+
+    def __init__(self, registry, slot):
+        self.registry = registry
+        self.slot = slot
+
+
+    @property
+    def team(self):
+        return self.registry.teams[self.registry.team[self.slot]]
+
+
+    @property
+    def player_idx(self):
+        return int(self.registry.player_idx[self.slot])
+
+
+    def __getitem__(self, key):
+        if key == 'xy':
+            return self.registry.x[self.slot].item(), self.registry.y[self.slot].item()
+        return self.registry.columns[key][self.slot].item()
+
+
+    def __setitem__(self, key, value):
+        if key == 'xy':
+            self.registry.x[self.slot], self.registry.y[self.slot] = value
+        else:
+            self.registry.columns[key][self.slot] = value
+
+
+    def __contains__(self, key):
+        return key == 'xy' or key in self.registry.columns
+
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+    def keys(self):
+        return ['xy'] + list(self.registry.columns)
+
+
+
+class TeamAgents(Mapping):
+    '''player_idx -> AgentView of one team's players, in the order they were added'''
+    def __init__(self, registry, team):
+        self.registry = registry
+        self.team = team
+        self.views = {}
+
+
+    def __getitem__(self, player_idx):
+        return self.views[player_idx]
+
+
+    def __iter__(self):
+        return iter(self.views)
+
+
+    def __len__(self):
+        return len(self.views)
+
+
+
+class AgentRegistry():
+    '''
+    Every player's shared state as a struct of arrays: one numpy array per field, indexed by the slot a
+    player gets when it is added. registry[team][player_idx] is a dict like view of one player for the
+    code that reads or updates a single player, and the get_ methods answer questions about many players
+    (nearest, flag carrier, centroid) with single numpy operations over the arrays.
+    '''
+    teams = ('blue', 'red')
+    #no per player loops: a query costs a few numpy calls however many players there are
+
+    def __init__(self, capacity=16):
+        '''capacity - slots allocated up front, the arrays double whenever they fill up'''
+        self.size = 0
+        self.x = np.zeros(capacity, dtype=float)
+        self.y = np.zeros(capacity, dtype=float)
+        self.team = np.zeros(capacity, dtype=np.int8)
+        self.player_idx = np.zeros(capacity, dtype=np.int64)
+        #the rest of a player's fields, by the key the views use
+        self.columns = {'has_flag': np.zeros(capacity, dtype=bool),
+                        'is_incapacitated': np.zeros(capacity, dtype=bool),
+                        'in_enemy_territory': np.zeros(capacity, dtype=bool),
+                        'incapacitated_countdown': np.zeros(capacity, dtype=np.int64)}
+        self.team_agents = {team: TeamAgents(self, team) for team in self.teams}
+        #the view of every slot
+        self.views = []
+
+
+    def __getitem__(self, team):
+        return self.team_agents[team]
+
+
+    def add(self, team, player_idx, xy):
+        '''Register a player at xy, with no flag and not incapacitated, and return its view'''
+        if self.size == len(self.x):
+            self.__grow()
+        slot = self.size
+        self.size += 1
+
+        self.x[slot], self.y[slot] = xy
+        self.team[slot] = self.teams.index(team)
+        self.player_idx[slot] = player_idx
+        for column in self.columns.values():
+            column[slot] = 0
+
+        view = AgentView(self, slot)
+        self.team_agents[team].views[player_idx] = view
+        self.views.append(view)
+        return view
+
+
+    def get_slots(self, team=None, exclude=None, incapacitated_only=False, has_flag_only=False):
+        '''
+        Slots of the players matching all of the filters, in the order they were added, as an array
+        team - only this team's players, every team's if None
+        exclude - (team, player_idx) of a player to leave out, usually the one asking
+        '''
+        return np.flatnonzero(self.__matching(team, exclude, incapacitated_only, has_flag_only))
+
+
+    def get_view(self, slot):
+        return self.views[slot]
+
+
+    def get_views(self, slots):
+        return [self.get_view(slot) for slot in slots]
+
+
+    def get_nearest(self, xy, **filters):
+        '''View of the player closest to xy in a straight line out of those get_slots(**filters) returns, None if there are none'''
+        if not self.size:
+            return None
+        dx = self.x[:self.size] - xy[0]
+        dy = self.y[:self.size] - xy[1]
+        #players left out by the filters are infinitely far, argmin keeps the first of equally close players
+        distances = np.where(self.__matching(**filters), dx * dx + dy * dy, np.inf)
+        slot = np.argmin(distances)
+        return None if distances[slot] == np.inf else self.get_view(slot)
+
+
+    def get_flag_carrier(self, team):
+        '''View of the player of team holding a flag, None if none of them are'''
+        slots = self.get_slots(team=team, has_flag_only=True)
+        return self.get_view(slots[0]) if len(slots) else None
+
+
+    def get_centroid(self, team):
+        '''Mean (x, y) of a team's players'''
+        slots = self.get_slots(team=team)
+        return float(np.mean(self.x[slots])), float(np.mean(self.y[slots]))
+
+
+    def __matching(self, team=None, exclude=None, incapacitated_only=False, has_flag_only=False):
+        '''Boolean array over the slots in use, True for the players get_slots keeps'''
+        keep = np.ones(self.size, dtype=bool)
+        if team is not None:
+            keep &= self.team[:self.size] == self.teams.index(team)
+        if exclude is not None:
+            exclude_team, exclude_idx = exclude
+            keep &= (self.team[:self.size] != self.teams.index(exclude_team)) | (self.player_idx[:self.size] != exclude_idx)
+        if incapacitated_only:
+            keep &= self.columns['is_incapacitated'][:self.size]
+        if has_flag_only:
+            keep &= self.columns['has_flag'][:self.size]
+        return keep
+
+
+    def __grow(self):
+        capacity = max(len(self.x) * 2, 1)
+        for name in ['x', 'y', 'team', 'player_idx']:
+            setattr(self, name, self.__resized(getattr(self, name), capacity))
+        for key, column in self.columns.items():
+            self.columns[key] = self.__resized(column, capacity)
+
+
+    def __resized(self, array, capacity):
+        resized = np.zeros(capacity, dtype=array.dtype)
+        resized[:len(array)] = array
+        return resized
@@ -0,0 +1,232 @@
+import sys, os, time, json, random, argparse, tempfile
+import numpy as np
+
+import distance_transform
+from config import Config
+from map_generator import MapGenerator
+from navigation import Navigation
+
+
+#sample usage, run from the app directory like the game:
+
+#python benchmark_navigation.py --output nav_before.json
+#... change the navigation code ...
+#python benchmark_navigation.py --output nav_after.json
+#diff nav_before.json nav_after.json
+
+#or compare the bucket queue the cost ordered searches use with the binary heap:
+
+#python benchmark_navigation.py --nav_types astar --queue heap --output nav_heap.json
+#python benchmark_navigation.py --nav_types astar --queue bucket --output nav_bucket.json
+
+#every query set is drawn from a random.Random seeded per map, so two runs on the same maps replay
+#exactly the same queries and only the timings (and whatever the change did) differ
+
+
+
+class BenchmarkMap():
+    '''The parts of TheMap that Navigation uses, for a speed array loaded or generated outside a game'''
+    def __init__(self, config, name, tile_speeds):
+        self.config = config
+        self.name = name
+        self.tile_size = config.terrain_tile_size
+        self.tile_speeds = tile_speeds
+        self.middle_tile = tile_speeds.shape[1]//2
+        self.map_version = 0
+        self.component_labels = distance_transform.component_labels(tile_speeds > 0)
+        self.navigation = Navigation(self)
+        #no flags are placed, so only the map's own landmarks
+        self.navigation.add_landmarks(self.navigation.get_map_landmarks(config.navigation_midline_landmarks))
+
+
+    def xy_to_cr(self, x, y):
+        return x // self.config.terrain_tile_size, y // self.config.terrain_tile_size
+
+
+    def tile_to_xy(self, tile_col, tile_row):
+        return tile_col * self.tile_size + self.tile_size // 2, tile_row * self.tile_size + self.tile_size // 2
+
+
+
+class NavigationBenchmark():
+    '''
+    Replays fixed query sets against each search of Navigation on every map and reports, per map, query
+    set and nav type: p50/p99 latency, nodes expanded, path cost and path length.
+    '''
+    query_sets = ['flag_to_flag', 'random_pairs', 'spawn_to_flag']
+
+    def __init__(self, config, nav_types, num_queries=50, repeat=1):
+        '''
+        config - configurable settings, provides the map paths and sizes
+        nav_types - the Navigation.search_methods to compare
+        num_queries - queries per query set
+        repeat - each query is timed this many times and the fastest is kept
+        '''
+        self.config = config
+        self.nav_types = nav_types
+        self.num_queries = num_queries
+        self.repeat = repeat
+
+
+    def load_map(self, speed_array_path):
+        name = os.path.basename(speed_array_path).replace('.npy', '')
+        return BenchmarkMap(self.config, name, np.load(speed_array_path))
+
+
+    def generate_map(self, seed):
+        '''A new map from MapGenerator, the images it writes go to a temporary directory'''
+        tile_cols, tile_rows = self.config.map_tile_cols, self.config.map_tile_rows
+        pixel_dims = (self.config.terrain_tile_size * tile_cols, self.config.terrain_tile_size * tile_rows)
+        with tempfile.TemporaryDirectory() as save_path:
+            tile_speeds, map_path = MapGenerator(self.config, seed=seed).generate_map(pixel_dims, save_path)
+        return BenchmarkMap(self.config, 'generated_seed_%d' % seed, tile_speeds)
+
+
+    def run(self, maps):
+        '''Results for every map, query set and nav type, as a list of dicts'''
+        results = []
+        for the_map in maps:
+            queries = self.get_queries(the_map)
+            for query_set in self.query_sets:
+                for nav_type in self.nav_types:
+                    result = {'map': the_map.name, 'query_set': query_set, 'nav_type': nav_type}
+                    result.update(self.run_queries(the_map, nav_type, queries[query_set]))
+                    results.append(result)
+                    print('%(map)s %(query_set)s %(nav_type)s: p50 %(p50_ms).3fms, p99 %(p99_ms).3fms, '
+                          '%(mean_expansions).0f expansions' % result)
+        return results
+
+
+    def run_queries(self, the_map, nav_type, queries):
+        navigation = the_map.navigation
+        #straight to the search, the path cache would answer repeated queries without searching
+        search = navigation.search_methods[nav_type]
+        #one untimed query first, so one-off setup like the 'hpa' cluster graph isn't counted as a query
+        search(*queries[0])
+
+        seconds, expansions, costs, lengths, entries = [], [], [], [], []
+        for xy1, xy2 in queries:
+            best = float('inf')
+            total_expansions = navigation.expansions
+            for i in range(self.repeat):
+                start_time = time.perf_counter()
+                path = search(xy1, xy2)
+                best = min(best, time.perf_counter() - start_time)
+            seconds.append(best)
+            #every repeat runs the same search, so this is the expansions of one of them
+            expansions.append((navigation.expansions - total_expansions) // self.repeat)
+
+            if path:
+                costs.append(navigation.path_cost(xy1, path))
+                lengths.append(self.get_path_length(the_map, xy1, path))
+                entries.append(len(path))
+
+        milliseconds = np.array(seconds) * 1000
+        return {'queries': len(queries), 'found': len(costs),
+                'p50_ms': float(np.percentile(milliseconds, 50)), 'p99_ms': float(np.percentile(milliseconds, 99)),
+                'mean_ms': float(np.mean(milliseconds)),
+                'mean_expansions': float(np.mean(expansions)), 'max_expansions': int(np.max(expansions)),
+                'mean_cost': float(np.mean(costs)) if costs else None,
+                'mean_length': float(np.mean(lengths)) if lengths else None,
+                'mean_path_entries': float(np.mean(entries)) if entries else None}
+
+
+    def get_path_length(self, the_map, xy1, path):
+        '''Tiles moved along the path, action paths move one tile per entry, waypoints the manhattan distance between them'''
+        if isinstance(path[0], str):
+            return len(path)
+        length = 0
+        tile_col, tile_row = the_map.xy_to_cr(*xy1)
+        for x, y in path:
+            next_col, next_row = the_map.xy_to_cr(x, y)
+            length += abs(next_col - tile_col) + abs(next_row - tile_row)
+            tile_col, tile_row = next_col, next_row
+        return int(length)
+
+
+    def get_queries(self, the_map):
+        '''The (xy1, xy2) queries of each query set, the same every run for the same map'''
+        rng = random.Random(the_map.name)
+        tile_speeds = the_map.tile_speeds
+        rows, cols = np.where(tile_speeds > 0)
+        passable = list(zip(cols.tolist(), rows.tolist()))
+
+        queries = {query_set: [] for query_set in self.query_sets}
+        for i in range(self.num_queries):
+            (col1, row1), (col2, row2) = rng.choice(passable), rng.choice(passable)
+            queries['random_pairs'].append((the_map.tile_to_xy(col1, row1), the_map.tile_to_xy(col2, row2)))
+
+        #flags are placed the way CaptureTheFlag places them, a game's worth of queries per placement
+        while len(queries['flag_to_flag']) < self.num_queries:
+            blue_flag = self.get_flag_tile(tile_speeds, 'blue', rng)
+            red_flag = self.get_flag_tile(tile_speeds, 'red', rng)
+            queries['flag_to_flag'].append((the_map.tile_to_xy(*blue_flag), the_map.tile_to_xy(*red_flag)))
+            queries['flag_to_flag'].append((the_map.tile_to_xy(*red_flag), the_map.tile_to_xy(*blue_flag)))
+
+            for team, flag in [('blue', red_flag), ('red', blue_flag)]:
+                spawn = rng.choice(self.get_spawn_tiles(tile_speeds, team))
+                queries['spawn_to_flag'].append((the_map.tile_to_xy(*spawn), the_map.tile_to_xy(*flag)))
+
+        queries['flag_to_flag'] = queries['flag_to_flag'][:self.num_queries]
+        queries['spawn_to_flag'] = queries['spawn_to_flag'][:self.num_queries]
+        return queries
+
+
+    def get_flag_tile(self, tile_speeds, team, rng):
+        '''(col, row) of a flag: a column a set distance from the border, any open row but the 2 at each end'''
+        pad = 20
+        width = tile_speeds.shape[1] * self.config.terrain_tile_size
+        if team == 'blue':
+            x = self.config.map_border_size + self.config.flag_area_size // 2 + pad
+        else:
+            x = width - self.config.map_border_size - pad - self.config.flag_area_size // 2
+
+        flag_tile_c = x // self.config.terrain_tile_size
+        idx = np.where(tile_speeds[:, flag_tile_c] > 0)[0].tolist()
+        return flag_tile_c, rng.choice(idx[2:-2])
+
+
+    def get_spawn_tiles(self, tile_speeds, team):
+        '''(col, row) of the open tiles in a team's third of the map, where its players start'''
+        side = tile_speeds.shape[1] // 3
+        if team == 'blue':
+            rows, cols = np.where(tile_speeds[:, :side] > 0)
+        else:
+            rows, cols = np.where(tile_speeds[:, (side * 2):] > 0)
+            cols = cols + side * 2
+        return list(zip(cols.tolist(), rows.tolist()))
+
+
+
+if __name__ == '__main__':
+    config = Config()
+
+    parser = argparse.ArgumentParser(description='Benchmark the Navigation searches')
+    parser.add_argument('--nav_types', nargs='+', default=['astar', 'bfs', 'dfs', 'hpa', 'thetastar'])
+    parser.add_argument('--maps', nargs='+', default=['%s/map_speed_840_640.npy' % config.maps_path,
+                                                      '%s/map_speed_900_1200.npy' % config.maps_path],
+                        help='speed arrays (.npy) to load')
+    parser.add_argument('--seeds', nargs='*', type=int, default=[1, 2, 3], help='seeds of maps to generate')
+    parser.add_argument('--queries', type=int, default=50, help='queries per query set')
+    parser.add_argument('--repeat', type=int, default=1, help='times each query is run, the fastest is kept')
+    parser.add_argument('--output', default='navigation_benchmark.json', help='JSON file to write')
+    parser.add_argument('--queue', choices=['bucket', 'heap'], default='bucket',
+                        help="priority queue of the cost ordered searches, see config.navigation_bucket_queue_max_cost")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    config.verbose = args.verbose
+    if args.queue == 'heap':
+        config.navigation_bucket_queue_max_cost = 0
+
+    benchmark = NavigationBenchmark(config, args.nav_types, num_queries=args.queries, repeat=args.repeat)
+    maps = [benchmark.load_map(path) for path in args.maps] + [benchmark.generate_map(seed) for seed in args.seeds]
+
+    report = {'settings': {'nav_types': args.nav_types, 'maps': [the_map.name for the_map in maps],
+                           'queries': args.queries, 'repeat': args.repeat, 'queue': args.queue,
+                           'python': sys.version.split()[0],
+                           'numpy': np.__version__},
+              'results': benchmark.run(maps)}
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    print('results written to', args.output)
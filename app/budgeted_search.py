@@ -0,0 +1,58 @@
+import time
+
+
+
+class BudgetedSearch():
+    '''
+    A path search that can be run a few node expansions at a time, spread over several frames.
+
+    It wraps one of Navigation's step generators, which yield once per node they take off the open
+    list and return the path when they finish, so a search only ever runs for as long as the budget
+    it is given.
+    '''
+    def __init__(self, key, steps=None, path=None):
+        '''
+        key - the Navigation path cache key of the search
+        steps - the search's step generator, not needed if the path is already known
+        path - the finished path, e.g. from the path cache
+        '''
+        self.key = key
+        self.steps = steps
+        self.path = path
+        self.done = path is not None
+        #set when a PathPlanner runs the search on a worker thread instead
+        self.future = None
+
+        #nodes expanded so far, and by the last call to step
+        self.expansions = 0
+        self.last_expansions = 0
+
+
+    def step(self, max_expansions=None, deadline=None):
+        '''
+        Expand up to max_expansions nodes, stopping early once time.perf_counter() passes deadline
+        (None for no limit), returns whether the search has finished
+        '''
+        expansions = 0
+        try:
+            while not self.done:
+                if max_expansions is not None and expansions >= max_expansions:
+                    break
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                next(self.steps)
+                expansions += 1
+        except StopIteration as stop:
+            self.path = stop.value if stop.value is not None else []
+            self.done = True
+            self.steps = None
+
+        self.expansions += expansions
+        self.last_expansions = expansions
+        return self.done
+
+
+    def finish(self):
+        '''Run the search to the end without a budget and return its path'''
+        self.step()
+        return self.path
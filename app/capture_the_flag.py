@@ -56,11 +56,7 @@ class CaptureTheFlag():
         # create user player on blue team
         self.user_player = self.__make_player(allowed_blue_sprite_init_tiles, idx=0, team='blue', agent=False)
         # set info in map
-        player_info = {'xy': (self.user_player.x, self.user_player.y),
-                       'has_flag': False,
-                       'is_incapacitated': False,
-                       'in_enemy_territory': False}
-        self.the_map.agent_info['blue'][self.user_player.player_idx] = player_info
+        self.the_map.agent_info.add('blue', self.user_player.player_idx, (self.user_player.x, self.user_player.y))
 
         # create other blue players
         self.blue_players = [self.user_player]
@@ -68,11 +64,7 @@ class CaptureTheFlag():
             blue_player = self.__make_player(allowed_blue_sprite_init_tiles, idx=i + 1, team='blue')
             self.blue_players.append(blue_player)
             # add player info to global map so others can access it
-            player_info = {'xy': (blue_player.x, blue_player.y),
-                           'has_flag': False,
-                           'is_incapacitated': False,
-                           'in_enemy_territory': False}
-            self.the_map.agent_info['blue'][blue_player.player_idx] = player_info
+            self.the_map.agent_info.add('blue', blue_player.player_idx, (blue_player.x, blue_player.y))
 
         # get red side non-lake non border tile locations
         allowed_red_sprite_init_tiles = self.__get_allowed_sprite_init_tiles('red')
@@ -83,11 +75,7 @@ class CaptureTheFlag():
             red_player = self.__make_player(allowed_red_sprite_init_tiles, idx=i, team='red')
             self.red_players.append(red_player)
             # add player info to global map so others can access it
-            player_info = {'xy': (red_player.x, red_player.y),
-                           'has_flag': False,
-                           'is_incapacitated': False,
-                           'in_enemy_territory': False}
-            self.the_map.agent_info['red'][red_player.player_idx] = player_info
+            self.the_map.agent_info.add('red', red_player.player_idx, (red_player.x, red_player.y))
 
         # all players
         self.players = self.blue_players + self.red_players
@@ -97,6 +85,8 @@ class CaptureTheFlag():
         nextFrame = pyg.clock()
         frame = 0
         pyg.pause(3000)
+        # the game loop is the one calling begin_frame/end_frame, so it owns the background path planner
+        self.the_map.navigation.start_planner(self.config.navigation_planner_threads)
         
         while True:
             # quit?
@@ -113,7 +103,14 @@ class CaptureTheFlag():
                 frame = (frame + 1) % 8
                 nextFrame += 80
 
-                # execute each players action
+            # plan the searches this tick's players will need in one batch, within the frame's search budget,
+            # then execute each players action
+            self.the_map.navigation.begin_frame()
+            path_requests = [player.get_path_request() for player in self.players]
+            path_requests = [request for request in path_requests if request]
+            if path_requests:
+                self.the_map.navigation.plan_many(path_requests)
+
             for player in self.players:
                 player.update(frame)
 
@@ -156,8 +153,15 @@ class CaptureTheFlag():
                 pyg.pause(3000)
                 break
 
+            # searches running in the background get the rest of the frame
+            self.the_map.navigation.end_frame()
             pyg.tick(10)
 
+        self.the_map.navigation.stop_planner()
+            
+        if self.config.verbose:
+            print('path cache: %s' % self.the_map.navigation.path_cache.stats())
+
         pyg.endWait()
 
         
@@ -171,6 +175,7 @@ class CaptureTheFlag():
             # can player do anything?
             if player.is_incapacitated:
                 player.incapacitated_countdown -= 1
+                self.the_map.agent_info[player.team][player.player_idx]['incapacitated_countdown'] = player.incapacitated_countdown
 
                 # is countdown over?
                 if player.incapacitated_countdown <= 0:
@@ -281,6 +286,7 @@ class CaptureTheFlag():
         # player.energy = 0
         player.update_sprite(player.incapacitated_sprite)
         player.incapacitated_countdown = 60
+        self.the_map.agent_info[player.team][player.player_idx]['incapacitated_countdown'] = 60
 
         
     def __tagged_by_team_member(self, player):
@@ -305,6 +311,7 @@ class CaptureTheFlag():
         player.incapacitated_countdown = 0
 
         # update global map
+        self.the_map.agent_info[player.team][player.player_idx]['incapacitated_countdown'] = 0
         if player.team == 'blue':
             self.the_map.agent_info['blue'][player.player_idx]['is_incapacitated'] = False
         else:
@@ -338,6 +345,11 @@ class CaptureTheFlag():
 
         
     def __make_flags(self):
+        # flags and players are kept to the largest area joined to both flag columns, lakes can wall off
+        # others and nothing placed there could ever reach the other side
+        flag_tile_cols = [self.__get_flag_x(self.the_map, team) // self.the_map.tile_size for team in ['blue', 'red']]
+        self.play_component = self.the_map.get_largest_component(flag_tile_cols)
+
         self.blue_flag_x, self.blue_flag_y = self.__get_flag_position(
             self.the_map, 'blue')
         self.red_flag_x, self.red_flag_y = self.__get_flag_position(
@@ -356,22 +368,29 @@ class CaptureTheFlag():
         return blue_flag_sprite, red_flag_sprite
 
     
-    def __get_flag_position(self, the_map, team):
-        # choose an available row along a column a set distance from the border
+    def __get_flag_x(self, the_map, team):
+        # a column a set distance from the border
         pad = 20
 
         if team == 'blue':
-            x = the_map.border_size + self.config.flag_area_size // 2 + pad
+            return the_map.border_size + self.config.flag_area_size // 2 + pad
         else:
-            x = self.config.screen_width - the_map.border_size - pad - self.config.flag_area_size // 2
+            return self.config.screen_width - the_map.border_size - pad - self.config.flag_area_size // 2
+
 
+    def __get_flag_position(self, the_map, team):
+        # choose an available row along a column a set distance from the border
+        x = self.__get_flag_x(the_map, team)
         flag_tile_c = x // the_map.tile_size
 
         col_speeds = the_map.tile_speeds[:, flag_tile_c]
         idx = np.where(col_speeds > 0)[0].tolist()
 
         # trim top and bottow 2 options to avoid map area going off the screen
-        flag_tile_r = random.choice(idx[2:-2])
+        idx = idx[2:-2]
+        # only rows in the play component, unless a lake leaves it none in this column
+        in_component = [r for r in idx if the_map.component_labels[r, flag_tile_c] == self.play_component]
+        flag_tile_r = random.choice(in_component or idx)
         y = flag_tile_r * the_map.tile_size
 
         return x, y
@@ -394,6 +413,10 @@ class CaptureTheFlag():
             idx = (idx[0], idx[1] + np.ones_like(idx[1]) * (side * 2))
 
         allowed_init_tiles = list(zip(idx[0].tolist(), idx[1].tolist()))
+        # never on an island the flags can't be reached from
+        if self.play_component is not None:
+            allowed_init_tiles = [(r, c) for r, c in allowed_init_tiles
+                                  if self.the_map.component_labels[r, c] == self.play_component]
 
         random.shuffle(allowed_init_tiles)
 
@@ -453,12 +476,12 @@ if __name__ == '__main__':
                 
     if len(sys.argv)>1:
         agent_types = ["random", "reflex", "high_level_planning", "reinforcement_learning"]
-        navigation_types = ["direct", "bfs", "dfs", "astar"]
+        navigation_types = ["direct", "bfs", "dfs", "astar", "hpa", "thetastar"]
         items = sys.argv[1:]
         if not len(items)==6:
             print('Expect arguments: ')
-            print('--blue_agent [one of "random", "reflex", "high_level_planning", "reinforcement_learning"] [one of "direct", "bfs", "dfs", "astar"]')
-            print('--red_agent [one of "random", "reflex", "high_level_planning", "reinforcement_learning"] [one of "direct", "bfs", "dfs", "astar"]')
+            print('--blue_agent [one of "random", "reflex", "high_level_planning", "reinforcement_learning"] [one of "direct", "bfs", "dfs", "astar", "hpa", "thetastar"]')
+            print('--red_agent [one of "random", "reflex", "high_level_planning", "reinforcement_learning"] [one of "direct", "bfs", "dfs", "astar", "hpa", "thetastar"]')
             print('Using default agent "reflex" and default navigation "direct"')
             
         if items[0]=='--blue_agent' and items[3]=='--red_agent':
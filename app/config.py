@@ -12,8 +12,12 @@ class Config():
         self.terrain_tile_size = 20
         self.flag_area_size = 100
         
-        self.screen_width = self.terrain_tile_size*40 + self.map_border_size*2
-        self.screen_height = self.terrain_tile_size*30 + self.map_border_size*2
+        #size in tiles of newly generated maps
+        self.map_tile_cols = 40
+        self.map_tile_rows = 30
+        
+        self.screen_width = self.terrain_tile_size*self.map_tile_cols + self.map_border_size*2
+        self.screen_height = self.terrain_tile_size*self.map_tile_rows + self.map_border_size*2
         
         
         #for pygame display
@@ -57,6 +61,12 @@ class Config():
         #a matrix of speeds associated with each terrain tile in the default map
         self.map_default_speed_array = '%s/map_speed_840_640.npy' % self.maps_path
         self.map_terrain_tiles_path = '%s/terrain_tiles' % self.maps_path
+        #generated maps are kept here by seed and settings, and loaded instead of generated again
+        self.map_cache_path = '%s/cache' % self.maps_path
+        #the least recently used maps are removed once the cache is larger than this
+        self.map_cache_max_bytes = 200 * 1024 * 1024
+        #speed arrays of the many maps generated by map_corpus.py for training on, and their index
+        self.map_corpus_path = '%s/corpus' % self.maps_path
         
         
         #sprite paths
@@ -122,6 +132,30 @@ class Config():
         
         #terrain
         self.terrain_speeds = {'lake':0, 'swamp':7, 'plain':10, 'hill':4, 'mountain':2}
+        #generated maps blend neighbouring terrains at this many pre-rendered alpha levels
+        self.terrain_blend_levels = 16
+        
+        #navigation
+        #number of tile to tile paths kept in the map's shared least recently used path cache
+        self.navigation_path_cache_size = 256
+        #width and height in tiles of the clusters used by the 'hpa' (hierarchical A*) nav type
+        self.navigation_cluster_size = 10
+        #search budget shared by all players each frame, a search that runs out carries on in the next frame
+        #(None for no limit on nodes expanded or on seconds spent)
+        self.navigation_frame_expansions = 2000
+        self.navigation_frame_seconds = 0.005
+        #worker threads that search paths in the background while the game loop keeps running, 0 searches
+        #within the frame budget in the game loop instead
+        self.navigation_planner_threads = 2
+        #the 'astar' searches use a bucket queue over integer tile costs when the costs scale to integers
+        #no larger than this (the terrain speeds give 14 to 70), and a binary heap otherwise, 0 always uses the heap
+        self.navigation_bucket_queue_max_cost = 256
+        #the 'astar' heuristic precomputes the cost to go to landmarks at the corners, the flags and this many
+        #points spread along the middle column of the map
+        self.navigation_midline_landmarks = 3
+        #a player following 'thetastar' waypoints searches again once it has come no closer to the next
+        #waypoint for this many ticks, e.g. when it is blocked
+        self.navigation_waypoint_stall_ticks = 10
 
         
         
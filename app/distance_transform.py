@@ -0,0 +1,169 @@
+import heapq
+import numpy as np
+
+
+# Whole-map cost fields computed with NumPy instead of per-node Python loops.
+#
+# cost_to_go relaxes every tile toward the sources with line sweeps: each sweep walks one axis
+# in one direction, and every step of the walk updates a whole row (or column) of every layer
+# at once. A round of the four sweep directions fixes every shortest path with one more turn in
+# it, so winding paths (around lakes, through mazes) can need a round per turn. After
+# sweep_rounds rounds a field that is still changing is finished by a Dijkstra seeded with the
+# sweeps' costs, which bounds the work on any map.
+#
+# component_labels works the same way with labels instead of costs, except that a whole run of
+# passable tiles along a row (or column) takes its smallest label in one step.
+
+#action that moves from a tile to its neighbor, listed as (action, row offset, col offset)
+ACTIONS = [('w', -1, 0), ('s', 1, 0), ('d', 0, 1), ('a', 0, -1)]
+
+
+
+def step_cost_grid(tile_speeds, tile_size):
+    '''Cost of entering each tile: the time to cross it, tile_size / speed, np.inf where the speed is 0'''
+    tile_speeds = np.asarray(tile_speeds, dtype=float)
+    with np.errstate(divide='ignore'):
+        return np.where(tile_speeds > 0, tile_size / tile_speeds, np.inf)
+
+
+def cost_to_go(step_costs, sources, max_rounds=None, sweep_rounds=8):
+    '''
+    Terrain weighted cost from every tile to the nearest of its layer's sources.
+    step_costs - (rows, cols) cost of entering each tile, np.inf where it can't be entered
+    sources - a list of layers, each a list of (col, row) source tiles
+    max_rounds - stop after this many rounds of sweeps even if not converged, the costs are then upper bounds
+    sweep_rounds - rounds of sweeps before the layers that are still changing are finished with Dijkstra
+    returns a (len(sources), rows, cols) array, np.inf where no source can be reached
+    '''
+    step_costs = np.asarray(step_costs, dtype=float)
+    rows, cols = step_costs.shape
+
+    costs = np.full((len(sources), rows, cols), np.inf)
+    for layer, layer_sources in enumerate(sources):
+        for tile_col, tile_row in layer_sources:
+            if 0 <= tile_row < rows and 0 <= tile_col < cols:
+                costs[layer, tile_row, tile_col] = 0
+
+    rounds = 0
+    changed = True
+    while changed and rounds < sweep_rounds and (max_rounds is None or rounds < max_rounds):
+        rounds += 1
+        changed = False
+
+        #down the rows: a tile can step south into the row below it
+        for row in range(rows - 2, -1, -1):
+            changed |= _relax(costs[:, row, :], costs[:, row + 1, :] + step_costs[row + 1, :])
+        #up the rows: step north
+        for row in range(1, rows):
+            changed |= _relax(costs[:, row, :], costs[:, row - 1, :] + step_costs[row - 1, :])
+        #across the columns: step east, then step west
+        for col in range(cols - 2, -1, -1):
+            changed |= _relax(costs[:, :, col], costs[:, :, col + 1] + step_costs[:, col + 1])
+        for col in range(1, cols):
+            changed |= _relax(costs[:, :, col], costs[:, :, col - 1] + step_costs[:, col - 1])
+
+    if changed and (max_rounds is None or rounds < max_rounds):
+        for layer in range(len(sources)):
+            costs[layer] = _finish_dijkstra(costs[layer], step_costs)
+    return costs
+
+
+def direction_grid(costs, step_costs):
+    '''
+    Next-step action for every tile of a cost_to_go layer (or stack of layers): the move into
+    the neighbor with the lowest step cost plus cost to go. '' on source tiles and on tiles that
+    can't reach a source.
+    '''
+    costs = np.asarray(costs, dtype=float)
+    step_costs = np.asarray(step_costs, dtype=float)
+    rows, cols = step_costs.shape
+
+    #through[i] is the cost of leaving each tile with ACTIONS[i]
+    through = np.full((len(ACTIONS),) + costs.shape, np.inf)
+    entered = costs + step_costs
+    for i, (action, row_offset, col_offset) in enumerate(ACTIONS):
+        row_to = slice(max(0, -row_offset), rows - max(0, row_offset))
+        row_from = slice(max(0, row_offset), rows - max(0, -row_offset))
+        col_to = slice(max(0, -col_offset), cols - max(0, col_offset))
+        col_from = slice(max(0, col_offset), cols - max(0, -col_offset))
+        through[i][..., row_to, col_to] = entered[..., row_from, col_from]
+
+    best = np.argmin(through, axis=0)
+    directions = np.array([action for action, _, _ in ACTIONS])[best]
+    directions[(costs == 0) | ~np.isfinite(np.min(through, axis=0))] = ''
+    return directions
+
+
+def component_labels(passable):
+    '''
+    Label of the 4-connected component of passable tiles each tile is in: the smallest flat tile index
+    (row * cols + col) in the component, -1 where the tile isn't passable.
+    passable - (rows, cols) booleans, e.g. tile_speeds > 0
+    '''
+    passable = np.asarray(passable, dtype=bool)
+    rows, cols = passable.shape
+    labels = np.where(passable, np.arange(rows * cols).reshape(rows, cols), rows * cols)
+
+    while True:
+        #along the rows, then down the columns
+        new_labels = _run_minimum(_run_minimum(labels, passable).T, passable.T).T
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    labels[~passable] = -1
+    return labels
+
+
+def _run_minimum(labels, passable):
+    '''labels with every run of passable tiles along a row set to the smallest label in the run'''
+    rows, cols = passable.shape
+    flat_passable = passable.ravel()
+    #a run starts at a passable tile at the start of a row or after one that isn't passable
+    starts = passable.copy()
+    starts[:, 1:] &= ~passable[:, :-1]
+    starts = starts.ravel()[flat_passable]
+
+    values = labels.ravel()[flat_passable]
+    minimums = np.minimum.reduceat(values, np.flatnonzero(starts))
+    result = labels.copy().ravel()
+    result[flat_passable] = minimums[np.cumsum(starts) - 1]
+    return result.reshape(rows, cols)
+
+
+def _finish_dijkstra(costs, step_costs):
+    '''
+    Exact costs from a layer of upper bounds, by Dijkstra from every tile with a finite cost at that cost.
+    Each bound is the cost of a real path to a source, so the smallest bound plus path cost is the shortest.
+    '''
+    rows, cols = costs.shape
+    result = costs.ravel().tolist()
+    leave_costs = step_costs.ravel().tolist()
+    open_list = [(cost, index) for index, cost in enumerate(result) if cost != float('inf')]
+    heapq.heapify(open_list)
+
+    while open_list:
+        cost, index = heapq.heappop(open_list)
+        if cost > result[index]:
+            continue
+        #neighbors reach the sources through this tile by entering it
+        next_cost = cost + leave_costs[index]
+        if next_cost == float('inf'):
+            continue
+        row, col = divmod(index, cols)
+        for neighbor, inside in ((index - cols, row > 0), (index + cols, row < rows - 1),
+                                 (index - 1, col > 0), (index + 1, col < cols - 1)):
+            if inside and next_cost < result[neighbor]:
+                result[neighbor] = next_cost
+                heapq.heappush(open_list, (next_cost, neighbor))
+
+    return np.array(result).reshape(rows, cols)
+
+
+def _relax(target, candidate):
+    '''target = min(target, candidate) in place, returns whether anything got cheaper'''
+    better = candidate < target
+    if better.any():
+        target[better] = candidate[better]
+        return True
+    return False
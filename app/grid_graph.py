@@ -0,0 +1,44 @@
+from array import array
+
+import numpy as np
+
+
+
+class GridGraph():
+    '''
+    The passable moves of a tile map as compressed sparse row (CSR) adjacency over flat tile ids
+    (row * cols + col), built once per map and shared by the searches.
+
+    The moves out of tile i are targets[offsets[i]:offsets[i + 1]], in the order w, s, d, a, and the
+    same slice of actions holds the ASCII code of each move's action. Barricades (speed 0) can't be
+    entered so there are no moves into them.
+    '''
+    def __init__(self, tile_speeds):
+        self.rows, self.cols = tile_speeds.shape
+        self.num_tiles = self.rows * self.cols
+        rows, cols = self.rows, self.cols
+        passable = (np.asarray(tile_speeds) > 0).ravel().tolist()
+
+        offsets = array('l', [0])
+        targets = array('l')
+        actions = bytearray()
+        for index in range(self.num_tiles):
+            tile_col, tile_row = index % cols, index // cols
+            for neighbor, action, on_map in [(index - cols, 'w', tile_row > 0),
+                                             (index + cols, 's', tile_row < rows - 1),
+                                             (index + 1, 'd', tile_col < cols - 1),
+                                             (index - 1, 'a', tile_col > 0)]:
+                if on_map and passable[neighbor]:
+                    targets.append(neighbor)
+                    actions.append(ord(action))
+            offsets.append(len(targets))
+
+        self.offsets = offsets
+        self.targets = targets
+        self.actions = bytes(actions)
+
+
+    def get_moves(self, tile):
+        '''(neighbor tile, action) of every move out of tile'''
+        start, end = self.offsets[tile], self.offsets[tile + 1]
+        return [(self.targets[k], chr(self.actions[k])) for k in range(start, end)]
@@ -0,0 +1,327 @@
+import heapq
+
+import numpy as np
+
+
+
+class HierarchicalNavigation():
+    '''
+    HPA* style planner for large maps.
+
+    The tile grid is split into square clusters. Where two neighboring clusters share an open
+    stretch of border, entrance tiles are placed on both sides of it, and the cost between every
+    pair of entrances of a cluster is precomputed. A query connects its start and goal to the
+    entrances of their own clusters, searches the small abstract graph of entrances, and then
+    refines the result a few abstract segments at a time, each window with a tile search confined
+    to the clusters it crosses, which straightens out the detours through entrance tiles.
+
+    Building the abstract graph and answering a query are both generators that yield once per node
+    they expand, like Navigation's searches, so neither has to finish within one frame.
+    '''
+    #an open stretch of border gets an entrance at each end and every this many tiles in between
+    entrance_spacing = 8
+    #maps of fewer clusters are left to Navigation's A*, the cheaper of the two there: part of A*'s cost
+    #grows with the map's area, the abstract search's only with the length of the path
+    min_clusters = 256
+    #abstract path segments covered by each tile search of the refinement
+    refine_window = 8
+
+    def __init__(self, navigation, cluster_size=10):
+        '''
+        navigation - the map's Navigation, provides the flat tile step costs and neighbors
+        cluster_size - width and height of a cluster in tiles
+        '''
+        self.cluster_size = cluster_size
+        self.rows, self.cols = navigation.rows, navigation.cols
+        #the small integer costs of Navigation's cost ordered searches where the map has them
+        self.step_costs = navigation.queue_step_costs
+        self.neighbors = navigation.neighbors
+        self.min_step_cost = navigation.queue_h_scale
+        self.passable = (navigation.the_map.tile_speeds > 0).ravel().tolist()
+
+        self.cluster_cols = (self.cols + cluster_size - 1) // cluster_size
+        self.num_clusters = self.cluster_cols * ((self.rows + cluster_size - 1) // cluster_size)
+        tile_rows, tile_cols = np.divmod(np.arange(self.rows * self.cols), self.cols)
+        self.cluster_of = ((tile_rows // cluster_size) * self.cluster_cols + tile_cols // cluster_size).tolist()
+
+        #abstract graph: entrance tile -> {entrance tile: cost}, and cluster -> its entrance tiles
+        self.edges = {}
+        self.cluster_entrances = {}
+
+        #the graph is built by whoever calls build_step, a node expansion at a time, see is_built
+        self.build_steps = self.__build_graph_steps()
+
+
+    def build_step(self):
+        '''
+        Expand one more node building the abstract graph, returns whether the graph is complete. Only one
+        thread at a time may call it.
+        '''
+        if self.build_steps is not None:
+            try:
+                next(self.build_steps)
+            except StopIteration:
+                self.build_steps = None
+        return self.build_steps is None
+
+
+    def is_built(self):
+        return self.build_steps is None
+
+
+    def find_path_steps(self, start, goal):
+        '''
+        Generator for the path between flat tile indices start and goal over the built graph, yields once
+        per node expanded and returns (actions from start to goal, [] if there is no path, nodes expanded)
+        '''
+        if start == goal or not self.passable[goal]:
+            return [], 0
+
+        start_cluster, goal_cluster = self.cluster_of[start], self.cluster_of[goal]
+        expansions = 0
+
+        #short queries may never need to leave their cluster
+        if start_cluster == goal_cluster:
+            path, expansions = yield from self.__corridor_path_steps(start, goal, {start_cluster})
+            if path is not None:
+                return path, expansions
+
+        #temporarily connect start and goal to the entrances of their clusters
+        start_edges, start_expansions = yield from self.__cluster_costs_steps(start, start_cluster)
+        goal_edges, goal_expansions = yield from self.__cluster_costs_steps(goal, goal_cluster, reverse=True)
+        start_edges = {tile: cost for tile, cost in start_edges.items()
+                       if tile in self.edges and tile != start}
+        goal_edges = {tile: cost for tile, cost in goal_edges.items() if tile in self.edges}
+
+        abstract_path, abstract_expansions = yield from self.__abstract_search_steps(start, goal, start_edges, goal_edges)
+        expansions += start_expansions + goal_expansions + abstract_expansions
+        if not abstract_path:
+            return [], expansions
+
+        path, refine_expansions = yield from self.__refine_steps(abstract_path)
+        return path, expansions + refine_expansions
+
+
+    def __build_graph_steps(self):
+        '''Place the entrances, one yield per cluster border, then cost every pair of entrances of a cluster'''
+        cs = self.cluster_size
+        rows, cols = self.rows, self.cols
+
+        #borders between horizontally neighboring clusters
+        for col in range(cs, cols, cs):
+            for row0 in range(0, rows, cs):
+                pairs = [(row * cols + col - 1, row * cols + col) for row in range(row0, min(row0 + cs, rows))]
+                self.__add_border_entrances(pairs)
+                yield
+
+        #borders between vertically neighboring clusters
+        for row in range(cs, rows, cs):
+            for col0 in range(0, cols, cs):
+                pairs = [((row - 1) * cols + col, row * cols + col) for col in range(col0, min(col0 + cs, cols))]
+                self.__add_border_entrances(pairs)
+                yield
+
+        for cluster, entrances in self.cluster_entrances.items():
+            for entrance in entrances:
+                costs, expansions = yield from self.__cluster_costs_steps(entrance, cluster)
+                for other in entrances:
+                    if other != entrance and other in costs:
+                        self.__add_edge(entrance, other, costs[other])
+
+
+    def __add_border_entrances(self, pairs):
+        '''pairs - (tile, tile) across a cluster border, in order along the border'''
+        run = []
+        for a, b in pairs + [(None, None)]:
+            if a is not None and self.passable[a] and self.passable[b]:
+                run.append((a, b))
+                continue
+
+            if run:
+                #paths through a border bend toward its entrances, so a long open border gets one at each end
+                #and every entrance_spacing tiles in between, a short one only in its middle
+                spacing = self.entrance_spacing
+                if len(run) > spacing:
+                    last = len(run) - 1
+                    steps = (last + spacing - 1) // spacing
+                    transitions = [run[i * last // steps] for i in range(steps + 1)]
+                else:
+                    transitions = [run[len(run) // 2]]
+
+                for a_tile, b_tile in transitions:
+                    self.__add_edge(a_tile, b_tile, self.step_costs[b_tile])
+                    self.__add_edge(b_tile, a_tile, self.step_costs[a_tile])
+            run = []
+
+
+    def __add_edge(self, tile1, tile2, cost):
+        for tile in (tile1, tile2):
+            if tile not in self.edges:
+                self.edges[tile] = {}
+                self.cluster_entrances.setdefault(self.cluster_of[tile], []).append(tile)
+
+        if cost < self.edges[tile1].get(tile2, float('inf')):
+            self.edges[tile1][tile2] = cost
+
+
+    def __cluster_costs_steps(self, source, cluster, reverse=False):
+        '''
+        Dijkstra inside one cluster, yields once per node expanded, returns (cost from source to each tile,
+        or from each tile to source if reverse, nodes expanded)
+        '''
+        cluster_of, step_costs, neighbors = self.cluster_of, self.step_costs, self.neighbors
+        costs = {source: 0}
+        open_list = [(0, source)]
+        closed = set()
+        expansions = 0
+
+        while open_list:
+            cost, current = heapq.heappop(open_list)
+            if current in closed:
+                continue
+            closed.add(current)
+            expansions += 1
+            yield
+
+            for successor, action in neighbors[current]:
+                if cluster_of[successor] != cluster or successor in closed:
+                    continue
+
+                #entering a tile costs its step cost, so going backwards charges the tile being left
+                new_cost = cost + (step_costs[current] if reverse else step_costs[successor])
+                if new_cost < costs.get(successor, float('inf')):
+                    costs[successor] = new_cost
+                    heapq.heappush(open_list, (new_cost, successor))
+
+        return costs, expansions
+
+
+    def __corridor_path_steps(self, start, goal, clusters):
+        '''
+        A* restricted to a set of clusters, yields once per node expanded, returns (list of actions or None if
+        goal can't be reached inside them, nodes expanded)
+        '''
+        cols, cluster_of, step_costs, neighbors = self.cols, self.cluster_of, self.step_costs, self.neighbors
+        min_step_cost = self.min_step_cost
+        goal_col, goal_row = goal % cols, goal // cols
+
+        g_score = {start: 0}
+        parents = {start: (None, None)}
+        #ties go to the tile closest to goal, which saves expanding every tile of a plain equally
+        open_list = [(0, 0, start)]
+        closed = set()
+        expansions = 0
+
+        while open_list:
+            _, _, current = heapq.heappop(open_list)
+            if current == goal:
+                path = []
+                while parents[current][0] is not None:
+                    current, action = parents[current]
+                    path.append(action)
+                path.reverse()
+                return path, expansions
+
+            if current in closed:
+                continue
+            closed.add(current)
+            expansions += 1
+            yield
+
+            for successor, action in neighbors[current]:
+                if cluster_of[successor] not in clusters or successor in closed:
+                    continue
+
+                cost = g_score[current] + step_costs[successor]
+                if cost < g_score.get(successor, float('inf')):
+                    g_score[successor] = cost
+                    parents[successor] = (current, action)
+                    h = (abs(successor % cols - goal_col) + abs(successor // cols - goal_row)) * min_step_cost
+                    heapq.heappush(open_list, (cost + h, h, successor))
+
+        return None, expansions
+
+
+    def __abstract_search_steps(self, start, goal, start_edges, goal_edges):
+        '''
+        A* over the entrance graph, yields once per node expanded, returns (the list of tiles start,
+        entrances..., goal, nodes expanded)
+        '''
+        cols, min_step_cost = self.cols, self.min_step_cost
+        goal_col, goal_row = goal % cols, goal // cols
+
+        g_score = {start: 0}
+        parents = {start: None}
+        open_list = [(0, start)]
+        closed = set()
+        expansions = 0
+
+        while open_list:
+            _, current = heapq.heappop(open_list)
+            if current == goal:
+                path = [goal]
+                while parents[current] is not None:
+                    current = parents[current]
+                    path.append(current)
+                path.reverse()
+                return path, expansions
+
+            if current in closed:
+                continue
+            closed.add(current)
+            expansions += 1
+            yield
+
+            successors = list(self.edges.get(current, {}).items())
+            if current == start:
+                successors.extend(start_edges.items())
+            if current in goal_edges:
+                successors.append((goal, goal_edges[current]))
+
+            for successor, step_cost in successors:
+                if successor in closed:
+                    continue
+
+                cost = g_score[current] + step_cost
+                if cost < g_score.get(successor, float('inf')):
+                    g_score[successor] = cost
+                    parents[successor] = current
+                    h = (abs(successor % cols - goal_col) + abs(successor // cols - goal_row)) * min_step_cost
+                    heapq.heappush(open_list, (cost + h, successor))
+
+        return [], expansions
+
+
+    def __refine_steps(self, abstract_path):
+        '''
+        Turn the abstract tile sequence into tile moves a window of refine_window segments at a time. Each
+        window is a tile search confined to the clusters it covers and to those of the moves the last one
+        left over, so it always finds a path, and only the first three quarters of its moves are kept before
+        the next window starts from there, so the joins between windows don't have to pass through an entrance.
+        Yields once per node expanded, returns (tile moves, nodes expanded)
+        '''
+        cluster_of, cols = self.cluster_of, self.cols
+        offsets = {'w': -cols, 's': cols, 'a': -1, 'd': 1}
+        path = []
+        expansions = 0
+        last = len(abstract_path) - 1
+        current, end = abstract_path[0], 0
+        left_over_clusters = set()
+        while True:
+            end, previous_end = min(end + self.refine_window, last), end
+            clusters = left_over_clusters | set(cluster_of[tile] for tile in abstract_path[previous_end:end + 1])
+            moves, window_expansions = yield from self.__corridor_path_steps(current, abstract_path[end], clusters)
+            expansions += window_expansions
+            if end == last:
+                path.extend(moves)
+                return path, expansions
+
+            kept = len(moves) * 3 // 4
+            path.extend(moves[:kept])
+            for action in moves[:kept]:
+                current += offsets[action]
+            tile = current
+            left_over_clusters = {cluster_of[tile]}
+            for action in moves[kept:]:
+                tile += offsets[action]
+                left_over_clusters.add(cluster_of[tile])
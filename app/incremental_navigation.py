@@ -0,0 +1,193 @@
+import heapq
+import time
+
+
+
+class DStarLite():
+    '''
+    Incremental planner for chasing a moving target (Koenig & Likhachev's D* Lite).
+
+    The search runs backwards from the target, so g[tile] is the cost to go from a tile to the
+    target. When the pursuer moves, the heuristic offset km absorbs the change instead of
+    restarting. When the target moves, only its old and new tiles change (the old one loses
+    its zero cost, the new one gains it), and the search repairs the costs that depend on them.
+    Moving the root is the expensive repair, so it is only done once the target has drifted far
+    enough to matter. Each pursuer keeps its own planner.
+
+    The search itself runs in update, which can be given a budget; a search that runs out of it is
+    not complete and carries on where it stopped in the next update.
+    '''
+    def __init__(self, navigation, start, goal, max_goal_jump=3, retarget_ratio=4):
+        '''
+        navigation - the map's Navigation, provides the flat tile step costs and neighbors
+        start, goal - flat tile indexes of the pursuer and the target
+        max_goal_jump - a target moving further than this many tiles (e.g. a new target) restarts the search
+        retarget_ratio - the goal follows the target once drift * retarget_ratio reaches the pursuer's distance to it
+        '''
+        self.retarget_ratio = retarget_ratio
+        self.cols = navigation.cols
+        self.step_costs = navigation.step_costs
+        self.neighbors = navigation.neighbors
+        self.min_step_cost = navigation.min_step_cost
+        self.max_goal_jump = max_goal_jump
+        self.num_tiles = navigation.rows * navigation.cols
+
+        #number of tiles processed by the search, summed over every update and by the last update
+        self.expansions = 0
+        self.last_expansions = 0
+        #whether the costs are up to date for the current pursuer and target locations
+        self.complete = False
+
+        self.__reset(start, goal)
+
+
+    def update(self, start, goal, max_expansions=None, deadline=None):
+        '''
+        Move the pursuer and/or the target and repair the search, expanding at most max_expansions
+        tiles and stopping once time.perf_counter() passes deadline (None for no limit)
+        '''
+        if self.__distance(goal, self.target) > self.max_goal_jump:
+            self.__reset(start, goal)
+        elif start != self.start or goal != self.target:
+            self.__move(start, goal)
+
+        self.__compute_shortest_path(max_expansions, deadline)
+
+
+    def get_direction(self):
+        '''The first move of the cheapest path from the pursuer to the target, '' if there is none'''
+        best_cost = float('inf')
+        best_action = ''
+        for successor, action in self.neighbors[self.start]:
+            cost = self.step_costs[successor] + self.g[successor]
+            if cost < best_cost:
+                best_cost = cost
+                best_action = action
+        return best_action
+
+
+    def get_cost(self):
+        return self.g[self.start]
+
+
+    def __move(self, start, goal):
+        self.target = goal
+
+        if start != self.start:
+            self.km += self.__heuristic(self.last_start, start)
+            self.last_start = start
+            self.start = start
+
+        #while the target is far away, the way to where it was is nearly the way to where it is, so the
+        #goal only follows it once it has drifted by a fair part of the remaining distance
+        drift = self.__distance(goal, self.goal)
+        if drift and drift * self.retarget_ratio >= self.__distance(start, goal):
+            old_goal, self.goal = self.goal, goal
+            self.rhs[goal] = 0
+            self.__update_vertex(goal)
+            self.__update_vertex(old_goal)
+
+
+    def __reset(self, start, goal):
+        self.start = start
+        self.last_start = start
+        #goal is the tile the search is rooted at, target is where the target was last seen
+        self.goal = goal
+        self.target = goal
+        self.km = 0
+
+        self.g = [float('inf')] * self.num_tiles
+        self.rhs = [float('inf')] * self.num_tiles
+        self.rhs[goal] = 0
+
+        #lazy-deletion heap, open_keys holds the current key of every queued tile
+        self.open_list = []
+        self.open_keys = {}
+        self.__push(goal, (self.__heuristic(start, goal), 0))
+
+
+    def __compute_shortest_path(self, max_expansions=None, deadline=None):
+        g, rhs, neighbors = self.g, self.rhs, self.neighbors
+        start = self.start
+        expansions = 0
+        self.complete = False
+
+        while True:
+            top = self.__top()
+            if top is None:
+                self.complete = True
+                break
+            top_key, u = top
+            if not (top_key < self.__calculate_key(start) or rhs[start] != g[start]):
+                self.complete = True
+                break
+            if max_expansions is not None and expansions >= max_expansions:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+            expansions += 1
+            new_key = self.__calculate_key(u)
+            if top_key < new_key:
+                self.__push(u, new_key)
+            elif g[u] > rhs[u]:
+                g[u] = rhs[u]
+                self.__remove(u)
+                for predecessor, action in neighbors[u]:
+                    self.__update_vertex(predecessor)
+            else:
+                g[u] = float('inf')
+                self.__update_vertex(u)
+                for predecessor, action in neighbors[u]:
+                    self.__update_vertex(predecessor)
+
+        self.expansions += expansions
+        self.last_expansions = expansions
+
+
+    def __update_vertex(self, u):
+        if u != self.goal:
+            best = float('inf')
+            for successor, action in self.neighbors[u]:
+                cost = self.step_costs[successor] + self.g[successor]
+                if cost < best:
+                    best = cost
+            self.rhs[u] = best
+
+        if self.g[u] != self.rhs[u]:
+            self.__push(u, self.__calculate_key(u))
+        else:
+            self.__remove(u)
+
+
+    def __calculate_key(self, u):
+        m = min(self.g[u], self.rhs[u])
+        return (m + self.__heuristic(self.start, u) + self.km, m)
+
+
+    def __heuristic(self, a, b):
+        return self.__distance(a, b) * self.min_step_cost
+
+
+    def __distance(self, a, b):
+        cols = self.cols
+        return abs(a % cols - b % cols) + abs(a // cols - b // cols)
+
+
+    def __push(self, u, key):
+        self.open_keys[u] = key
+        heapq.heappush(self.open_list, (key, u))
+
+
+    def __remove(self, u):
+        self.open_keys.pop(u, None)
+
+
+    def __top(self):
+        open_list, open_keys = self.open_list, self.open_keys
+        while open_list:
+            key, u = open_list[0]
+            if open_keys.get(u) == key:
+                return key, u
+            heapq.heappop(open_list)
+        return None
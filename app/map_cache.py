@@ -0,0 +1,125 @@
+import os, json, time, hashlib
+import numpy as np
+
+from map_generator import MapGenerator
+
+
+#sample usage of this class:
+
+#config = Config()
+#tile_speeds, map_path = MapCache(config).get_map(seed=7, pixel_dims=(800, 600))
+#the first call generates the map, later ones with the same seed and settings load it from config.map_cache_path
+
+
+
+class MapCache():
+    '''
+    Generated maps on disk, addressed by a hash of everything that decides what MapGenerator makes
+    of them: the seed, pixel dimensions, tile and border sizes, terrain speeds, blend levels and the
+    generator's version.
+
+    A manifest (JSON) records every cached map's files, their sizes and when it was last used. A map
+    is only loaded if its files are there and the sizes match, otherwise it's generated again. Once
+    the cached maps add up to more than max_bytes the least recently used are removed.
+    '''
+    manifest_name = 'manifest.json'
+    
+    def __init__(self, config):
+        '''config provides the cache path and size, and the settings maps are generated with'''
+        self.config = config
+        self.cache_path = config.map_cache_path
+        self.max_bytes = config.map_cache_max_bytes
+        self.manifest_path = '%s/%s' % (self.cache_path, self.manifest_name)
+        
+        
+    def get_map(self, seed, pixel_dims):
+        '''(tile speeds, map image path) of the map MapGenerator(config, seed).generate_map(pixel_dims) makes'''
+        key = self.get_key(seed, pixel_dims)
+        manifest = self.__load_manifest()
+        
+        entry = manifest.get(key)
+        if entry is not None and self.__is_valid(entry):
+            if self.config.verbose:
+                print('Loading cached map', entry['map_file'])
+            tile_speeds = np.load('%s/%s' % (self.cache_path, entry['speed_file']))
+        else:
+            if self.config.verbose:
+                print('Generating map for seed', seed)
+            os.makedirs(self.cache_path, exist_ok=True)
+            name = 'map_%s' % key
+            tile_speeds, map_path = MapGenerator(self.config, seed=seed).generate_map(pixel_dims, self.cache_path, name)
+            entry = {'seed': seed, 'pixel_dims': list(pixel_dims),
+                     'map_file': os.path.basename(map_path), 
+                     'speed_file': '%s.npy' % name.replace('map_', 'map_speed_')}
+            entry['bytes'] = self.__file_bytes(entry)
+            manifest[key] = entry
+            
+        entry['last_used'] = time.time()
+        self.__evict(manifest, keep=key)
+        self.__save_manifest(manifest)
+        return tile_speeds, '%s/%s' % (self.cache_path, entry['map_file'])
+    
+    
+    def get_key(self, seed, pixel_dims):
+        '''Hex digest of the seed, dimensions and every setting that changes the generated map'''
+        settings = {'seed': seed, 'pixel_dims': list(pixel_dims),
+                    'terrain_tile_size': self.config.terrain_tile_size,
+                    'map_border_size': self.config.map_border_size,
+                    'terrain_speeds': self.config.terrain_speeds,
+                    'terrain_blend_levels': self.config.terrain_blend_levels,
+                    'map_terrain_tiles_path': self.config.map_terrain_tiles_path,
+                    'generator_version': MapGenerator.version}
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+    
+    
+    def __is_valid(self, entry):
+        '''Whether both of a manifest entry's files are there, at the sizes they were saved at'''
+        return self.__file_bytes(entry) == entry['bytes']
+    
+    
+    def __file_bytes(self, entry):
+        '''[map image bytes, speed array bytes] of a manifest entry, None for a missing file'''
+        sizes = []
+        for name in [entry['map_file'], entry['speed_file']]:
+            path = '%s/%s' % (self.cache_path, name)
+            sizes.append(os.path.getsize(path) if os.path.exists(path) else None)
+        return sizes
+    
+    
+    def __evict(self, manifest, keep):
+        '''Remove the least recently used maps, except keep, until the cache fits in max_bytes'''
+        total = sum(sum(entry['bytes']) for entry in manifest.values())
+        for key in sorted(manifest, key=lambda key: manifest[key]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            entry = manifest.pop(key)
+            total -= sum(entry['bytes'])
+            for name in [entry['map_file'], entry['speed_file']]:
+                path = '%s/%s' % (self.cache_path, name)
+                if os.path.exists(path):
+                    os.remove(path)
+            if self.config.verbose:
+                print('Removed cached map', entry['map_file'])
+    
+    
+    def __load_manifest(self):
+        '''key -> entry of every cached map, entries whose files are gone are dropped'''
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except ValueError:
+            #a damaged manifest only costs the maps it listed
+            return {}
+        return {key: entry for key, entry in manifest.items() if None not in self.__file_bytes(entry)}
+    
+    
+    def __save_manifest(self, manifest):
+        #written next to it and then swapped in, so a reader never sees a half written manifest
+        temp_path = '%s.%d.tmp' % (self.manifest_path, os.getpid())
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.manifest_path)
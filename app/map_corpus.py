@@ -0,0 +1,156 @@
+import os, io, json, time, argparse, contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from config import Config
+from map_generator import MapGenerator
+from distance_transform import component_labels
+
+
+#sample usage, run from the app directory like the game:
+
+#python map_corpus.py --start 1 --count 10000
+#... later, more seeds, the ones already in the corpus are skipped ...
+#python map_corpus.py --start 1 --count 20000
+
+#then train on them, e.g. VirtualGame(config, speed_array_path=random.choice(MapCorpus(config).get_speed_paths()))
+
+
+
+class MapCorpus():
+    '''
+    A directory of generated maps to train on, by default only their speed arrays, with an index of
+    what's in them.
+
+    Seeds are generated on a pool of worker processes, each map independently, so the corpus builds
+    about as many times faster as there are cores. Every finished map appends a line of JSON to
+    index.jsonl: its seed, file, pixel dims, a histogram of its terrain and how well connected its
+    passable tiles are. A seed already in the index, with the same dims and generator version and its
+    file still there, isn't generated again.
+    '''
+    index_name = 'index.jsonl'
+    
+    def __init__(self, config, corpus_path=None):
+        '''
+        config - provides the settings maps are generated with
+        corpus_path - directory of the corpus, config.map_corpus_path by default
+        '''
+        self.config = config
+        self.corpus_path = corpus_path or config.map_corpus_path
+        self.index_path = '%s/%s' % (self.corpus_path, self.index_name)
+        
+        
+    def build(self, seeds, pixel_dims, processes=None, save_images=False):
+        '''
+        Generate the maps of the seeds not already in the corpus, on processes worker processes (None 
+        for one per core), returns the index entries of the new maps
+        '''
+        os.makedirs(self.corpus_path, exist_ok=True)
+        index = self.get_index()
+        seeds = [seed for seed in seeds if not self.__has_map(index.get(seed), pixel_dims)]
+        if self.config.verbose:
+            print('%d seeds to generate, %d maps already in the corpus' % (len(seeds), len(index)))
+        
+        entries = []
+        start_time = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes) as executor, open(self.index_path, 'a') as f:
+            jobs = [(self.config, self.corpus_path, seed, pixel_dims, save_images) for seed in seeds]
+            #a few maps per task, so the workers aren't kept waiting on the parent
+            for entry in executor.map(generate_corpus_map, jobs, chunksize=8):
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+                f.flush()
+                entries.append(entry)
+                if self.config.verbose and len(entries) % 100 == 0:
+                    print('%d/%d maps, %.1f maps/s' % (len(entries), len(seeds), 
+                                                      len(entries) / (time.perf_counter() - start_time)))
+        return entries
+    
+    
+    def get_index(self):
+        '''seed -> index entry of every map in the corpus, the latest entry of a seed generated more than once'''
+        index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    #a line cut short by an interrupted build is skipped, its seed is generated again
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    index[entry['seed']] = entry
+        return index
+    
+    
+    def get_speed_paths(self):
+        '''Paths of the speed arrays of every map in the corpus, in seed order'''
+        index = self.get_index()
+        return ['%s/%s' % (self.corpus_path, index[seed]['speed_file']) for seed in sorted(index)
+                if os.path.exists('%s/%s' % (self.corpus_path, index[seed]['speed_file']))]
+    
+    
+    def __has_map(self, entry, pixel_dims):
+        return (entry is not None and entry['pixel_dims'] == list(pixel_dims) 
+                and entry['generator_version'] == MapGenerator.version
+                and os.path.exists('%s/%s' % (self.corpus_path, entry['speed_file'])))
+    
+    
+    
+def generate_corpus_map(job):
+    '''
+    Generate one map of a MapCorpus and return its index entry, runs in the worker processes so it's a 
+    module level function they can import
+    job - (config, corpus_path, seed, pixel_dims, save_image)
+    '''
+    config, corpus_path, seed, pixel_dims, save_image = job
+    start_time = time.perf_counter()
+    #MapGenerator prints every file it saves, thousands of lines in a corpus
+    generator = MapGenerator(config, seed=seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tile_speeds, map_path = generator.generate_map(pixel_dims, corpus_path, save_image=save_image)
+    
+    #the border is impassable, only the tiles inside it count
+    inner = np.array(tile_speeds[1:-1, 1:-1])
+    histogram = {terrain: int(np.count_nonzero(inner == speed)) for terrain, speed in config.terrain_speeds.items()}
+    
+    #how much of the map players can get around, and whether the two sides (where the players start and the
+    #flags are) are joined up
+    passable = inner > 0
+    labels = component_labels(passable)
+    sizes = np.bincount(labels[passable])
+    sizes = sizes[sizes > 0]
+    side = passable.shape[1] // 3
+    sides_connected = bool(np.intersect1d(labels[:, :side][passable[:, :side]], 
+                                          labels[:, -side:][passable[:, -side:]]).size)
+    
+    return {'seed': seed, 'pixel_dims': list(pixel_dims), 'generator_version': MapGenerator.version,
+            'speed_file': os.path.basename(generator.get_speed_path(pixel_dims, corpus_path)),
+            'map_file': os.path.basename(map_path) if map_path else None,
+            'tiles': list(inner.shape), 'terrain': histogram,
+            'passable': int(passable.sum()), 'components': int(len(sizes)),
+            'largest_component': float(sizes.max() / passable.sum()) if len(sizes) else 0.0,
+            'sides_connected': sides_connected,
+            'seconds': time.perf_counter() - start_time}
+
+
+
+if __name__ == '__main__':
+    config = Config()
+    
+    parser = argparse.ArgumentParser(description='Generate a corpus of maps to train on')
+    parser.add_argument('--start', type=int, default=1, help='first seed, 0 is not a seed to MapGenerator')
+    parser.add_argument('--count', type=int, default=1000, help='number of seeds from start')
+    parser.add_argument('--cols', type=int, default=config.map_tile_cols, help='map width in tiles')
+    parser.add_argument('--rows', type=int, default=config.map_tile_rows, help='map height in tiles')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, one per core by default')
+    parser.add_argument('--images', action='store_true', help='save the map images too, not only the speeds')
+    parser.add_argument('--output', default=config.map_corpus_path, help='corpus directory')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    config.verbose = args.verbose
+    
+    corpus = MapCorpus(config, args.output)
+    pixel_dims = (args.cols * config.terrain_tile_size, args.rows * config.terrain_tile_size)
+    start_time = time.perf_counter()
+    entries = corpus.build(range(args.start, args.start + args.count), pixel_dims, args.processes, args.images)
+    print('%d new maps in %.1fs, %d in %s' % (len(entries), time.perf_counter() - start_time, 
+                                             len(corpus.get_index()), args.output))
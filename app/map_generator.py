@@ -1,4 +1,4 @@
-import sys, os, random
+import sys, os, struct, tempfile, zlib
 import numpy as np
 from PIL import Image, ImageDraw
 
@@ -9,13 +9,28 @@ from PIL import Image, ImageDraw
 #map_gen = MapGenerator(config)
 #tile_size=20   #tiles are in resources/maps/terrain_tiles, choose an existing size, 20 or 30 fit well
 #tile_cols, tile_rows = 40, 30
-#the_map, map_speeds = map_gen.generate_map(pixel_dims=(tile_size*tile_cols, tile_size*tile_rows), save_path=config.maps_path)
+#map_speeds, map_path = map_gen.generate_map(pixel_dims=(tile_size*tile_cols, tile_size*tile_rows), save_path=config.maps_path)
 
 
 
 class MapGenerator():
     '''Generates a random map composed of terrain tiles and a border, as well as a matrix
-    of the speeds associated with the different terrain tiles.'''
+    of the speeds associated with the different terrain tiles.
+    
+    Maps are made a chunk of tiles at a time: the noise comes from PerlinNoise.generate_block, the image is
+    written a strip of tile rows at a time by PngWriter and the speeds go to a memory mapped file, so very
+    large maps only ever need a few chunks' worth of memory. The maps are the same as if the whole noise
+    square and image were made at once.'''
+    #terrain -> the terrain its tiles blend into, toward the lower threshold
+    terrain_blends = {'plain':'swamp', 'hill':'plain', 'mountain':'hill'}
+    #(tiles path, tile size, blend levels) -> TileAtlas, shared by every MapGenerator
+    tile_atlases = {}
+    #terrain of a tile by how many of the thresholds its noise reaches, 2 to 4 blend and 5 is the unblended mountain
+    terrain_order = ['lake', 'swamp', 'plain', 'hill', 'mountain', 'mountain']
+    #bump whenever the same seed and settings would give a different map, so cached maps are made again
+    version = 2
+    #noise is made in blocks of chunk_tiles x chunk_tiles tiles and the image in strips of about as many tiles
+    chunk_tiles = 128
     
     def __init__(self, config, seed=42):
         '''config provides the necessary paths and map parameters'''
@@ -24,19 +39,30 @@ class MapGenerator():
         self.terrain_tile_size = config.terrain_tile_size
         self.terrain_speeds = config.terrain_speeds
         self.map_border_size = config.map_border_size
+        self.terrain_blend_levels = config.terrain_blend_levels
         
+        self.seed = seed
         self.perlin_noise_generator = PerlinNoise(seed)
         
         
-    def generate_map(self, pixel_dims, save_path):
-        '''Generate a map roughly the size of the provided pixel dimensions, modulus the tile size.'''
+    def generate_map(self, pixel_dims, save_path, name=None, save_image=True):
+        '''
+        Generate a map roughly the size of the provided pixel dimensions, modulus the tile size.
+        The map is saved to save_path as <name>.png and its speed array as <name>.npy with map_ replaced 
+        by map_speed_ (see get_speed_path), name defaults to map_<width>_<height>_seed_<seed>. Returns the 
+        speed array and the map's path, None if save_image is False and only the speeds are made (they're
+        the same either way).
+        '''
         tiles = self.__load_terrain_tiles()
         if not tiles:
-            print('Tiles of size %d not found in %s' % (self.terrain_tile_size, self.terrain_tiles_path))
+            print('Tiles of size %d not found in %s' % (self.terrain_tile_size, self.map_terrain_tiles_path))
             return
         
         borders, corners = self.__load_boarder_tiles()
         
+        #the tile picks and rotations, seeded like the noise so the same seed always gives the same map
+        self.rng = np.random.RandomState(self.seed or None)
+        
         tile_cols = pixel_dims[0]//self.terrain_tile_size
         tile_rows = pixel_dims[1]//self.terrain_tile_size
         
@@ -46,21 +72,21 @@ class MapGenerator():
         #this sized chunk will be used to calculate terrain type to paste
         perlin_avg_over = 5
         
-        #generate perlin noise
-        noise = self.perlin_noise_generator.generate_noise(perlin_dim*perlin_avg_over, 
-                                            num_octaves=4, persistence=0.5, grid_size=(50,50))
-        
-        #create the map and speed matrix
-        the_map, map_speeds = self.__render_map(tiles, borders, corners, tile_rows, tile_cols, perlin_avg_over, noise)
-        
-        map_path = '%s/map_%d_%d.png' % (save_path, 
-                                       tile_cols*self.terrain_tile_size + self.map_border_size*2, 
-                                       tile_rows*self.terrain_tile_size + self.map_border_size*2)
-        print('saving map and map speeds array', map_path)
-        the_map.save(map_path)
-        np.save(map_path.replace('map_', 'map_speed_').replace('.png', ''), map_speeds)
+        name = name or self.get_name(pixel_dims)
+        map_path = '%s/%s.png' % (save_path, name) if save_image else None
+        speed_path = self.get_speed_path(pixel_dims, save_path, name)
+        print('saving map and map speeds array', map_path or speed_path)
         
-        the_map.close()
+        atlas = self.__get_tile_atlas(tiles)
+        with tempfile.TemporaryDirectory() as temp_path:
+            #min, mean and max of every tile's chunk of noise, on disk for maps too large to keep them in memory
+            noise_stats = np.lib.format.open_memmap('%s/noise_stats.npy' % temp_path, mode='w+', dtype=float, 
+                                                    shape=(3, tile_rows, tile_cols))
+            noise_range = self.__get_noise_stats(noise_stats, perlin_dim*perlin_avg_over, perlin_avg_over)
+            
+            #create the map and speed matrix
+            self.__render_map(atlas, borders, corners, noise_stats, noise_range, map_path, speed_path)
+            del noise_stats
         
         for im in tiles.values():
             im.close()
@@ -72,128 +98,180 @@ class MapGenerator():
             im.close()
             im = None
             
-        return map_speeds, map_path
+        return np.load(speed_path), map_path
+    
+    
+    def get_name(self, pixel_dims):
+        '''The name generate_map gives the map of pixel_dims by default, map_<width>_<height>_seed_<seed>'''
+        tile_cols = pixel_dims[0]//self.terrain_tile_size
+        tile_rows = pixel_dims[1]//self.terrain_tile_size
+        return 'map_%d_%d_seed_%d' % (tile_cols*self.terrain_tile_size + self.map_border_size*2, 
+                                      tile_rows*self.terrain_tile_size + self.map_border_size*2, self.seed)
+    
+    
+    def get_speed_path(self, pixel_dims, save_path, name=None):
+        '''Where generate_map saves the speed array of the map of pixel_dims named name (get_name by default)'''
+        name = name or self.get_name(pixel_dims)
+        return '%s/%s.npy' % (save_path, name.replace('map_', 'map_speed_'))
             
         
-    def __render_map(self, tiles, borders, corners, tile_rows, tile_cols, perlin_avg_over, noise):
-        the_map = Image.new('RGB', (tile_cols*self.terrain_tile_size + 2*self.map_border_size, 
-                                    tile_rows*self.terrain_tile_size + 2*self.map_border_size))
+    def __get_tile_atlas(self, tiles):
+        '''The TileAtlas of the tiles, rendered on first use and then shared by every map of the same tiles'''
+        key = (self.map_terrain_tiles_path, self.terrain_tile_size, self.terrain_blend_levels)
+        if key not in self.tile_atlases:
+            self.tile_atlases[key] = TileAtlas(tiles, self.terrain_blends, self.terrain_blend_levels)
+        return self.tile_atlases[key]
+    
+    
+    def __get_noise_stats(self, noise_stats, noise_dim, perlin_avg_over):
+        '''
+        Fill noise_stats [min/mean/max, row, col] with the statistics of every tile's perlin_avg_over square of 
+        the noise_dim x noise_dim uint8 noise, a block of tiles at a time, returns the (min, max) of all of it
+        '''
+        _, tile_rows, tile_cols = noise_stats.shape
+        k = perlin_avg_over
+        block = self.chunk_tiles*k
+        noise_args = {'num_octaves': 4, 'persistence': 0.5, 'grid_size': (50,50)}
+        
+        #the noise is scaled to 0 to 255 by the range of the whole square, which takes a pass over all of it
+        low, high = np.inf, -np.inf
+        for y0 in range(0, noise_dim, block):
+            for x0 in range(0, noise_dim, block):
+                noise = self.perlin_noise_generator.generate_block(noise_dim, (y0, min(y0 + block, noise_dim)), 
+                                                                   (x0, min(x0 + block, noise_dim)), **noise_args)
+                low, high = min(low, noise.min()), max(high, noise.max())
+        
+        #a chunk of noise per tile, noise[col chunk, row chunk] like the original per-tile loops, so [row, col] 
+        #is the transpose
+        for j0 in range(0, tile_rows, self.chunk_tiles):
+            for i0 in range(0, tile_cols, self.chunk_tiles):
+                j1, i1 = min(j0 + self.chunk_tiles, tile_rows), min(i0 + self.chunk_tiles, tile_cols)
+                noise = self.perlin_noise_generator.generate_block(noise_dim, (i0*k, i1*k), (j0*k, j1*k), **noise_args)
+                chunks = PerlinNoise.scale(noise, low, high).astype(float)
+                chunks = chunks.reshape(i1 - i0, k, j1 - j0, k).transpose(2, 0, 1, 3)
+                noise_stats[0, j0:j1, i0:i1] = chunks.min(axis=(2, 3))
+                noise_stats[1, j0:j1, i0:i1] = chunks.mean(axis=(2, 3))
+                noise_stats[2, j0:j1, i0:i1] = chunks.max(axis=(2, 3))
+                
+        #scaling keeps the order of the noise, so these are the smallest and largest of the scaled noise
+        return PerlinNoise.scale(np.array([low, high]), low, high)
+    
+    
+    def __render_map(self, atlas, borders, corners, noise_stats, noise_range, map_path, speed_path):
+        size, border = self.terrain_tile_size, self.map_border_size
+        _, tile_rows, tile_cols = noise_stats.shape
+        width, height = tile_cols*size + 2*border, tile_rows*size + 2*border
 
         #add borders
-        self.__add_borders(the_map, borders, corners, tile_rows, tile_cols)
+        top, right, bottom, left = self.__get_borders(borders, corners, tile_rows, tile_cols)
         
-        #store mapping of terrain to associated speeds for this map - include borders (+2)
-        map_speeds = np.zeros((tile_rows+2, tile_cols+2))
+        #store mapping of terrain to associated speeds for this map - include borders (+2), straight to its file
+        map_speeds = np.lib.format.open_memmap(speed_path, mode='w+', dtype=float, shape=(tile_rows+2, tile_cols+2))
         print(map_speeds.shape)
 
         #set thresholds for determining which terrain type to use based on mean perlin sample
-        min_val = noise.min()
-        thr = (noise.max() - min_val)//len(self.terrain_speeds)
-        terr_thresholds = {'lake':(min_val + thr*1),
-                          'swamp':(min_val + thr*2),
-                          'plain':(min_val + thr*3),
-                          'hill':(min_val + thr*4),
-                          'mountain':(min_val + thr*5)}
-        
-        #take a chunk of perlin noise, map terrain type to it, paste it in the image
-        y_off = 0
-        for i in range(tile_cols):
-            x_off = 0
-            for j in range(tile_rows):
-                chunk = noise[y_off:y_off+perlin_avg_over, x_off:x_off+perlin_avg_over]
-                
-                #this makes things a little less smooth
-                r = random.choice([1,2,3])
-                if r==1:
-                    m = chunk.min()
-                if r==2:
-                    m = chunk.mean()
-                if r==3:
-                    m = chunk.max()
-
-                #Lakes should have a clear border, no blending
-                if m < terr_thresholds['lake']:
-                    rot=random.choice([0,90,180,270])
-
-                    the_map.paste(tiles['lake'].rotate(rot), (i*self.terrain_tile_size + self.map_border_size, 
-                                                              j*self.terrain_tile_size + self.map_border_size))
-                    #plus 1 for the borders
-                    map_speeds[j+1,i+1] = self.terrain_speeds['lake']
-                    
-                #swamps
-                elif m < terr_thresholds['swamp']:
-                    rot=random.choice([0,90,180,270])
-
-                    the_map.paste(tiles['swamp'].rotate(rot), (i*self.terrain_tile_size + self.map_border_size, 
-                                                               j*self.terrain_tile_size + self.map_border_size))
-                    map_speeds[j+1,i+1] = self.terrain_speeds['swamp']
-                    
-                #plains - can blend with swamps
-                elif m < terr_thresholds['plain']:
-                    alpha = (m - terr_thresholds['swamp']) / (terr_thresholds['plain'] - terr_thresholds['swamp'])
-                    land = Image.blend(tiles['plain'], tiles['swamp'], alpha=alpha*0.5)
-
-                    rot=random.choice([0,90,180,270])
-
-                    the_map.paste(land.rotate(rot), (i*self.terrain_tile_size + self.map_border_size, 
-                                                     j*self.terrain_tile_size + self.map_border_size))
-                    map_speeds[j+1,i+1] = self.terrain_speeds['plain']
-                    
-                #hills blend with plain
-                elif m < terr_thresholds['hill']:
-                    alpha = (m - terr_thresholds['plain']) / (terr_thresholds['hill'] - terr_thresholds['plain'])
-                    land = Image.blend(tiles['hill'], tiles['plain'], alpha=alpha*0.5)
-
-                    rot=random.choice([0,90,180,270])
-
-                    the_map.paste(land.rotate(rot), (i*self.terrain_tile_size + self.map_border_size, 
-                                                     j*self.terrain_tile_size + self.map_border_size))
-                    map_speeds[j+1,i+1] = self.terrain_speeds['hill']
-                    
-                #mountain blend with hills
-                elif m < terr_thresholds['mountain']:
-                    alpha = (m - terr_thresholds['hill']) / (terr_thresholds['mountain'] - terr_thresholds['hill'])
-                    land = Image.blend(tiles['mountain'], tiles['hill'], alpha=alpha*0.5)
-
-                    rot=random.choice([0,90,180,270])
-
-                    the_map.paste(land.rotate(rot), (i*self.terrain_tile_size + self.map_border_size, 
-                                                     j*self.terrain_tile_size + self.map_border_size))
-                    map_speeds[j+1,i+1] = self.terrain_speeds['mountain']
-                    
-                #unblended mountain
-                else:
-                    rot=random.choice([0,90,180,270])
-                    the_map.paste(tiles['mountain'].rotate(rot), (i*self.terrain_tile_size + self.map_border_size, 
-                                                                  j*self.terrain_tile_size + self.map_border_size))
-                    map_speeds[j+1,i+1] = self.terrain_speeds['mountain']
-                    
-                x_off+=perlin_avg_over
-                
-            y_off+=perlin_avg_over
+        min_val, max_val = noise_range
+        thr = (max_val - min_val)//len(self.terrain_speeds)
+        thresholds = np.array([float(min_val + thr*k) for k in range(1, len(self.terrain_order))])
+        
+        speed_table = np.array([self.terrain_speeds[terrain] for terrain in self.terrain_order])
+        #atlas variant of every (terrain, blend level), the unblended terrains use the same one at every level
+        variant_table = np.zeros((len(self.terrain_order), atlas.blend_levels), dtype=int)
+        for k, terrain in enumerate(self.terrain_order):
+            if k in (2, 3, 4):
+                variant_table[k] = [atlas.variant_ids[(terrain, level)] for level in range(atlas.blend_levels)]
+            else:
+                variant_table[k] = atlas.variant_ids[(terrain, None)]
+        
+        #this makes things a little less smooth, each tile takes the min, mean or max of its chunk at random,
+        #all of the picks are drawn before all of the rotations, so the rotations come from a copy of the
+        #random state moved on past the picks
+        rotation_rng = np.random.RandomState()
+        rotation_rng.set_state(self.rng.get_state())
+        for j in range(tile_rows):
+            rotation_rng.randint(3, size=tile_cols)
+        
+        #map_path is None when only the speeds are wanted
+        png = PngWriter(map_path, width, height) if map_path is not None else None
+        if png is not None:
+            png.write(top)
+            
+        strip_rows = max(1, self.chunk_tiles**2 // tile_cols)
+        for j0 in range(0, tile_rows, strip_rows):
+            j1 = min(j0 + strip_rows, tile_rows)
+            picks = self.rng.randint(3, size=(j1 - j0, tile_cols))
+            rotations = rotation_rng.randint(len(atlas.rotations), size=(j1 - j0, tile_cols))
+            m = np.choose(picks, noise_stats[:, j0:j1])
+            
+            terrains, levels = self.__classify_tiles(m, thresholds, atlas.blend_levels)
+            #plus 1 for the borders
+            map_speeds[j0+1:j1+1, 1:-1] = speed_table[terrains]
+            if png is None:
+                continue
+            variants = variant_table[terrains, levels]
+            
+            #gather a row of tiles at a time from the atlas and lay them side by side,
+            #(tile_cols, size, size, 3) -> (size, tile_cols*size, 3)
+            pixels = np.empty(((j1 - j0)*size, width, 3), dtype='uint8')
+            pixels[:, :border] = left[j0*size:j1*size]
+            pixels[:, width-border:] = right[j0*size:j1*size]
+            for j in range(j1 - j0):
+                row_pixels = atlas.pixels[variants[j], rotations[j]]
+                pixels[j*size:(j+1)*size, border:width-border] = row_pixels.transpose(1, 0, 2, 3).reshape(size, tile_cols*size, 3)
+            png.write(pixels)
+            
+        if png is not None:
+            png.write(bottom)
+            png.close()
+        map_speeds.flush()
+        del map_speeds
+    
     
-        return the_map, map_speeds
+    def __classify_tiles(self, m, thresholds, blend_levels):
+        '''
+        Arrays of the index in terrain_order of the terrain of every tile, from its noise value m, and of its 
+        blend level, 0 for the terrains that don't blend
+        '''
+        #lakes below the first threshold, ..., mountains below the last, unblended mountains above it
+        terrains = np.searchsorted(thresholds, m, side='right')
+        
+        #plains blend with swamps, hills with plains and mountains with hills, by how far they are past 
+        #the terrain's lower threshold
+        blended = (terrains >= 2) & (terrains <= 4)
+        lower = thresholds[np.clip(terrains - 1, 0, 4)]
+        upper = thresholds[np.clip(terrains, 0, 4)]
+        alpha = np.zeros(m.shape)
+        alpha[blended] = (m[blended] - lower[blended]) / (upper[blended] - lower[blended])
+        levels = np.round(np.clip(alpha, 0, 1) * (blend_levels - 1)).astype(int)
+        
+        return terrains, levels
     
     
-    def __add_borders(self, the_map, borders, corners, tile_rows, tile_cols):
-        the_map.paste(random.choice(corners), (0, 0))
-        for i in range(tile_cols):
-            the_map.paste(random.choice(borders), (self.map_border_size + i*self.terrain_tile_size, 0))
+    def __get_borders(self, borders, corners, tile_rows, tile_cols):
+        '''
+        (top, right, bottom, left) pixels of the map's edges, random corner and border tiles turned to face 
+        out of the map, top and bottom run the full width with the corners, right and left the height of the 
+        tiles between them. The border tiles are a terrain tile long so a side's worth are laid end to end.
+        '''
+        #[tile, rotation] -> pixels, the rotations of TileAtlas.rotations
+        borders, corners = self.__rotated_pixels(borders), self.__rotated_pixels(corners)
         
-        the_map.paste(random.choice(corners).rotate(270), (self.map_border_size + tile_cols*self.terrain_tile_size, 0))
-        for i in range(tile_rows):
-            the_map.paste(random.choice(borders).rotate(270), (self.map_border_size + tile_cols*self.terrain_tile_size, 
-                                                              self.map_border_size + i*self.terrain_tile_size))
+        #clockwise from the top left, each turned another 270 degrees
+        top_left, top_right, bottom_right, bottom_left = [corners[self.rng.randint(len(corners)), rotation] 
+                                                          for rotation in [0, 3, 2, 1]]
+        top = np.concatenate(borders[self.rng.randint(len(borders), size=tile_cols), 0], axis=1)
+        right = np.concatenate(borders[self.rng.randint(len(borders), size=tile_rows), 3], axis=0)
+        bottom = np.concatenate(borders[self.rng.randint(len(borders), size=tile_cols), 2], axis=1)
+        left = np.concatenate(borders[self.rng.randint(len(borders), size=tile_rows), 1], axis=0)
         
-        the_map.paste(random.choice(corners).rotate(180), (self.map_border_size + tile_cols*self.terrain_tile_size,
-                                                           self.map_border_size + tile_rows*self.terrain_tile_size))
-        for i in range(tile_cols):
-            the_map.paste(random.choice(borders).rotate(180), (self.map_border_size + i*self.terrain_tile_size, 
-                                                              self.map_border_size + tile_rows*self.terrain_tile_size))
-            
-        the_map.paste(random.choice(corners).rotate(90), (0, self.map_border_size + tile_rows*self.terrain_tile_size))
-        for i in range(tile_rows):
-            the_map.paste(random.choice(borders).rotate(90), (0, self.map_border_size + i*self.terrain_tile_size))
+        return (np.concatenate([top_left, top, top_right], axis=1), right, 
+                np.concatenate([bottom_left, bottom, bottom_right], axis=1), left)
+        
+        
+    def __rotated_pixels(self, images):
+        '''[image, rotation] -> RGB pixels of the images at each of TileAtlas.rotations'''
+        return np.array([[np.asarray(image.convert('RGB').rotate(rotation)) for rotation in TileAtlas.rotations] 
+                         for image in images])
         
     
     def __load_terrain_tiles(self):
@@ -222,6 +300,120 @@ class MapGenerator():
 
     
 
+class TileAtlas():
+    '''
+    Every terrain tile pre-rendered at the 4 rotations a map pastes them at, and every blend of a terrain
+    with the one it blends into at blend_levels alpha levels, so rendering a map only looks tiles up.
+    '''
+    rotations = [0, 90, 180, 270]
+    
+    def __init__(self, tiles, blends, blend_levels=16):
+        '''
+        tiles - terrain -> tile image
+        blends - terrain -> the terrain it blends into
+        blend_levels - alphas from 0 to 1 that blends are rendered at, evenly spaced
+        '''
+        self.blend_levels = blend_levels
+        #(terrain, level or None for the plain tile) -> {rotation: image}
+        self.variants = {}
+        for terrain, tile in tiles.items():
+            self.variants[(terrain, None)] = self.__rotate(tile)
+            
+        for terrain, other in blends.items():
+            if terrain not in tiles or other not in tiles:
+                continue
+            for level in range(blend_levels):
+                #blends go at most half way to the other terrain
+                alpha = level / (blend_levels - 1)
+                self.variants[(terrain, level)] = self.__rotate(Image.blend(tiles[terrain], tiles[other], alpha=alpha*0.5))
+        
+        #the same tiles as one array for maps that gather them with numpy, pixels[variant_ids[key], rotation index]
+        self.variant_ids = {key: k for k, key in enumerate(self.variants)}
+        self.pixels = np.array([[np.asarray(self.variants[key][rotation].convert('RGB')) for rotation in self.rotations] 
+                                for key in self.variants], dtype='uint8')
+                
+                
+    def get_tile(self, terrain, rotation, alpha=None):
+        '''terrain's tile rotated by rotation degrees, blended by the level closest to alpha (0 to 1) if given'''
+        level = None
+        if alpha is not None:
+            level = int(round(min(max(alpha, 0), 1) * (self.blend_levels - 1)))
+        return self.variants[(terrain, level)][rotation]
+    
+    
+    def __rotate(self, tile):
+        return {rotation: tile.rotate(rotation) for rotation in self.rotations}
+    
+    
+    
+class PngWriter():
+    '''
+    Writes an 8 bit RGB png a strip of rows at a time, from the top, so the whole image never has to be in
+    memory. Each row is Up filtered (the difference with the row above) and deflated as it comes.
+    
+    with PngWriter(path, width, height) as png:
+        png.write(rows)   #(rows, width, 3) uint8, until height rows have been written
+    '''
+    def __init__(self, path, width, height, compress_level=6):
+        self.path = path
+        self.width, self.height = width, height
+        self.rows = 0
+        self.previous = np.zeros(width*3, dtype='uint8')
+        self.compressor = zlib.compressobj(compress_level)
+        
+        self.file = open(path, 'wb')
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        #8 bits per channel, colour type 2 (RGB), deflate, adaptive filtering, no interlace
+        self.__write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        
+        
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+        
+        
+    def write(self, pixels):
+        '''pixels - (rows, width, 3) uint8, the next rows of the image'''
+        rows = np.asarray(pixels, dtype='uint8').reshape(len(pixels), self.width*3)
+        if self.rows + len(rows) > self.height:
+            raise ValueError('%s is %d rows high, %d more rows is too many' % (self.path, self.height, len(rows)))
+        
+        #filter type 2 then the row, uint8 differences wrap around like png expects
+        filtered = np.empty((len(rows), self.width*3 + 1), dtype='uint8')
+        filtered[:, 0] = 2
+        filtered[0, 1:] = rows[0] - self.previous
+        filtered[1:, 1:] = rows[1:] - rows[:-1]
+        self.previous = rows[-1].copy()
+        self.rows += len(rows)
+        
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            self.__write_chunk(b'IDAT', data)
+            
+            
+    def close(self):
+        if self.rows != self.height:
+            self.file.close()
+            raise ValueError('%s is %d rows high, only %d were written' % (self.path, self.height, self.rows))
+        self.__write_chunk(b'IDAT', self.compressor.flush())
+        self.__write_chunk(b'IEND', b'')
+        self.file.close()
+        
+        
+    def __write_chunk(self, chunk_type, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+
+
 class PerlinNoise(object):
     '''
     PerlinNoise: An implementation typically involves three steps: defining a grid of random gradient vectors, computing the
@@ -240,49 +432,83 @@ class PerlinNoise(object):
     
     def __init__(self, seed=0):
         self.rand_seed = seed
+        #the gradients of the last noise square, and what they were drawn for, see __get_gradients
+        self.grads = None
+        self.grads_key = None
             
 
-    def generate_noise(self, dim, num_octaves=4, persistence=0.7, d_theta=0.05, grid_size=(100,100), save_image=True):
+    def generate_noise(self, dim, num_octaves=4, persistence=0.7, d_theta=0.05, grid_size=(100,100), save_image=False):
+        '''
+        dim x dim uint8 noise, the same for the same seed. save_image writes it to a png in the working
+        directory as well, to look at while tuning the parameters
+        '''
+        m = self.generate_block(dim, (0, dim), (0, dim), num_octaves, persistence, d_theta, grid_size)
+        m = self.scale(m, m.min(), m.max())
+        
+        if save_image:
+            im = Image.fromarray(m, 'L')
+            path='perlin_oct%d_pers%.1f_grid%dx%d.png' % (num_octaves, persistence, self.grid_size[0], self.grid_size[1])
+            print('saving', path)
+            im.save(path)
+        
+        return m
+    
+    
+    def generate_block(self, dim, y_range, x_range, num_octaves=4, persistence=0.7, d_theta=0.05, grid_size=(100,100)):
+        '''
+        The pixels [y0:y1, x0:x1] of the dim x dim noise, (y0, y1) = y_range and (x0, x1) = x_range, before
+        generate_noise scales it to uint8 (see scale). Blocks can be made in any order and size, they're
+        the same pixels generate_noise makes with the same arguments
+        '''
         self.d_theta = d_theta
         self.grid_size = grid_size
+        self.grads = self.__get_gradients(dim, num_octaves, d_theta, grid_size)
         
-        if self.rand_seed:
-            np.random.seed(self.rand_seed)
+        #every pixel of the block at once, m[y, x]
+        y, x = np.mgrid[y_range[0]:y_range[1], x_range[0]:x_range[1]]
+        return self.__perlin_octaves(x, y, num_octaves, persistence)
+    
+    
+    @staticmethod
+    def scale(noise, low, high):
+        '''noise from generate_block as uint8, 0 to 255 over low to high, the min and max of the whole square'''
+        return (((noise + abs(low)) * 255)/(high + abs(low))).astype('uint8')
+    
+    
+    def __get_gradients(self, dim, num_octaves, d_theta, grid_size):
+        '''
+        The gradients of the dim x dim grid points the noise is drawn with, drawn a row at a time, though only
+        the rows and columns the octaves reach into are kept (and drawn), the same whatever the block
+        '''
+        key = (dim, num_octaves, d_theta, tuple(grid_size))
+        if key == self.grads_key:
+            return self.grads
         
-        self.grads = np.random.uniform(-1, 1, (dim, dim, 2))
+        rng = np.random.RandomState(self.rand_seed) if self.rand_seed else np.random
+        #grid points up to the one past the last pixel at the highest octave's frequency
+        freq = 2**(num_octaves - 1)
+        grid_rows = min(dim, (dim - 1)*freq//grid_size[0] + 2)
+        grid_cols = min(dim, (dim - 1)*freq//grid_size[1] + 2)
+        grads = np.empty((grid_rows, grid_cols, 2))
+        for i in range(grid_rows):
+            grads[i] = rng.uniform(-1, 1, (dim, 2))[:grid_cols]
         
-        norm = np.sqrt(np.sum(self.grads**2, 2))
+        norm = np.sqrt(np.sum(grads**2, 2))
         
-        self.grads[:,:,0] /= norm
-        self.grads[:,:,1] /= norm
+        grads[:,:,0] /= norm
+        grads[:,:,1] /= norm
         
-        cos_t = np.cos(self.d_theta)
-        sin_t = np.sin(self.d_theta)
+        cos_t = np.cos(d_theta)
+        sin_t = np.sin(d_theta)
         
-        d0 = cos_t*self.grads[:,:,0] - sin_t*self.grads[:,:,1]
-        d1 = sin_t*self.grads[:,:,0] + cos_t*self.grads[:,:,1]
-
-        self.grads[:,:,0] = d0
-        self.grads[:,:,1] = d1
+        d0 = cos_t*grads[:,:,0] - sin_t*grads[:,:,1]
+        d1 = sin_t*grads[:,:,0] + cos_t*grads[:,:,1]
 
-        m=np.zeros((dim, dim))
-        for y in range(dim):
-            for x in range(dim):
-                pt = self.__perlin_octaves(x, y, num_octaves, persistence)
-                m[y, x]=pt
-                
-        m += abs(m.min())
-        m = (m * 255)/m.max()
-        m = m.astype('uint8')
-        
-        if save_image:
-            im = Image.new("L", (dim, dim))
-            im = Image.fromarray(m, 'L')
-            path='perlin_oct%d_pers%.1f_grid%dx%d.png' % (num_octaves, persistence, self.grid_size[0], self.grid_size[1])
-            print('saving', path)
-            im.save(path)
+        grads[:,:,0] = d0
+        grads[:,:,1] = d1
         
-        return m
+        self.grads_key = key
+        return grads
             
         
     def __perlin_octaves(self, x, y, num_octaves, pers):
@@ -299,31 +525,27 @@ class PerlinNoise(object):
 
     
     def __perlin(self, x, y):
+        '''noise of octave pixel coordinates, x and y are integer arrays of the same shape'''
         #id grid this point is in
-        px1=int(x/self.grid_size[0])
+        px1=x//self.grid_size[0]
         px2=px1+1
-        py1=int(y/self.grid_size[1])
+        py1=y//self.grid_size[1]
         py2=py1+1
 
         #range 0-1
         xingrid = (x%self.grid_size[0]) / self.grid_size[0]
         yingrid = (y%self.grid_size[1]) / self.grid_size[1]
 
-        #distance vectors
-        distx1y1 = np.array([xingrid, yingrid])    #0,0
-        distx1y2 = np.array([xingrid, yingrid-1])  #0,1
-        distx2y1 = np.array([xingrid-1, yingrid])  #1,0
-        distx2y2 = np.array([xingrid-1, yingrid-1])#1,1
-
         gradx1y1 = self.grads[px1, py1]
         gradx1y2 = self.grads[px1, py2]
         gradx2y1 = self.grads[px2, py1]
         gradx2y2 = self.grads[px2, py2]
         
-        x1y1dot = np.dot(gradx1y1, distx1y1)
-        x1y2dot = np.dot(gradx1y2, distx1y2)
-        x2y1dot = np.dot(gradx2y1, distx2y1)
-        x2y2dot = np.dot(gradx2y2, distx2y2)
+        #dot products with the distance vectors to the 4 corners
+        x1y1dot = gradx1y1[...,0]*xingrid + gradx1y1[...,1]*yingrid            #0,0
+        x1y2dot = gradx1y2[...,0]*xingrid + gradx1y2[...,1]*(yingrid-1)        #0,1
+        x2y1dot = gradx2y1[...,0]*(xingrid-1) + gradx2y1[...,1]*yingrid        #1,0
+        x2y2dot = gradx2y2[...,0]*(xingrid-1) + gradx2y2[...,1]*(yingrid-1)    #1,1
         
         #smoothed coords rel to grid
         cx=self.smoothstep(xingrid)
@@ -343,4 +565,3 @@ class PerlinNoise(object):
     
     def linear_interp(self, x0, x1, w):
         return x0 + w * (x1 - x0)
-
@@ -1,4 +1,19 @@
-from utils import PriorityQueue, Stack
+import time
+import threading
+from math import gcd
+from functools import reduce
+from array import array
+from collections import deque
+
+import numpy as np
+
+import distance_transform
+from budgeted_search import BudgetedSearch
+from path_planner import PathPlanner
+from utils import IndexedPriorityQueue, BucketQueue, LRUCache
+from grid_graph import GridGraph
+from hierarchical_navigation import HierarchicalNavigation
+from incremental_navigation import DStarLite
 
 
 
@@ -6,165 +21,917 @@ class Navigation():
     '''
     A helper class with navigation methods.
     '''
+    opposite_actions = {'w':'s', 's':'w', 'a':'d', 'd':'a'}
+    
     def __init__(self, the_map):
         self.the_map = the_map
         
+        #searches address tiles by flat row-major index: index = row * cols + col
+        self.rows, self.cols = the_map.tile_speeds.shape
+        #step cost of entering a tile is the time it takes to cross it, tile size / speed (inf for barricades)
+        self.step_cost_grid = distance_transform.step_cost_grid(the_map.tile_speeds, the_map.tile_size)
+        self.step_costs = self.step_cost_grid.ravel().tolist()
+        #no tile can be crossed faster than at the players' max speed, which keeps the heuristics admissible
+        self.min_step_cost = min(the_map.tile_size / the_map.config.player_max_speed, min(self.step_costs))
+        #the same step costs and heuristic scale as small integers, for the bucket queue used by the
+        #cost ordered searches, or the float ones and None if they don't scale to small enough integers
+        self.queue_step_costs, self.queue_h_scale, self.queue_max_cost = self.__integer_step_costs()
+        #the same as arrays over flat tile indexes, with the column and row of every tile, for the heuristic grids
+        self.queue_step_cost_array = np.array(self.queue_step_costs, dtype=float)
+        self.tile_row_array, self.tile_col_array = np.divmod(np.arange(self.rows * self.cols), self.cols)
+        #passable moves of every tile, as flat CSR arrays for bfs and dfs and as (neighbor, action)
+        #lists for the other searches, barricades can't be entered so there are no moves into them
+        self.graph = GridGraph(the_map.tile_speeds)
+        self.neighbors = [self.graph.get_moves(index) for index in range(self.graph.num_tiles)]
+        #TheMap.component_labels by flat tile index, a goal in another component is never searched for
+        self.components = np.asarray(the_map.component_labels).ravel().tolist()
+        
+        #exact costs in queue_step_costs units from every tile to each landmark tile and from each landmark
+        #to every tile, a (landmarks, tiles) array each, which bound the cost between any two tiles for the
+        #A* heuristic, see add_landmarks
+        self.landmark_tiles = []
+        self.landmark_costs = None
+        
+        #nodes expanded by all the searches in total, path_planner workers add to it too so it has a lock,
+        #frame budgets are charged with the count of each search instead (BudgetedSearch.last_expansions)
+        self.expansions = 0
+        self.expansions_lock = threading.Lock()
+        
+        #one Navigation is shared by every player on the map (TheMap.navigation), so identical
+        #tile to tile queries from different players are answered from this cache
+        self.path_cache = LRUCache(the_map.config.navigation_path_cache_size)
+        #what the last plan_many call cost: requests, unique requests, searches run and seconds
+        self.plan_stats = {}
+        self.search_methods = {'astar': self.a_star, 'bfs': self.breadth_first, 'dfs': self.depth_first,
+                               'hpa': self.hierarchical_a_star, 'thetastar': self.theta_star}
+        #the same searches as generators that yield once per node taken off the open list, see start_search
+        self.search_steps = {'astar': self.__a_star_steps, 'bfs': self.__breadth_first_steps,
+                             'dfs': self.__depth_first_steps, 'hpa': self.__hierarchical_a_star_steps,
+                             'thetastar': self.__theta_star_steps}
+        
+        #what is left of the current frame's search budget, unlimited until begin_frame is called
+        self.frame_expansions_left = None
+        self.frame_deadline = None
+        
+        #worker threads that run start_search searches in the background, only for a game loop that
+        #calls begin_frame and end_frame, see start_planner
+        self.path_planner = None
+        
+        #the cluster graph for hierarchical_a_star, set up once it is first used and built a step at a time
+        #by the searches that use it
+        self.hierarchical_navigation = None
+        self.hierarchical_lock = threading.Lock()
+        
+        
+    def get_path(self, xy1, xy2, nav_type):
+        """Cached path between the tiles of xy1 and xy2 using the nav_type search ('astar', 'bfs', 'dfs', 'hpa' or 'thetastar')."""
+        key = self.__path_key(xy1, xy2, nav_type)
+        path = self.path_cache.get(key)
+        if path is None:
+            path = tuple(self.search_methods[nav_type](xy1, xy2))
+            self.path_cache.put(key, path)
+            
+        #callers consume their path, so hand out a copy
+        return list(path)
+    
+    
+    def start_planner(self, workers):
+        """From now on run start_search searches on workers background threads (none if 0), until stop_planner"""
+        if workers and self.path_planner is None:
+            self.path_planner = PathPlanner(self, workers)
+            
+            
+    def stop_planner(self):
+        """Searches already submitted finish in the background, the next ones run in the caller's frames again"""
+        if self.path_planner is not None:
+            self.path_planner.shutdown()
+            self.path_planner = None
+            
+            
+    def begin_frame(self):
+        """
+        Start a new frame's search budget: config.navigation_frame_expansions nodes and at most
+        config.navigation_frame_seconds of searching (None for no limit), shared by every search run
+        through continue_search or plan_many until the next call.
+        """
+        config = self.the_map.config
+        self.frame_expansions_left = config.navigation_frame_expansions
+        self.frame_deadline = None
+        if config.navigation_frame_seconds is not None:
+            self.frame_deadline = time.perf_counter() + config.navigation_frame_seconds
+            
+        #the frame has the interpreter to itself until end_frame
+        if self.path_planner is not None:
+            self.path_planner.pause()
+            
+            
+    def end_frame(self):
+        """The game loop is idle until the next begin_frame, the path_planner workers can search meanwhile"""
+        if self.path_planner is not None:
+            self.path_planner.resume()
+            
+            
+    def start_search(self, xy1, xy2, nav_type):
+        """
+        A BudgetedSearch for get_path(xy1, xy2, nav_type), already finished if the path is cached.
+        With a path_planner the search is submitted to its worker threads straight away.
+        """
+        return self.__start_search(self.__path_key(xy1, xy2, nav_type), self.search_steps[nav_type](xy1, xy2))
+    
+    
+    def continue_search(self, search):
+        """
+        Run a start_search search on within what is left of the frame's budget, or just poll it if a
+        worker thread runs it. Returns a copy of its path once it has finished (and caches it), or
+        None if it needs more frames.
+        """
+        if search.future is not None:
+            if not search.future.done():
+                return None
+            search.path = search.future.result()
+            search.done = True
+            
+        if not search.done:
+            search.step(self.frame_expansions_left, self.frame_deadline)
+            if self.frame_expansions_left is not None:
+                self.frame_expansions_left -= search.last_expansions
+            if search.done:
+                self.path_cache.put(search.key, tuple(search.path))
+                
+        if search.done:
+            return list(search.path)
+        return None
+    
+    
+    def plan_many(self, requests):
+        """
+        Plan all of a tick's (start xy, goal xy, nav_type) requests together. Duplicates are searched
+        once, and 'astar' or 'bfs' requests that share a goal tile share one reverse search from it.
+        Returns the paths in request order and leaves them in the path cache for get_path.
+        
+        After begin_frame only the shared reverse searches are run, a node at a time within what is left of
+        the frame's budget. Other requests, and those of a reverse search the budget runs out on, are left to
+        the players' own budgeted searches and get None.
+        """
+        start_time = time.time()
+        keys = [self.__path_key(xy1, xy2, nav_type) for xy1, xy2, nav_type in requests]
+        paths = {}
+        pending = {}
         
+        for key, request in zip(keys, requests):
+            if key in paths or key in pending:
+                continue
+            path = self.path_cache.get(key)
+            if path is None:
+                pending[key] = request
+            else:
+                paths[key] = path
+                
+        #requests that can share a reverse search, by goal tile
+        goal_groups = {}
+        searches = 0
+        budgeted = self.frame_expansions_left is not None or self.frame_deadline is not None
+        for key, (xy1, xy2, nav_type) in pending.items():
+            if nav_type in ['astar', 'bfs']:
+                goal_groups.setdefault((key[1], nav_type), []).append(key)
+            elif not budgeted:
+                paths[key] = tuple(self.search_methods[nav_type](xy1, xy2))
+                searches += 1
+                
+        for (goal_cell, nav_type), group_keys in goal_groups.items():
+            if budgeted and (len(group_keys) == 1 or not self.__frame_budget_left()):
+                continue
+                
+            searches += 1
+            if len(group_keys) == 1:
+                xy1, xy2, nav_type = pending[group_keys[0]]
+                paths[group_keys[0]] = tuple(self.search_methods[nav_type](xy1, xy2))
+                continue
+                
+            goal = self.__xy_to_index(pending[group_keys[0]][1])
+            starts = {key: self.__xy_to_index(pending[key][0]) for key in group_keys}
+            #starts in another component than the goal have no path, the search would flood their own first
+            reachable = set(start for start in starts.values()
+                            if start is not None and goal is not None and self.__reachable(start, goal))
+            search = BudgetedSearch(None, self.__reverse_search_steps(goal, reachable, weighted=nav_type=='astar'))
+            search.step(self.frame_expansions_left, self.frame_deadline)
+            if self.frame_expansions_left is not None:
+                self.frame_expansions_left -= search.last_expansions
+            if not search.done:
+                continue
+            for key, start in starts.items():
+                paths[key] = search.path.get(start, ())
+                
+        for key in pending:
+            if key in paths:
+                self.path_cache.put(key, paths[key])
+            
+        #the search cost of the whole tick in one place
+        self.plan_stats = {'requests': len(requests), 'unique': len(paths), 'searches': searches,
+                           'seconds': time.time() - start_time}
+        
+        return [list(paths[key]) if key in paths else None for key in keys]
+    
+    
     def a_star(self, xy1, xy2):
         """Search the node that has the lowest combined cost and heuristic first."""
-        tile_col1, tile_row1 = self.the_map.xy_to_cr(xy1[0], xy1[1])
-        tile_col2, tile_row2 = self.the_map.xy_to_cr(xy2[0], xy2[1])
+        return BudgetedSearch(None, self.__a_star_steps(xy1, xy2)).finish()
+    
+    
+    def __a_star_steps(self, xy1, xy2):
+        start = self.__xy_to_index(xy1)
+        goal = self.__xy_to_index(xy2)
+        if start is None or goal is None or start == goal:
+            return []
+        return (yield from self.__cheapest_path_steps(start, [goal]))
+    
+    
+    def nearest_goal(self, xy, goal_xys):
+        """
+        (index in goal_xys, path) of whichever of goal_xys is the cheapest to reach from xy over the terrain,
+        found with one A* search toward all of them, (None, []) if none can be reached.
+        """
+        path = BudgetedSearch(None, self.__nearest_goal_steps(xy, goal_xys)).finish()
+        return self.get_goal_index(xy, goal_xys, path), path
+    
+    
+    def start_nearest_search(self, xy, goal_xys):
+        """
+        A BudgetedSearch for the path of nearest_goal(xy, goal_xys), run like a start_search search, see
+        continue_search. get_goal_index tells which goal its path leads to.
+        """
+        key = (self.the_map.xy_to_cr(xy[0], xy[1]), tuple(self.the_map.xy_to_cr(x, y) for x, y in goal_xys),
+               'nearest', self.the_map.map_version)
+        return self.__start_search(key, self.__nearest_goal_steps(xy, goal_xys))
+    
+    
+    def get_goal_index(self, xy, goal_xys, path):
+        """Index in goal_xys of the tile an action path from xy ends on, None if it isn't one of them"""
+        tile_col, tile_row = self.the_map.xy_to_cr(xy[0], xy[1])
+        offsets = {'w': (0, -1), 's': (0, 1), 'd': (1, 0), 'a': (-1, 0)}
+        for action in path:
+            tile_col, tile_row = tile_col + offsets[action][0], tile_row + offsets[action][1]
+            
+        for i, (x, y) in enumerate(goal_xys):
+            if self.the_map.xy_to_cr(x, y) == (tile_col, tile_row):
+                return i
+        return None
+    
+    
+    def __nearest_goal_steps(self, xy, goal_xys):
+        start = self.__xy_to_index(xy)
+        goals = [goal for goal in (self.__xy_to_index(goal_xy) for goal_xy in goal_xys) if goal is not None]
+        if start is None or not goals or start in goals:
+            return []
+        return (yield from self.__cheapest_path_steps(start, goals))
+    
+    
+    def __cheapest_path_steps(self, start, goals):
+        """A* from start that stops at the first of the goal tiles it takes off the open list, the cheapest to reach"""
+        num_tiles = self.rows * self.cols
+        step_costs = self.queue_step_costs
+        neighbors = self.neighbors
+        landmark_costs = self.landmark_costs
+        goals = [goal for goal in goals if self.__reachable(start, goal)]
+        if not goals:
+            return []
+        if self.step_costs[start] == float('inf'):
+            #a start on a barricade can step off it but not back, the landmark bounds can grow by any amount
+            #across that step and f with them, so it gets only the manhattan distance
+            landmark_costs = None
+        
+        #f = g + h, h never overestimates the cost to the nearest goal so the first goal reached is the cheapest
+        h_score = self.__heuristic_grid(goals, landmark_costs)
+        if h_score[start] == float('inf'):
+            #a landmark the goals can reach can't be reached from start, so neither can the goals
+            return []
+        #nor can any other tile the landmarks rule out, those are closed from the start and never queued
+        closed = bytearray(np.isinf(h_score).tobytes())
+        h_score = self.__queue_priorities(h_score)
+        expansions = 0
         
-        successor_to_parent_map = {}
-        start_state = (tile_col1, tile_row1)
-        #print('x=%d, y=%d to col=%d, row=%d (map row=%d, col= %d)' % (xy1[0], xy1[1], tile_col1, tile_row1, 
-        #                               self.the_map.tile_speeds.shape[0], self.the_map.tile_speeds.shape[1]))
-        successor_to_parent_map[(start_state, None)] = None  # (Successor, Action) -> (Parent, Action)
+        #g-score table and the tile/action each tile was reached from, indexed by tile like closed
+        g_score = [float('inf')] * num_tiles
+        is_goal = bytearray(num_tiles)
+        parents = [-1] * num_tiles
+        parent_actions = [None] * num_tiles
+        for goal in goals:
+            is_goal[goal] = 1
         
-        open_list = PriorityQueue()
-        open_list.update((start_state, None), 0)
-        closed = []
+        g_score[start] = 0
+        #f can grow by at most a step cost plus what h changes by between neighbors, one tile of the
+        #manhattan distance or, for the landmark bounds, a step cost
+        h_span = self.queue_h_scale if landmark_costs is None else max(self.queue_h_scale, self.queue_max_cost or 0)
+        open_list = self.__new_open_list(num_tiles, h_span)
+        open_list.push(start, h_score[start])
         
         while not open_list.isEmpty():
-            current_state, action_to_current_state = open_list.pop()
+            current = open_list.pop()
             
-            if current_state == (tile_col2, tile_row2):
-                return self.__get_action_path((current_state, action_to_current_state), successor_to_parent_map)
+            if is_goal[current]:
+                self.__count_expansions(expansions)
+                return self.__get_action_path(current, parents, parent_actions)
             
-            if current_state not in closed:
-                if current_state == start_state:
-                    current_cost = 0
-                else:
-                    current_cost = len(self.__get_action_path((current_state, action_to_current_state),
-                                                               successor_to_parent_map))
-                    
-                for successor_state, action, step_cost in self.__get_successors(current_state):
-                    cost = current_cost + step_cost + self.__cartesian_distance(current_state, successor_state)
+            closed[current] = 1
+            expansions += 1
+            yield
+            current_cost = g_score[current]
+            
+            for successor, action in neighbors[current]:
+                if closed[successor]:
+                    continue
                     
-                    open_list.update((successor_state, action), cost)
+                cost = current_cost + step_costs[successor]
+                if cost < g_score[successor]:
+                    g_score[successor] = cost
+                    parents[successor] = current
+                    parent_actions[successor] = action
+                    open_list.update(successor, cost + h_score[successor])
                     
-                    if successor_state not in closed:
-                        successor_to_parent_map[(successor_state, action)] = (current_state, action_to_current_state)
-                        
-            closed.append(current_state)
+        self.__count_expansions(expansions)
         return []
 
     
-    def breadth_first(self, xy1, xy2):
-        """Execute a breadth first search"""
-        tile_col1, tile_row1 = self.the_map.xy_to_cr(xy1[0], xy1[1])
-        tile_col2, tile_row2 = self.the_map.xy_to_cr(xy2[0], xy2[1])
+    def theta_star(self, xy1, xy2):
+        """
+        Any-angle A* (Theta*): a tile may take its parent's parent as its own parent when the straight
+        line between them is clear. Returns the (x, y) tile centre waypoints after xy1, the last one
+        being the tile of xy2, instead of one action per tile.
+        """
+        return BudgetedSearch(None, self.__theta_star_steps(xy1, xy2)).finish()
+    
+    
+    def __theta_star_steps(self, xy1, xy2):
+        start = self.__xy_to_index(xy1)
+        goal = self.__xy_to_index(xy2)
+        if start is None or goal is None or start == goal:
+            return []
+        if not self.__reachable(start, goal):
+            return []
         
-        successor_to_parent_map = {}
-        start_state = (tile_col1, tile_row1)
-        successor_to_parent_map[(start_state, None)] = None  # (Successor, Action) -> (Parent, Action)
+        cols = self.cols
+        num_tiles = self.rows * cols
+        step_costs = self.step_costs
+        neighbors = self.neighbors
+        goal_col, goal_row = goal % cols, goal // cols
+        h_scale = self.min_step_cost
+        expansions = 0
         
-        open_list = PriorityQueue()
-        open_list.update((start_state, None), 0)
-        closed = []
+        g_score = [float('inf')] * num_tiles
+        closed = bytearray(num_tiles)
+        parents = [-1] * num_tiles
+        
+        g_score[start] = 0
+        parents[start] = start
+        open_list = IndexedPriorityQueue(num_tiles)
+        open_list.push(start, 0)
         
         while not open_list.isEmpty():
-            current_state, action_to_current_state = open_list.pop()
+            current = open_list.pop()
             
-            if current_state == (tile_col2, tile_row2):
-                return self.__get_action_path((current_state, action_to_current_state), successor_to_parent_map)
+            if current == goal:
+                self.__count_expansions(expansions)
+                return self.__get_waypoint_path(goal, parents)
             
-            if current_state not in closed:
-                for successor_state, action, step_cost in self.__get_successors(current_state):
-                    open_list.update((successor_state, action), 0)
-                    
-                    if successor_state not in closed:
-                        successor_to_parent_map[(successor_state, action)] = (current_state, action_to_current_state)
+            closed[current] = 1
+            expansions += 1
+            yield
+            current_cost = g_score[current]
+            parent = parents[current]
+            
+            for successor, action in neighbors[current]:
+                if closed[successor]:
+                    continue
+                
+                cost = current_cost + step_costs[successor]
+                successor_parent = current
+                #players still move one axis at a time, so a straight line is as long as any staircase
+                #between its ends, it is only taken when it is no slower than going through current
+                if parent != current:
+                    line_cost = self.__line_cost(parent, successor)
+                    if g_score[parent] + line_cost <= cost + 1e-9:
+                        cost = g_score[parent] + line_cost
+                        successor_parent = parent
                         
-            closed.append(current_state)
+                if cost < g_score[successor]:
+                    g_score[successor] = cost
+                    parents[successor] = successor_parent
+                    h = (abs(successor % cols - goal_col) + abs(successor // cols - goal_row)) * h_scale
+                    open_list.update(successor, cost + h)
+                    
+        self.__count_expansions(expansions)
+        return []
+    
+    
+    def hierarchical_a_star(self, xy1, xy2):
+        """
+        Search the cluster entrance graph first, then refine the abstract path a few clusters at a time. Maps
+        of fewer than HierarchicalNavigation.min_clusters clusters get a plain A* search instead.
+        """
+        return BudgetedSearch(None, self.__hierarchical_a_star_steps(xy1, xy2)).finish()
+    
+    
+    def __hierarchical_a_star_steps(self, xy1, xy2):
+        start = self.__xy_to_index(xy1)
+        goal = self.__xy_to_index(xy2)
+        if start is None or goal is None or start == goal:
+            return []
+        if not self.__reachable(start, goal):
+            return []
+        
+        if self.hierarchical_navigation is None:
+            #planner workers can get here at the same time, only one of them sets up the clusters
+            with self.hierarchical_lock:
+                if self.hierarchical_navigation is None:
+                    self.hierarchical_navigation = HierarchicalNavigation(self, self.the_map.config.navigation_cluster_size)
+        hierarchical = self.hierarchical_navigation
+        if hierarchical.num_clusters < hierarchical.min_clusters:
+            return (yield from self.__cheapest_path_steps(start, [goal]))
+        
+        #every search helps build the shared cluster graph until it is complete, the lock is only held
+        #for one node expansion at a time
+        build_expansions = 0
+        while not hierarchical.is_built():
+            with self.hierarchical_lock:
+                hierarchical.build_step()
+            build_expansions += 1
+            yield
+            
+        path, expansions = yield from hierarchical.find_path_steps(start, goal)
+        self.__count_expansions(build_expansions + expansions)
+        return path
+    
+    
+    def add_landmarks(self, tiles):
+        """
+        Precompute the cost from every tile to each of the (col, row) landmark tiles, in one batched distance
+        transform, so A* can bound the cost between any two tiles with the triangle inequality. Landmarks
+        that can't be entered or are already known are skipped.
+        """
+        tiles = [(int(tile_col), int(tile_row)) for tile_col, tile_row in tiles]
+        tiles = [tile for i, tile in enumerate(tiles) if tile not in tiles[:i] and tile not in self.landmark_tiles
+                 and 0 <= tile[1] < self.rows and 0 <= tile[0] < self.cols
+                 and self.step_costs[tile[1] * self.cols + tile[0]] != float('inf')]
+        if not tiles:
+            return
+        
+        step_costs = self.queue_step_cost_array
+        to_landmark = distance_transform.cost_to_go(step_costs.reshape(self.rows, self.cols),
+                                                    [[tile] for tile in tiles]).reshape(len(tiles), -1)
+        #the cost of a path counts the tiles it enters, so going back along it from the landmark to a tile
+        #counts the tile but not the landmark: d(L, n) = d(n, L) + c(n) - c(L)
+        landmarks = np.array([tile_row * self.cols + tile_col for tile_col, tile_row in tiles])
+        from_landmark = to_landmark + step_costs - step_costs[landmarks, None]
+        if self.landmark_costs is not None:
+            to_landmark = np.vstack([self.landmark_costs[0], to_landmark])
+            from_landmark = np.vstack([self.landmark_costs[1], from_landmark])
+        #searches on planner threads read landmark_costs, so it is replaced rather than changed in place
+        self.landmark_tiles = self.landmark_tiles + tiles
+        self.landmark_costs = (to_landmark, from_landmark)
+        
+        
+    def get_map_landmarks(self, midline_landmarks=3):
+        """
+        (col, row) landmarks that surround most queries on a capture the flag map: the passable tiles
+        closest to the 4 corners and to midline_landmarks points spread along the middle column.
+        """
+        tile_rows, tile_cols = np.nonzero(np.asarray(self.the_map.tile_speeds) > 0)
+        if not len(tile_rows):
+            return []
+        
+        points = [(0, 0), (self.cols - 1, 0), (0, self.rows - 1), (self.cols - 1, self.rows - 1)]
+        points += [(self.the_map.middle_tile, self.rows * (i + 1) // (midline_landmarks + 1))
+                   for i in range(midline_landmarks)]
+        landmarks = []
+        for tile_col, tile_row in points:
+            closest = np.argmin(np.abs(tile_cols - tile_col) + np.abs(tile_rows - tile_row))
+            landmarks.append((int(tile_cols[closest]), int(tile_rows[closest])))
+        return landmarks
+    
+    
+    def pursuit_planner(self, xy1, xy2):
+        """
+        An incremental (D* Lite) planner from xy1 to a target at xy2 that can keep moving, None if off the map.
+        Its search runs in update_pursuit.
+        """
+        start = self.__xy_to_index(xy1)
+        goal = self.__xy_to_index(xy2)
+        if start is None or goal is None:
+            return None
+        return DStarLite(self, start, goal)
+    
+    
+    def update_pursuit(self, planner, xy1, xy2):
+        """
+        Repair a pursuit_planner for the pursuer's and target's new locations within the frame's search
+        budget, returns its next action, or '' if there is none or the repair needs more frames.
+        """
+        start = self.__xy_to_index(xy1)
+        goal = self.__xy_to_index(xy2)
+        if start is None or goal is None or not self.__reachable(start, goal):
+            return ''
+        planner.update(start, goal, self.frame_expansions_left, self.frame_deadline)
+        if self.frame_expansions_left is not None:
+            self.frame_expansions_left -= planner.last_expansions
+        if not planner.complete:
+            return ''
+        return planner.get_direction()
+    
+    
+    def flow_field(self, goal_tiles):
+        """Cost-to-go and next-step FlowField over the whole map toward the (col, row) goal tiles."""
+        return self.flow_fields([goal_tiles])[0]
+    
+    
+    def flow_fields(self, goal_tile_sets):
+        """One FlowField per set of (col, row) goal tiles, all computed in a single batched distance transform."""
+        costs = distance_transform.cost_to_go(self.step_cost_grid, goal_tile_sets)
+        directions = distance_transform.direction_grid(costs, self.step_cost_grid)
+        return [FlowField(costs[i].ravel().tolist(), directions[i].ravel().tolist(), self.rows, self.cols)
+                for i in range(len(goal_tile_sets))]
+    
+    
+    def breadth_first(self, xy1, xy2):
+        """Execute a breadth first search"""
+        return BudgetedSearch(None, self.__breadth_first_steps(xy1, xy2)).finish()
+    
+    
+    def __breadth_first_steps(self, xy1, xy2):
+        start, goal = self.__xy_to_index(xy1), self.__xy_to_index(xy2)
+        if start is None or goal is None:
+            return []
+        if not self.__reachable(start, goal):
+            #it would only have found that out after visiting every tile it could reach
+            return []
+        
+        graph = self.graph
+        offsets, targets, actions = graph.offsets, graph.targets, graph.actions
+        #flat arrays over tile ids instead of dicts and lists of tuples, tiles are marked visited
+        #as soon as they are queued so every tile is queued and expanded at most once
+        visited = bytearray(graph.num_tiles)
+        parents = array('l', [-1]) * graph.num_tiles
+        parent_actions = bytearray(graph.num_tiles)
+        
+        open_list = deque([start])
+        visited[start] = 1
+        expansions = 0
+        
+        while open_list:
+            current = open_list.popleft()
+            yield
             
+            if current == goal:
+                self.__count_expansions(expansions)
+                return [chr(action) for action in self.__get_action_path(goal, parents, parent_actions)]
+            
+            expansions += 1
+            for k in range(offsets[current], offsets[current + 1]):
+                successor = targets[k]
+                if not visited[successor]:
+                    visited[successor] = 1
+                    parents[successor] = current
+                    parent_actions[successor] = actions[k]
+                    open_list.append(successor)
+                    
+        self.__count_expansions(expansions)
         return []
     
     
     def depth_first(self, xy1, xy2):
         """Execute a depth first search."""
-        tile_col1, tile_row1 = self.the_map.xy_to_cr(xy1[0], xy1[1])
-        tile_col2, tile_row2 = self.the_map.xy_to_cr(xy2[0], xy2[1])
+        return BudgetedSearch(None, self.__depth_first_steps(xy1, xy2)).finish()
+    
+    
+    def __depth_first_steps(self, xy1, xy2):
+        start, goal = self.__xy_to_index(xy1), self.__xy_to_index(xy2)
+        if start is None or goal is None:
+            return []
+        if not self.__reachable(start, goal):
+            #it would only have found that out after visiting every tile it could reach
+            return []
         
-        successor_to_parent_map = {}
-        start_state = (tile_col1, tile_row1)
-        successor_to_parent_map[(start_state, None)] = None  # (Successor, Action) -> (Parent, Action)
+        graph = self.graph
+        offsets, targets, actions = graph.offsets, graph.targets, graph.actions
+        visited = bytearray(graph.num_tiles)
+        parents = array('l', [-1]) * graph.num_tiles
+        parent_actions = bytearray(graph.num_tiles)
         
-        open_list = Stack()
-        open_list.push((start_state, None))
-        closed = []
+        #a tile can be on the stack more than once, it is expanded from the last time it was pushed
+        open_list = array('l', [start])
+        expansions = 0
         
-        while not open_list.isEmpty():
-            current_state, action_to_current_state = open_list.pop()
+        while open_list:
+            current = open_list.pop()
+            #already visited tiles are popped too, and checking them is as slow as expanding
+            yield
             
-            if current_state == (tile_col2, tile_row2):
-                return self.__get_action_path((current_state, action_to_current_state), successor_to_parent_map)
+            if current == goal:
+                self.__count_expansions(expansions)
+                return [chr(action) for action in self.__get_action_path(goal, parents, parent_actions)]
             
-            if current_state not in closed:
-                for successor_state, action, step_cost in self.__get_successors(current_state):
-                    open_list.push((successor_state, action))
+            if visited[current]:
+                continue
+            visited[current] = 1
+            expansions += 1
+            for k in range(offsets[current], offsets[current + 1]):
+                successor = targets[k]
+                if not visited[successor]:
+                    parents[successor] = current
+                    parent_actions[successor] = actions[k]
+                    open_list.append(successor)
                     
-                    if successor_state not in closed:
-                        successor_to_parent_map[(successor_state, action)] = (current_state, action_to_current_state)
-                        
-            closed.append(current_state)
+        self.__count_expansions(expansions)
         return []
     
 
-    def __get_action_path(self, goal, successor_to_parent_map):
-        path = [goal[1]]
-        parent = successor_to_parent_map[goal]
+    def path_cost(self, xy1, path):
+        """
+        Cost of following path from xy1, where path is a list of actions or theta_star's (x, y) waypoints,
+        inf if it runs into a barricade
+        """
+        offsets = {'w': -self.cols, 's': self.cols, 'd': 1, 'a': -1}
+        current = self.__xy_to_index(xy1)
+        cost = 0
+        for step in path:
+            if step in offsets:
+                current += offsets[step]
+                cost += self.step_costs[current]
+            else:
+                tile = self.__xy_to_index(step)
+                cost += self.__line_cost(current, tile)
+                current = tile
+        return cost
+    
+    
+    def __start_search(self, key, steps):
+        #steps is a generator, nothing is searched unless the path isn't cached
+        path = self.path_cache.get(key)
+        if path is not None:
+            return BudgetedSearch(key, path=path)
+        
+        search = BudgetedSearch(key, steps)
+        if self.path_planner is not None:
+            search.future = self.path_planner.submit_search(search)
+        return search
+    
+    
+    def __frame_budget_left(self):
+        if self.frame_expansions_left is not None and self.frame_expansions_left <= 0:
+            return False
+        return self.frame_deadline is None or time.perf_counter() < self.frame_deadline
+    
+    
+    def __reachable(self, start, goal):
+        """Whether there is any path from tile start to tile goal, from their connected components"""
+        components = self.components
+        if components[goal] < 0:
+            return False
+        if components[start] >= 0:
+            return components[start] == components[goal]
+        #a start on a barricade can still step off it
+        return any(components[successor] == components[goal] for successor, action in self.neighbors[start])
+        
+        
+    def __count_expansions(self, expansions):
+        with self.expansions_lock:
+            self.expansions += expansions
+        
         
-        while parent is not None:
-            if parent[1] is not None:
-                path.insert(0, parent[1])
-            parent = successor_to_parent_map[parent]
+    def __get_action_path(self, goal, parents, parent_actions):
+        path = []
+        current = goal
+        
+        while parents[current] >= 0:
+            path.append(parent_actions[current])
+            current = parents[current]
             
+        path.reverse()
         return path
     
-
-    def __get_successors(self, current_state):
-        successors = []
-        step_cost = 1
-        tile_col, tile_row = current_state
-        
-        # State to the north
-        if tile_row > 0:
-            #in array: row (y) by column (x)
-            step_cost = self.the_map.tile_speeds[tile_row - 1, tile_col]
-            # a barricade in this direction
-            if not step_cost:
-                step_cost = 1e10
+    
+    def __get_waypoint_path(self, goal, parents):
+        tile_size = self.the_map.tile_size
+        path = []
+        current = goal
+        while parents[current] != current:
+            path.append((current % self.cols * tile_size + tile_size // 2, current // self.cols * tile_size + tile_size // 2))
+            current = parents[current]
+        path.reverse()
+        return path
+    
+    
+    def __line_cost(self, tile1, tile2):
+        """
+        Cost of moving along the straight line from tile1 to tile2, one axis at a time: the step costs of
+        the tiles the line passes through, inf if any of them is a barricade. Where the line passes
+        exactly through a corner the slower of the two tiles beside it is counted.
+        """
+        cols, step_costs = self.cols, self.step_costs
+        col, row = tile1 % cols, tile1 // cols
+        delta_col, delta_row = tile2 % cols - col, tile2 // cols - row
+        n_cols, n_rows = abs(delta_col), abs(delta_row)
+        step_col = 1 if delta_col > 0 else -1
+        step_row = 1 if delta_row > 0 else -1
+        
+        cost = 0
+        i_col = i_row = 0
+        while i_col < n_cols or i_row < n_rows:
+            #compare where the line next crosses a column border and a row border, in integers
+            decision = (1 + 2 * i_col) * n_rows - (1 + 2 * i_row) * n_cols
+            if decision == 0:
+                cost += max(step_costs[row * cols + col + step_col], step_costs[(row + step_row) * cols + col])
+                col += step_col
+                row += step_row
+                i_col += 1
+                i_row += 1
+            elif decision < 0:
+                col += step_col
+                i_col += 1
+            else:
+                row += step_row
+                i_row += 1
                 
-            successors.append(((tile_col, tile_row - 1), "w", step_cost))
-            
-        # State to the south
-        if tile_row < self.the_map.tile_speeds.shape[0]-1:
-            step_cost = self.the_map.tile_speeds[tile_row + 1, tile_col]
-            if not step_cost:
-                step_cost = 1e10
+            cost += step_costs[row * cols + col]
+            if cost == float('inf'):
+                break
                 
-            successors.append(((tile_col, tile_row + 1), "s", step_cost))
+        return cost
+    
+    
+    def __reverse_search_steps(self, goal, starts, weighted=True):
+        """
+        Dijkstra (or BFS if not weighted) back from goal until every start tile is reached, yields once
+        per node expanded and returns {start: path}.
+        """
+        if goal is None or self.step_costs[goal] == float('inf') or not starts:
+            return {}
+        
+        cols = self.cols
+        num_tiles = self.rows * cols
+        step_costs = self.queue_step_costs
+        neighbors = self.neighbors
+        opposite_actions = self.opposite_actions
+        
+        #direction of the next step toward goal from every reached tile
+        directions = [None] * num_tiles
+        remaining = set(start for start in starts if start is not None)
+        remaining.discard(goal)
+        expansions = 0
+        
+        if weighted:
+            cost_to_go = [float('inf')] * num_tiles
+            closed = bytearray(num_tiles)
+            cost_to_go[goal] = 0
+            open_list = self.__new_open_list(num_tiles, 0)
+            open_list.push(goal, 0)
             
-        # State to the east
-        if tile_col < self.the_map.tile_speeds.shape[1]-1:
-            step_cost = self.the_map.tile_speeds[tile_row, tile_col + 1]
-            if not step_cost:
-                step_cost = 1e10
+            while remaining and not open_list.isEmpty():
+                current = open_list.pop()
+                yield
+                closed[current] = 1
+                remaining.discard(current)
+                expansions += 1
                 
-            successors.append(((tile_col + 1, tile_row), "d", step_cost))
+                cost = cost_to_go[current] + step_costs[current]
+                for predecessor, action in neighbors[current]:
+                    if not closed[predecessor] and cost < cost_to_go[predecessor]:
+                        cost_to_go[predecessor] = cost
+                        directions[predecessor] = opposite_actions[action]
+                        open_list.update(predecessor, cost)
+        else:
+            visited = bytearray(num_tiles)
+            visited[goal] = 1
+            open_list = deque([goal])
             
-        # State to the west
-        if tile_col > 0:
-            step_cost = self.the_map.tile_speeds[tile_row, tile_col - 1]
-            if not step_cost:
-                step_cost = 1e10
+            while remaining and open_list:
+                current = open_list.popleft()
+                yield
+                remaining.discard(current)
+                expansions += 1
                 
-            successors.append(((tile_col - 1, tile_row), "a", step_cost))
+                for predecessor, action in neighbors[current]:
+                    if not visited[predecessor]:
+                        visited[predecessor] = 1
+                        directions[predecessor] = opposite_actions[action]
+                        open_list.append(predecessor)
+                        
+        self.__count_expansions(expansions)
+        offsets = {'w': -cols, 's': cols, 'd': 1, 'a': -1}
+        paths = {}
+        for start in starts:
+            if start is None or start == goal or directions[start] is None:
+                paths[start] = ()
+                continue
+            path = []
+            current = start
+            while current != goal:
+                action = directions[current]
+                path.append(action)
+                current += offsets[action]
+            paths[start] = tuple(path)
             
-        return successors
+        return paths
     
-
-    def __cartesian_distance(self, current_state, successorState):
-        return (((successorState[0] - current_state[0]) ** 2) + ((successorState[1] - current_state[1]) ** 2)) ** .5
-    
\ No newline at end of file
+    
+    def __integer_step_costs(self):
+        """
+        Step costs and heuristic scale in units of the largest common divisor of the tile crossing times,
+        which are whole numbers when every speed divides their least common multiple: crossing a tile at
+        speed s takes lcm / s units. Ordering paths by these costs is the same as by the step costs.
+        """
+        no_integer_costs = (self.step_costs, self.min_step_cost, None)
+        max_cost = self.the_map.config.navigation_bucket_queue_max_cost
+        speeds = set(self.the_map.tile_speeds[self.the_map.tile_speeds > 0].tolist())
+        speeds.add(self.the_map.config.player_max_speed)
+        if not max_cost or not all(float(speed).is_integer() for speed in speeds):
+            return no_integer_costs
+        
+        speeds = [int(speed) for speed in speeds]
+        lcm = reduce(lambda a, b: a * b // gcd(a, b), speeds)
+        unit = reduce(gcd, [lcm // speed for speed in speeds])
+        if lcm // unit // min(speeds) > max_cost:
+            return no_integer_costs
+        
+        step_costs = [cost if cost == float('inf') else lcm // unit // int(speed)
+                      for cost, speed in zip(self.step_costs, self.the_map.tile_speeds.ravel().tolist())]
+        return step_costs, lcm // unit // max(speeds), lcm // unit // min(speeds)
+    
+    
+    def __heuristic_grid(self, goals, landmark_costs):
+        """
+        Lower bound on the cost from every tile to the nearest of goals, in queue_step_costs units (inf where
+        landmarks prove no goal can be reached): the manhattan distance at max speed, or the landmark bounds
+        where they are larger. With d(n, L) the cost from n to landmark L, the triangle inequality gives both
+        d(n, goal) >= d(n, L) - d(goal, L) and d(n, goal) >= d(L, goal) - d(L, n).
+        The smallest of the goals' bounds is as consistent as each of them.
+        """
+        tile_cols, tile_rows = self.tile_col_array, self.tile_row_array
+        h_score = None
+        for goal in goals:
+            goal_h_score = (np.abs(tile_cols - tile_cols[goal]) + np.abs(tile_rows - tile_rows[goal])) * \
+                           float(self.queue_h_scale)
+            if landmark_costs is not None:
+                to_landmark, from_landmark = landmark_costs
+                #landmarks the goal can't reach bound nothing
+                usable = np.isfinite(to_landmark[:, goal])
+                if not usable.all():
+                    to_landmark, from_landmark = to_landmark[usable], from_landmark[usable]
+                if len(to_landmark):
+                    bounds = np.maximum(to_landmark - to_landmark[:, goal, None], from_landmark[:, goal, None] - from_landmark)
+                    goal_h_score = np.maximum(goal_h_score, bounds.max(axis=0))
+            h_score = goal_h_score if h_score is None else np.minimum(h_score, goal_h_score)
+        return h_score
+    
+    
+    def __queue_priorities(self, values):
+        """
+        Numpy values as a list of what the open list takes, ints for the bucket queue (0 for inf, the searches
+        don't queue those tiles) or floats
+        """
+        if self.queue_max_cost is None:
+            return values.tolist()
+        return np.where(np.isfinite(values), values, 0).astype(int).tolist()
+    
+    
+    def __new_open_list(self, num_tiles, h_scale):
+        """Bucket queue for the integer step costs, if there are any, or binary heap for the float ones"""
+        if self.queue_max_cost is None:
+            return IndexedPriorityQueue(num_tiles)
+        return BucketQueue(num_tiles, self.queue_max_cost + h_scale)
+    
+    
+    def __path_key(self, xy1, xy2, nav_type):
+        return (self.the_map.xy_to_cr(xy1[0], xy1[1]), self.the_map.xy_to_cr(xy2[0], xy2[1]),
+                nav_type, self.the_map.map_version)
+    
+    
+    def __xy_to_index(self, xy):
+        tile_col, tile_row = self.the_map.xy_to_cr(xy[0], xy[1])
+        tile_col, tile_row = int(tile_col), int(tile_row)
+        if not (0 <= tile_row < self.rows and 0 <= tile_col < self.cols):
+            return None
+        return tile_row * self.cols + tile_col
+    
+    
+    
+class FlowField():
+    '''
+    Cost-to-go and next-step direction for every tile toward a fixed set of goal tiles,
+    so any number of agents heading to the same goal share one search.
+    '''
+    def __init__(self, cost_to_go, directions, rows, cols):
+        self.cols = cols
+        #flat row-major lists, a direction is '' on the goal tiles and on tiles that can't reach them
+        self.cost_to_go = cost_to_go
+        self.directions = directions
+        self.shape = (rows, cols)
+        
+        
+    def get_direction(self, tile_col, tile_row):
+        if not (0 <= tile_row < self.shape[0] and 0 <= tile_col < self.cols):
+            return ''
+        return self.directions[tile_row * self.cols + tile_col]
+    
+    
+    def get_cost(self, tile_col, tile_row):
+        return self.cost_to_go[tile_row * self.cols + tile_col]
@@ -0,0 +1,84 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+
+class PathPlanner():
+    '''
+    Runs Navigation searches on a pool of worker threads so the game loop never waits for one.
+
+    submit returns a concurrent.futures.Future of the path, which a player polls with done() on
+    later frames. Identical searches that are already running share one future. Workers run their
+    search in slices of a fraction of a millisecond and sleep(0) in between, which hands the
+    interpreter back to the game loop so rendering and input keep going while they search.
+
+    The game loop can also pause the workers while it works on a frame and resume them while it
+    waits for the next one, so they search in the idle part of every frame instead of competing
+    with it.
+    '''
+    def __init__(self, navigation, workers=2, slice_seconds=0.0005):
+        '''
+        navigation - the map's Navigation, provides the searches and the shared path cache
+        workers - number of worker threads
+        slice_seconds - how long a worker searches before letting the other threads in
+        '''
+        self.navigation = navigation
+        self.slice_seconds = slice_seconds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='path_planner')
+
+        #path cache key -> future of every search still running
+        self.running = {}
+        self.lock = threading.Lock()
+
+        #workers only search while this is set
+        self.resumed = threading.Event()
+        self.resumed.set()
+
+
+    def submit(self, xy1, xy2, nav_type):
+        '''Future of the path navigation.get_path(xy1, xy2, nav_type) would return'''
+        return self.submit_search(self.navigation.start_search(xy1, xy2, nav_type))
+
+
+    def submit_search(self, search):
+        '''Future of the path of a Navigation.start_search search, already resolved if the search is done'''
+        if search.done:
+            future = Future()
+            future.set_result(tuple(search.path))
+            return future
+
+        with self.lock:
+            future = self.running.get(search.key)
+            if future is None:
+                future = self.executor.submit(self.__run, search)
+                self.running[search.key] = future
+        return future
+
+
+    def pause(self):
+        '''Workers stop at the end of their current slice until resume is called'''
+        self.resumed.clear()
+
+
+    def resume(self):
+        self.resumed.set()
+
+
+    def shutdown(self):
+        '''Stop the workers once the searches already submitted have finished'''
+        self.resume()
+        self.executor.shutdown(wait=False)
+
+
+    def __run(self, search):
+        try:
+            while not search.step(deadline=time.perf_counter() + self.slice_seconds):
+                time.sleep(0)
+                self.resumed.wait()
+            path = tuple(search.path)
+            self.navigation.path_cache.put(search.key, path)
+            return path
+        finally:
+            with self.lock:
+                self.running.pop(search.key, None)
@@ -1,9 +1,7 @@
 import random
-import numpy as np
 
 import pygame_utils as pyg
 
-from navigation import Navigation
 from high_level_policy import HighLevelPolicy
 
 
@@ -13,22 +11,48 @@ class Player():
     '''
     Base player functionality and helper methods
     '''
+    # nav types that search the map through the map's Navigation
+    search_nav_types = ['astar', 'bfs', 'dfs', 'hpa', 'thetastar']
+    # search nav types whose paths are (x, y) waypoints to steer toward instead of actions
+    waypoint_nav_types = ['thetastar']
+    
     def __init__(self, x, y, idx, team, nav_type, the_map, config):
         '''
         x,y - the player/agent sprite starting location on the map
         idx - the player index (unique per team)
         team - blue or red
-        nav_type - navigation algorithm: ['direct', 'bfs', 'dfs', 'astar']
+        nav_type - navigation algorithm: ['direct', 'bfs', 'dfs', 'astar', 'hpa', 'thetastar']
         the_map - a reference to the global map with speeds, flag locations, player locations
         config - configurable settings
         '''
         self.config = config
         self.nav_type = nav_type
-        self.navigation = Navigation(the_map)
+        self.navigation = the_map.navigation
         
         # list of actions for current goal
         self.goal_actions = []
         
+        # incremental planner kept between frames while chasing a moving target
+        self.pursuit_planner = None
+        
+        # search still running over the next frames, and the goal tile it is for
+        self.search = None
+        self.search_goal_tile = None
+        
+        # remaining waypoints (last one first) to the goal tile they were searched for
+        self.waypoints = []
+        self.waypoint_goal_tile = None
+        # where the player set off toward the next waypoint from, how far from it the player was last tick
+        # and for how many ticks that hasn't gone down, to tell when it has left its waypoints behind
+        self.waypoint_from = None
+        self.waypoint_distance = float('inf')
+        self.waypoint_stalled_ticks = 0
+        # the waypoints are searched again because the player strayed from them, see is_off_waypoints
+        self.waypoint_rejoin = False
+        
+        # searches for the cheapest to reach of several targets, by what they are for, see get_nearest_by_cost
+        self.nearest_searches = {}
+        
         
         # needed for preventing sprite from overlapping a 0 speed location
         self.half_size = config.terrain_tile_size // 2
@@ -108,6 +132,7 @@ class Player():
 
             self.in_enemy_territory = self.the_map.in_enemy_territory(self.team, tile_col)
             self.in_flag_area = self.the_map.in_flag_area(self.team, tile_col, tile_row)
+            self.the_map.agent_info[self.team][self.player_idx]['in_enemy_territory'] = self.in_enemy_territory
 
             if speed:
                 self.blocked_countdown = 0
@@ -147,9 +172,35 @@ class Player():
         pyg.showSprite(self.sprite)
         
         
+    def get_path_request(self):
+        '''
+        The (start xy, goal xy, nav_type) search this player's next update will run, if known,
+        so the game loop can plan every player's searches for a tick in one batch
+        '''
+        return None
+    
+    
+    def get_path_request_to_xy(self, xy):
+        '''The search get_direction_to_xy(xy) would run, None if it wouldn't search'''
+        if self.nav_type in self.waypoint_nav_types:
+            if self.the_map.xy_to_cr(*xy)==self.waypoint_goal_tile:
+                return None
+        elif self.nav_type not in self.search_nav_types or self.is_close_to_xy(xy):
+            return None
+        return ((self.x, self.y), xy, self.nav_type)
+    
+    
+    def is_close_to_xy(self, xy):
+        return max(abs(xy[0] - self.x), abs(xy[1] - self.y)) <= (self.the_map.tile_size*3)
+        
+        
     def get_direction_to_xy(self, xy):
+        #waypoints are followed all the way, they already keep clear of barricades close to the goal
+        if self.nav_type in self.waypoint_nav_types:
+            return self.get_waypoint_direction_to_xy(xy)
+            
         #if close, use manhattan always
-        if max(abs(xy[0] - self.x), abs(xy[1] - self.y)) <= (self.the_map.tile_size*3):
+        if self.is_close_to_xy(xy):
             x,y = xy
             delta_x, delta_y = x - self.x, y - self.y
             if abs(delta_x)>abs(delta_y):
@@ -157,16 +208,11 @@ class Player():
             else:
                 return ['w'] if delta_y<0 else ['s']
             
-        if self.nav_type=='astar':
-            path = self.navigation.a_star((self.x, self.y), xy)
-            path = list(reversed(path))
-            return path
-        elif self.nav_type=='bfs':
-            path = self.navigation.breadth_first((self.x, self.y), xy)
-            path = list(reversed(path))
-            return path
-        elif self.nav_type=='dfs':
-            path = self.navigation.depth_first((self.x, self.y), xy)
+        if self.nav_type in self.search_nav_types:
+            path = self.get_path_to_xy(xy)
+            #head straight for xy while the search needs more frames
+            if path is None:
+                return self.get_manhattan_direction_to_xy(xy)
             path = list(reversed(path))
             return path
         else:
@@ -178,6 +224,142 @@ class Player():
                 return ['w'] if delta_y<0 else ['s']
             
             
+    def get_path_to_xy(self, xy):
+        '''
+        The searched path to xy, or None while its search still needs more frames. The search gets
+        what is left of the frame's search budget and carries on next frame if xy stays on its tile
+        '''
+        goal_tile = self.the_map.xy_to_cr(*xy)
+        if self.search is None or self.search.done or goal_tile!=self.search_goal_tile:
+            self.search = self.navigation.start_search((self.x, self.y), xy, self.nav_type)
+            self.search_goal_tile = goal_tile
+        return self.navigation.continue_search(self.search)
+        
+        
+    def get_waypoint_direction_to_xy(self, xy):
+        '''
+        Steer along any-angle waypoints toward xy. They are searched again once xy moves to another tile,
+        or from where the player is once it has left them behind, see is_off_waypoints
+        '''
+        if self.waypoints and self.is_off_waypoints():
+            self.waypoints = []
+            self.waypoint_goal_tile = None
+            self.waypoint_rejoin = True
+            
+        goal_tile = self.the_map.xy_to_cr(*xy)
+        if goal_tile!=self.waypoint_goal_tile:
+            path = self.get_path_to_xy(xy)
+            if path is None:
+                return [self.get_steering_direction_to_xy(xy)]
+            self.waypoints = list(reversed(path))
+            self.waypoint_goal_tile = goal_tile
+            #the search starts from the centre of the player's tile, a player that strayed heads back to it
+            #first, the straight line from anywhere else in the tile to the first waypoint may not be clear
+            if self.waypoint_rejoin:
+                tile_col, tile_row = self.the_map.xy_to_cr(self.x, self.y)
+                tile_size = self.the_map.tile_size
+                self.waypoints.append((tile_col * tile_size + tile_size // 2, tile_row * tile_size + tile_size // 2))
+                self.waypoint_rejoin = False
+            self.waypoint_from = (self.x, self.y)
+            self.waypoint_distance = float('inf')
+            self.waypoint_stalled_ticks = 0
+        
+        #a waypoint is reached once another step toward it would not bring the player any closer
+        while self.waypoints:
+            x, y = self.waypoints[-1]
+            if max(abs(x - self.x), abs(y - self.y)) > self.speed / 2:
+                break
+            self.waypoint_from = self.waypoints.pop()
+            self.waypoint_distance = float('inf')
+            
+        if not self.waypoints:
+            return [self.get_steering_direction_to_xy(xy)]
+        
+        #every step the player takes toward the waypoint brings it closer along one axis
+        x, y = self.waypoints[-1]
+        distance = abs(x - self.x) + abs(y - self.y)
+        if distance < self.waypoint_distance:
+            self.waypoint_stalled_ticks = 0
+        else:
+            self.waypoint_stalled_ticks += 1
+        self.waypoint_distance = distance
+        return [self.get_steering_direction_to_xy(self.waypoints[-1], self.waypoint_from)]
+    
+    
+    def is_off_waypoints(self):
+        '''
+        Whether the player has left its waypoints behind: it is more than a tile and a half from the line
+        between the last waypoint it reached and the next one, e.g. pushed off it, or it has come no closer
+        to the next one for config.navigation_waypoint_stall_ticks ticks, e.g. blocked
+        '''
+        if self.waypoint_stalled_ticks >= self.config.navigation_waypoint_stall_ticks:
+            return True
+        
+        (x1, y1), (x2, y2) = self.waypoint_from, self.waypoints[-1]
+        delta_x, delta_y = x2 - x1, y2 - y1
+        length = delta_x**2 + delta_y**2
+        #the closest point of the line to the player
+        t = 0 if length==0 else min(1, max(0, ((self.x - x1) * delta_x + (self.y - y1) * delta_y) / length))
+        x, y = x1 + t * delta_x, y1 + t * delta_y
+        return (self.x - x)**2 + (self.y - y)**2 > (self.the_map.tile_size * 1.5)**2
+    
+    
+    def get_steering_direction_to_xy(self, xy, from_xy=None):
+        '''
+        Step along the axis with the most distance left, or with from_xy, the one that is furthest behind
+        the straight line from from_xy to xy, so the player stays within a step of it. Along the other axis
+        if that step would run into a barricade
+        '''
+        x,y = xy
+        delta_x, delta_y = x - self.x, y - self.y
+        horizontal = ('a', -self.speed, 0) if delta_x<0 else ('d', self.speed, 0)
+        vertical = ('w', 0, -self.speed) if delta_y<0 else ('s', 0, self.speed)
+        # the share of each axis' distance still left, compared without dividing, ties go by the distance left
+        line_x, line_y = (1, 1) if from_xy is None else (abs(x - from_xy[0]), abs(y - from_xy[1]))
+        if abs(delta_x) * line_y == abs(delta_y) * line_x:
+            line_x, line_y = 1, 1
+        steps = [horizontal, vertical] if abs(delta_x) * line_y > abs(delta_y) * line_x else [vertical, horizontal]
+        
+        for action, step_x, step_y in steps:
+            if (step_x and delta_x) or (step_y and delta_y):
+                tile_col, tile_row = self.the_map.xy_to_cr(self.x + step_x, self.y + step_y)
+                if self.the_map.get_speed(tile_col, tile_row):
+                    return action
+        return steps[0][0]
+            
+            
+    def get_direction_to_flag_target(self, field_name, xy):
+        '''
+        Follow one of the map's shared flow fields instead of searching
+        field_name - 'blue_flag', 'blue_flag_area', 'red_flag' or 'red_flag_area'
+        xy - the flag location, used once the flow field has brought the player there
+        '''
+        if self.nav_type=='direct':
+            return self.get_direction_to_xy(xy)
+        
+        direction = self.the_map.get_flow_direction(field_name, self.x, self.y)
+        if direction:
+            return [direction]
+        return self.get_direction_to_xy(xy)
+            
+            
+    def get_pursuit_direction_to_xy(self, xy):
+        '''Terrain aware direction toward a moving target (e.g. an opponent), repaired each frame instead of re-searched'''
+        if self.nav_type not in self.search_nav_types or self.is_close_to_xy(xy):
+            return self.get_manhattan_direction_to_xy(xy)
+        
+        if self.pursuit_planner is None:
+            self.pursuit_planner = self.navigation.pursuit_planner((self.x, self.y), xy)
+            
+        direction = ''
+        if self.pursuit_planner is not None:
+            direction = self.navigation.update_pursuit(self.pursuit_planner, (self.x, self.y), xy)
+        
+        if direction:
+            return [direction]
+        return self.get_manhattan_direction_to_xy(xy)
+        
+        
     def get_manhattan_direction_to_xy(self, xy):
         x,y = xy
         delta_x, delta_y = x - self.x, y - self.y
@@ -197,60 +379,97 @@ class Player():
         
         
     def go_between(self, xy1, xy2):
+        return self.get_direction_to_xy(self.get_midpoint(xy1, xy2))
+    
+    
+    def get_midpoint(self, xy1, xy2):
         x1,y1 = xy1
         x2,y2 = xy2
-        midx, midy = x1 + ((x2 - x1)/2), y1 + ((y2 - y1)/2)
-        return self.get_direction_to_xy((midx, midy))
+        return x1 + ((x2 - x1)/2), y1 + ((y2 - y1)/2)
 
         
     def get_closest_player_info_by_team(self, team):
-        best_dist=float('inf')
-        best_info = {}
-        
-        for idx, info in self.the_map.agent_info[team].items():
-            if idx==self.player_idx:
-                continue
-                
-            x, y = info['xy']
-            dist = np.sqrt((self.x - x)**2 + (self.y - y)**2)
-            if dist<best_dist:
-                best_info = info
-                
-        return best_info
+        return self.get_closest_player_info_to_xy_by_team((self.x, self.y), team)
     
     
     def get_closest_player_info_to_xy_by_team(self, xy, team):
-        best_dist=float('inf')
-        best_info = {}
-        x1, y1 = xy
-        for idx, info in self.the_map.agent_info[team].items():
-            if idx==self.player_idx:
-                continue
-                
-            x2, y2 = info['xy']
-            dist = np.sqrt((x1 - x2)**2 + (y1 - y2)**2)
-            if dist<best_dist:
-                best_info = info
-                
-        return best_info
+        info = self.the_map.agent_info.get_nearest(xy, team=team, exclude=(self.team, self.player_idx))
+        return info or {}
     
     
     def get_closest_incapacitated_player_info_by_team(self, team):
-        best_dist=float('inf')
+        info = self.the_map.agent_info.get_nearest((self.x, self.y), team=team, exclude=(self.team, self.player_idx),
+                                                   incapacitated_only=True)
+        return info or {}
+    
+    
+    def get_player_infos_by_team(self, team, incapacitated_only=False):
+        '''agent_info of every other player of team'''
+        agent_info = self.the_map.agent_info
+        return agent_info.get_views(agent_info.get_slots(team=team, exclude=(self.team, self.player_idx),
+                                                         incapacitated_only=incapacitated_only))
+    
+    
+    def get_nearest_by_cost(self, purpose, xys, from_xy=None):
+        '''
+        Index in xys of the one that is cheapest to reach from from_xy (this player by default) over the
+        terrain, and the action path to it, from one search toward all of them. Like get_path_to_xy the
+        search can take a few frames, until then, for nav types that don't search, or if none of xys can be
+        reached, the path is None and the index is that of the closest in a straight line.
+        purpose - keeps apart the searches a player runs at the same time, e.g. 'opponent'
+        '''
+        if not xys:
+            return None, None
+        if from_xy is None:
+            from_xy = (self.x, self.y)
+        dists = [(x - from_xy[0])**2 + (y - from_xy[1])**2 for x, y in xys]
+        closest = dists.index(min(dists))
+        if self.nav_type not in self.search_nav_types:
+            return closest, None
+        
+        #searched again once from_xy or any of xys moves to another tile
+        tiles = (self.the_map.xy_to_cr(*from_xy), [self.the_map.xy_to_cr(*xy) for xy in xys])
+        search_tiles, search = self.nearest_searches.get(purpose, (None, None))
+        if search is None or tiles!=search_tiles:
+            search = self.navigation.start_nearest_search(from_xy, xys)
+            self.nearest_searches[purpose] = (tiles, search)
+            
+        path = self.navigation.continue_search(search)
+        if path is None:
+            return closest, None
+        index = self.navigation.get_goal_index(from_xy, xys, path)
+        if index is None:
+            return closest, None
+        return index, path
+    
+    
+    def get_nearest_player_info_by_cost(self, purpose, infos, from_xy=None):
+        '''(agent_info, path) of the player in infos that is cheapest to reach, see get_nearest_by_cost'''
+        index, path = self.get_nearest_by_cost(purpose, [info['xy'] for info in infos], from_xy)
+        if index is None:
+            return {}, None
+        return infos[index], path
+    
+    
+    def get_nearest_player_info_by_flow_field(self, field_name, infos, xy):
+        '''
+        agent_info of the player in infos with the lowest cost to go of one of the map's flow fields, e.g.
+        the first to reach a flag, or the closest to xy in a straight line if none of them can reach it
+        '''
+        best_cost = float('inf')
         best_info = {}
-        
-        for idx, info in self.the_map.agent_info[team].items():
-            if idx==self.player_idx:
-                continue
-                
-            if not info['is_incapacitated']:
-                continue
-                
-            x, y = info['xy']
-            dist = np.sqrt((self.x - x)**2 + (self.y - y)**2)
-            if dist<best_dist:
-                best_info = info
-                
+        flow_field = self.the_map.flow_fields.get(field_name)
+        if flow_field is not None:
+            for info in infos:
+                tile_col, tile_row = self.the_map.xy_to_cr(*info['xy'])
+                cost = flow_field.get_cost(int(tile_col), int(tile_row))
+                if cost<best_cost:
+                    best_cost = cost
+                    best_info = info
+                    
+        if not best_info and infos:
+            dists = [(x - xy[0])**2 + (y - xy[1])**2 for x, y in (info['xy'] for info in infos)]
+            best_info = infos[dists.index(min(dists))]
         return best_info
 
 
@@ -371,10 +590,9 @@ class ReflexAgentPlayer(AgentPlayer):
                 self.current_goal='go_team_flag_area'
 
                 if self.team == 'blue':
-                    #do I need to reverse these?
-                    self.goal_actions = self.get_direction_to_xy(self.the_map.blue_flag_xy)
+                    self.goal_actions = self.get_direction_to_flag_target('blue_flag_area', self.the_map.blue_flag_xy)
                 else:
-                    self.goal_actions = self.get_direction_to_xy(self.the_map.red_flag_xy)
+                    self.goal_actions = self.get_direction_to_flag_target('red_flag_area', self.the_map.red_flag_xy)
 
                 if self.config.verbose:
                     print('%s player %d heading to flag area: %s' % (self.team, self.player_idx, self.goal_actions))
@@ -389,21 +607,19 @@ class ReflexAgentPlayer(AgentPlayer):
                     if not self.goal_actions or not self.current_goal=='chase_opponent':
                         self.current_goal='chase_opponent'
 
-                        agent_info = self.the_map.agent_info['red']
-                        for idx, info in agent_info.items():
-                            if info['has_flag']:
-                                #we specifically want manhattan directions because the opponent's position is changing
-                                self.goal_actions = self.get_manhattan_direction_to_xy(info['xy'])
+                        info = self.the_map.agent_info.get_flag_carrier('red')
+                        if info is not None:
+                            #the opponent's position is changing, so repair one pursuit search rather than re-searching
+                            self.goal_actions = self.get_pursuit_direction_to_xy(info['xy'])
 
-                                if self.config.verbose:
-                                    print('%s player %d heading to tag opponent %d: %s' % (self.team, self.player_idx, idx, self.goal_actions))
-                                break
+                            if self.config.verbose:
+                                print('%s player %d heading to tag opponent %d: %s' % (self.team, self.player_idx, info.player_idx, self.goal_actions))
                 #go to opp flag area to wait
                 else:
                     if not self.goal_actions or not self.current_goal=='go_opponent_flag':
                         self.current_goal='go_opponent_flag'
 
-                        self.goal_actions = self.get_direction_to_xy(self.the_map.red_flag_xy)
+                        self.goal_actions = self.get_direction_to_flag_target('red_flag', self.the_map.red_flag_xy)
 
                         if self.config.verbose:
                             print('%s player %d heading to flag: %s' % (self.team, self.player_idx, self.goal_actions))
@@ -414,20 +630,18 @@ class ReflexAgentPlayer(AgentPlayer):
                     if not self.goal_actions or not self.current_goal=='chase_opponent':
                         self.current_goal='chase_opponent'
 
-                        agent_info = self.the_map.agent_info['blue']
-                        for idx, info in agent_info.items():
-                            if info['has_flag']:
-                                #we specifically want manhattan directions because the opponent's position is changing
-                                self.goal_actions = self.get_manhattan_direction_to_xy(info['xy'])
+                        info = self.the_map.agent_info.get_flag_carrier('blue')
+                        if info is not None:
+                            #the opponent's position is changing, so repair one pursuit search rather than re-searching
+                            self.goal_actions = self.get_pursuit_direction_to_xy(info['xy'])
 
-                                if self.config.verbose:
-                                    print('%s player %d heading to tag opponent %d: %s' % (self.team, self.player_idx, idx, self.goal_actions))
-                                break
+                            if self.config.verbose:
+                                print('%s player %d heading to tag opponent %d: %s' % (self.team, self.player_idx, info.player_idx, self.goal_actions))
                 else:
                     if not self.goal_actions or not self.current_goal=='go_opponent_flag':
                         self.current_goal='go_opponent_flag'
 
-                        self.goal_actions = self.get_direction_to_xy(self.the_map.blue_flag_xy)
+                        self.goal_actions = self.get_direction_to_flag_target('blue_flag', self.the_map.blue_flag_xy)
 
                         if self.config.verbose:
                             print('%s player %d heading to flag: %s' % (self.team, self.player_idx, self.goal_actions))
@@ -454,27 +668,31 @@ class HighLevelPlanningAgentPlayer(AgentPlayer):
     def __init__(self, x, y, idx, team, nav_type, the_map, config):
         super().__init__(x, y, idx, team, nav_type, the_map, config)
         self.policy = HighLevelPolicy('q.npy')
+        # HLAs whose goal is a path searched to a location given by hla_to_search_xy
+        self.searched_hlas = ['gaurd_nearest_teammate', 'gaurd_teammate_flag_carrier', 'gaurd_team_flag_area',
+                              'guard_opponent_flag_area']
+        # HLAs that search toward whichever of several players is the cheapest to reach, see get_nearest_by_cost
+        self.nearest_hlas = ['go_nearest_teammate', 'go_nearest_incapacitated_teammate']
         self.prev_hls = ()
         self.prev_hla = ''
         self.prev_action = 's'
+        # (high level state, HLA, search xy) of this tick once decide has worked it out, see decide
+        self.decision = None
         
         
     def get_action(self):
         '''Decide high level action based on current state and current goal, change goal if state changed'''
-        hls = self.policy.get_high_level_state(self, self.the_map)
+        hls, hla, search_xy = self.take_decision()
         
         #only change HLA if state is different
-        if hls==self.prev_hls and self.goal_actions:
+        if hla is None:
             return self.goal_actions.pop()
         
-        #choose best HLA
-        hla = self.choose_hla(hls)
-        
         if self.config.verbose and self.goal_actions:
             print('STATE CHANGE, old state %s, new state %s, new hla: %s' % (self.prev_hls, hls, hla))
         self.prev_hls = hls
         
-        self.goal_actions = self.hla_to_actions(hla)
+        self.goal_actions = self.hla_to_actions(hla, search_xy)
             
         if self.goal_actions:
             action = self.goal_actions.pop()
@@ -515,7 +733,87 @@ class HighLevelPlanningAgentPlayer(AgentPlayer):
         return hla
     
         
-    def hla_to_actions(self, hla):
+    def get_path_request(self):
+        '''The search the next get_action will run, if the state changed and the new HLA searches'''
+        hls, hla, search_xy = self.decide()
+        if search_xy is None:
+            return None
+        return self.get_path_request_to_xy(search_xy)
+    
+    
+    def decide(self):
+        '''
+        (high level state, HLA, search xy) of this tick, the HLA None if the state is unchanged and the current
+        goal carries on, the search xy that of hla_to_search_xy if the HLA searches, else None. It is only worked
+        out once a tick: get_path_request works it out ahead of get_action, which then takes the same decision
+        '''
+        if self.decision is None:
+            hls = self.policy.get_high_level_state(self, self.the_map)
+            hla = None
+            search_xy = None
+            if hls!=self.prev_hls or not self.goal_actions:
+                hla = self.next_hla(hls)
+                if hla in self.searched_hlas:
+                    search_xy = self.hla_to_search_xy(hla)
+            self.decision = (hls, hla, search_xy)
+        return self.decision
+    
+    
+    def take_decision(self):
+        '''The decision get_action acts on, the next tick works out a new one'''
+        decision = self.decide()
+        self.decision = None
+        return decision
+    
+    
+    def next_hla(self, hls):
+        '''The HLA get_action would choose for this state'''
+        return self.choose_hla(hls)
+    
+    
+    def hla_to_search_xy(self, hla):
+        '''The location hla_to_actions searches a path to for hla, None if it doesn't search'''
+        opponent_team = 'red' if self.team=='blue' else 'blue'
+        
+        if hla=='gaurd_nearest_teammate':
+            info, path = self.get_nearest_player_info_by_cost('teammate', self.get_player_infos_by_team(self.team))
+            if not info:
+                return None
+            opp_info, path = self.get_nearest_player_info_by_cost('teammate_opponent', 
+                                                                  self.get_player_infos_by_team(opponent_team),
+                                                                  from_xy=info['xy'])
+            # with no opponents left to guard against, stay with the teammate
+            if not opp_info:
+                return info['xy']
+            return self.get_midpoint(info['xy'], opp_info['xy'])
+            
+        elif hla=='gaurd_teammate_flag_carrier':
+            info = self.the_map.agent_info.get_flag_carrier(self.team)
+            if info is not None:
+                return info['xy']
+                    
+        #the opponent that would get to the flag first, the flag's flow field already has every tile's cost to it
+        elif hla=='gaurd_team_flag_area':
+            xy1 = self.the_map.blue_flag_xy if self.team=='blue' else self.the_map.red_flag_xy
+            info = self.get_nearest_player_info_by_flow_field('%s_flag' % self.team, 
+                                                              self.get_player_infos_by_team(opponent_team), xy1)
+            if not info:
+                return xy1
+            return self.get_midpoint(xy1, info['xy'])
+            
+        elif hla=='guard_opponent_flag_area':
+            xy1 = self.the_map.red_flag_xy if self.team=='blue' else self.the_map.blue_flag_xy
+            info = self.get_nearest_player_info_by_flow_field('%s_flag' % opponent_team, 
+                                                              self.get_player_infos_by_team(opponent_team), xy1)
+            if not info:
+                return xy1
+            return self.get_midpoint(xy1, info['xy'])
+            
+        return None
+    
+        
+    def hla_to_actions(self, hla, search_xy=None):
+        '''Actions toward hla's goal, search_xy is where a searched HLA goes, as worked out by decide'''
         opponent_team = 'red' if self.team=='blue' else 'blue'
         goal_actions = []
         
@@ -526,60 +824,41 @@ class HighLevelPlanningAgentPlayer(AgentPlayer):
             
         elif hla=='go_opponent_flag':
             xy = self.the_map.red_flag_xy if self.team=='blue' else self.the_map.blue_flag_xy
-            goal_actions = self.get_direction_to_xy(xy)
+            goal_actions = self.get_direction_to_flag_target('%s_flag' % opponent_team, xy)
             
         elif hla=='go_team_flag_area':
             xy = self.the_map.blue_flag_xy if self.team=='blue' else self.the_map.red_flag_xy
-            goal_actions = self.get_direction_to_xy(xy)
+            goal_actions = self.get_direction_to_flag_target('%s_flag_area' % self.team, xy)
             
         elif hla=='go_opponent_flag_carrier':
-            for info in self.the_map.agent_info[opponent_team].values():
-                if info['has_flag']:
-                    goal_actions = self.get_manhattan_direction_to_xy(info['xy'])
+            info = self.the_map.agent_info.get_flag_carrier(opponent_team)
+            if info is not None:
+                goal_actions = self.get_pursuit_direction_to_xy(info['xy'])
                     
         elif hla=='go_nearest_opponent':
-            info = self.get_closest_player_info_by_team(opponent_team)
-            goal_actions = self.get_manhattan_direction_to_xy(info['xy'])
-            
-        elif hla=='go_nearest_teammate':
-            info = self.get_closest_player_info_by_team(self.team)
-            goal_actions = self.get_direction_to_xy(info['xy'])
-            
-        elif hla=='go_nearest_incapacitated_teammate':
-            info = self.get_closest_incapacitated_player_info_by_team(self.team)
-            goal_actions = self.get_direction_to_xy(info['xy'])
+            #the opponent chosen by terrain cost is then chased like any moving target
+            info, path = self.get_nearest_player_info_by_cost('opponent', self.get_player_infos_by_team(opponent_team))
+            goal_actions = self.get_pursuit_direction_to_xy(info['xy'])
             
-        elif hla=='gaurd_nearest_teammate':
-            info = self.get_closest_player_info_by_team(self.team)
-            opp_info = self.get_closest_player_info_to_xy_by_team(info['xy'], opponent_team)
-            goal_actions = self.go_between(info['xy'], opp_info['xy'])
-            
-        elif hla=='gaurd_teammate_flag_carrier':
-            for info in self.the_map.agent_info[self.team].values():
-                if info['has_flag']:
-                    goal_actions = self.get_direction_to_xy(info['xy'])
-                    
-        elif hla=='gaurd_team_flag_area':
-            xy1 = self.the_map.blue_flag_xy if self.team=='blue' else self.the_map.red_flag_xy
-            info = self.get_closest_player_info_to_xy_by_team(xy1, opponent_team)
-            goal_actions = self.go_between(xy1, info['xy'])
+        elif hla in self.nearest_hlas:
+            infos = self.get_player_infos_by_team(self.team, incapacitated_only=hla=='go_nearest_incapacitated_teammate')
+            info, path = self.get_nearest_player_info_by_cost('teammate', infos)
+            #the search toward all of them already found the path
+            if path:
+                goal_actions = list(reversed(path))
+            elif info:
+                goal_actions = self.get_manhattan_direction_to_xy(info['xy'])
             
-        elif hla=='guard_opponent_flag_area':
-            xy1 = self.the_map.red_flag_xy if self.team=='blue' else self.the_map.blue_flag_xy
-            info = self.get_closest_player_info_to_xy_by_team(xy1, opponent_team)
-            goal_actions = self.go_between(xy1, info['xy'])
+        elif hla in self.searched_hlas:
+            if search_xy is not None:
+                goal_actions = self.get_direction_to_xy(search_xy)
             
         elif hla=='run_away_from_nearest_opponent':
             info = self.get_closest_player_info_by_team(opponent_team)
             goal_actions = self.get_manhattan_direction_away_from(info['xy'])
             
         elif hla=='run_away_from_opponents_centroid':
-            xs, ys = [],[]
-            for info in self.the_map.agent_info[opponent_team].values():
-                x,y = info['xy']
-                xs.append(x)
-                ys.append(y)
-            mean_xy = (sum(xs)/len(xs), sum(ys)/len(ys))
+            mean_xy = self.the_map.agent_info.get_centroid(opponent_team)
             goal_actions = self.get_manhattan_direction_away_from(mean_xy)
             
         return goal_actions
@@ -593,17 +872,24 @@ class ReinforcementLearningAgentPlayer(HighLevelPlanningAgentPlayer):
     '''
     def __init__(self, x, y, idx, team, nav_type, the_map, config):
         super().__init__(x, y, idx, team, nav_type, the_map, config)
+        # expected utility of the last HLA chosen
+        self.utility = -1.0
 
         
+    def next_hla(self, hls):
+        hla, self.utility = self.policy.get_high_level_action(self, self.the_map, hls, with_probability=False)
+        return hla
+    
+        
     def get_action(self):
         '''Select action based on expected utility from a learned q table.'''
-        hls = self.policy.get_high_level_state(self, self.the_map)
+        hls, hla, search_xy = self.take_decision()
 
         #only change HLA if state is different
-        if hls==self.prev_hls and self.goal_actions:
+        if hla is None:
             return self.goal_actions.pop()
         
-        hla, utility = self.policy.get_high_level_action(self, self.the_map, hls, with_probability=False)
+        utility = self.utility
         #if self.config.verbose:
         #print('HLA %s, Utility %.4f' % (hla, utility))
         
@@ -611,7 +897,7 @@ class ReinforcementLearningAgentPlayer(HighLevelPlanningAgentPlayer):
             print('STATE CHANGE, old state %s, new state %s, new hla: %s, utility: %.4f' % (self.prev_hls, hls, hla, utility))
         self.prev_hls = hls
     
-        self.goal_actions = self.hla_to_actions(hla)
+        self.goal_actions = self.hla_to_actions(hla, search_xy)
             
         if self.goal_actions:
             action = self.goal_actions.pop()
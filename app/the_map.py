@@ -1,5 +1,8 @@
 import numpy as np
-from map_generator import MapGenerator
+import distance_transform
+from agent_registry import AgentRegistry
+from map_cache import MapCache
+from navigation import Navigation
 
 
 class TheMap():
@@ -12,10 +15,10 @@ class TheMap():
         if new_map_seed:
             if self.config.verbose:
                 print('Creating new map')
-            tile_cols, tile_rows = 40, 30
+            tile_cols, tile_rows = self.config.map_tile_cols, self.config.map_tile_rows
             pixel_dims = (self.tile_size * tile_cols, self.tile_size * tile_rows)
-            self.tile_speeds, self.map_path = MapGenerator(self.config, seed=new_map_seed).generate_map(pixel_dims, 
-                                                                        save_path = self.config.maps_path)
+            #only generated the first time a seed is used, after that it's loaded from the cache
+            self.tile_speeds, self.map_path = MapCache(self.config).get_map(new_map_seed, pixel_dims)
         else:
             if self.config.verbose:
                 print('Using default map')
@@ -23,6 +26,21 @@ class TheMap():
             self.tile_speeds = np.load(self.config.map_default_speed_array)
             
         self.middle_tile = self.tile_speeds.shape[1]//2
+        
+        #part of every cached path's key, bump it whenever tile_speeds changes
+        self.map_version = 0
+        
+        #tiles with the same label are connected by passable tiles, -1 on barricades, see same_component
+        self.component_labels = distance_transform.component_labels(self.tile_speeds > 0)
+        
+        #[row, col] boolean grids behind the spatial queries, one tile is a single lookup (in_flag_area,
+        #is_passable) and many tiles a single numpy call (tiles_in_mask and the methods using it)
+        self.passable_mask = self.tile_speeds > 0
+        tile_cols = np.indices(self.tile_speeds.shape)[1]
+        self.enemy_territory_masks = {'blue': tile_cols > self.middle_tile, 'red': tile_cols < self.middle_tile}
+        #filled in by set_flag_location
+        self.flag_area_masks = {'blue': np.zeros(self.tile_speeds.shape, dtype=bool), 
+                                'red': np.zeros(self.tile_speeds.shape, dtype=bool)}
             
         self.blue_flag_xy = (0,0)
         self.blue_flag_area_tiles = []
@@ -32,8 +50,19 @@ class TheMap():
         self.blue_flag_in_play = False
         self.red_flag_in_play = False
         
-        #store [team][player_idx]:{'xy':(x,y), 'has_flag':, 'is_incapacitated':, 'in_enemy_territory'}
-        self.agent_info = {'blue':{}, 'red':{}}
+        #[team][player_idx]: view of {'xy':(x,y), 'has_flag':, 'is_incapacitated':, 'in_enemy_territory':,
+        #'incapacitated_countdown':}, held in arrays so queries over every player are vectorized
+        self.agent_info = AgentRegistry()
+        
+        #one navigation service (and path cache) shared by every player on this map
+        self.navigation = Navigation(self)
+        #the cost to go from every tile to a few landmarks is precomputed once for the A* heuristic,
+        #the flags are added as landmarks once they are placed
+        self.navigation.add_landmarks(self.navigation.get_map_landmarks(self.config.navigation_midline_landmarks))
+        
+        #flags never move once placed, so every agent heading to a flag or flag area shares
+        #one precomputed field: 'blue_flag', 'blue_flag_area', 'red_flag', 'red_flag_area'
+        self.flow_fields = {}
         
         
     def set_flag_location(self, team, flag_x, flag_y):
@@ -51,12 +80,48 @@ class TheMap():
                     self.blue_flag_area_tiles.append((r, c))
                 else:
                     self.red_flag_area_tiles.append((r, c))
+                if 0 <= r < self.tile_speeds.shape[0] and 0 <= c < self.tile_speeds.shape[1]:
+                    self.flag_area_masks[team][r, c] = True
                     
         if self.config.verbose:
             print('%s flag is on %s, %s, in area %s' % (team, flag_r, flag_c, 
                     str(self.blue_flag_area_tiles) if team=='blue' else str(self.red_flag_area_tiles)))
+            
+        flag_area_tiles = self.blue_flag_area_tiles if team=='blue' else self.red_flag_area_tiles
+        flag_field, flag_area_field = self.navigation.flow_fields([[(flag_c, flag_r)], 
+                                                                   [(c, r) for r, c in flag_area_tiles]])
+        self.flow_fields['%s_flag' % team] = flag_field
+        self.flow_fields['%s_flag_area' % team] = flag_area_field
+        self.navigation.add_landmarks([(flag_c, flag_r)])
                     
         
+    def get_flow_direction(self, field_name, x, y):
+        '''Next step toward the target of a precomputed flow field, '' once there or if it can't be reached'''
+        flow_field = self.flow_fields.get(field_name)
+        if flow_field is None:
+            return ''
+        tile_col, tile_row = self.xy_to_cr(x, y)
+        return flow_field.get_direction(int(tile_col), int(tile_row))
+        
+        
+    def same_component(self, tile1, tile2):
+        '''Whether the (col, row) tiles are both passable and connected, so there is a path between them'''
+        label = self.component_labels[tile1[1], tile1[0]]
+        return label >= 0 and label == self.component_labels[tile2[1], tile2[0]]
+    
+    
+    def get_largest_component(self, tile_cols=()):
+        '''Label of the largest component with passable tiles in every one of tile_cols, None if there isn't one'''
+        passable = self.component_labels >= 0
+        labels = set(np.unique(self.component_labels[passable]).tolist())
+        for tile_col in tile_cols:
+            labels &= set(self.component_labels[:, tile_col].tolist())
+        if not labels:
+            return None
+        sizes = np.bincount(self.component_labels[passable])
+        return max(labels, key=lambda label: sizes[label])
+        
+        
     def get_not_allowed_tiles(self):
         idx = np.where(self.tile_speeds==0)
         return list(zip(idx[0].tolist(), idx[1].tolist()))
@@ -78,8 +143,42 @@ class TheMap():
         
         
     def in_flag_area(self, team, tile_col, tile_row):
-        if team=='blue':
-            return (tile_row, tile_col) in self.blue_flag_area_tiles
-        else:
-            return (tile_row, tile_col) in self.red_flag_area_tiles
+        return self.__in_mask(self.flag_area_masks[team], tile_col, tile_row)
+    
+    
+    def is_passable(self, tile_col, tile_row):
+        return self.__in_mask(self.passable_mask, tile_col, tile_row)
+    
+    
+    def tiles_in_mask(self, mask, tile_cols, tile_rows):
+        '''
+        mask[tile_rows, tile_cols] for arrays of tiles, e.g. every player's, False for tiles off the map.
+        xy_to_cr converts arrays of x and y as well.
+        '''
+        tile_cols, tile_rows = np.asarray(tile_cols, dtype=int), np.asarray(tile_rows, dtype=int)
+        rows, cols = mask.shape
+        on_map = (tile_rows >= 0) & (tile_rows < rows) & (tile_cols >= 0) & (tile_cols < cols)
+        result = np.zeros(on_map.shape, dtype=bool)
+        result[on_map] = mask[tile_rows[on_map], tile_cols[on_map]]
+        return result
+    
+    
+    def in_flag_areas(self, team, tile_cols, tile_rows):
+        '''in_flag_area of arrays of tiles, as a boolean array'''
+        return self.tiles_in_mask(self.flag_area_masks[team], tile_cols, tile_rows)
+    
+    
+    def in_enemy_territories(self, team, tile_cols, tile_rows):
+        '''in_enemy_territory of arrays of tiles, as a boolean array'''
+        return self.tiles_in_mask(self.enemy_territory_masks[team], tile_cols, tile_rows)
+    
+    
+    def are_passable(self, tile_cols, tile_rows):
+        '''is_passable of arrays of tiles, as a boolean array'''
+        return self.tiles_in_mask(self.passable_mask, tile_cols, tile_rows)
+    
+    
+    def __in_mask(self, mask, tile_col, tile_row):
+        rows, cols = mask.shape
+        return 0 <= tile_row < rows and 0 <= tile_col < cols and bool(mask[tile_row, tile_col])
         
\ No newline at end of file
@@ -1,5 +1,7 @@
 # general common classes and methods
 import heapq
+import threading
+from collections import OrderedDict
 
 
 
@@ -43,7 +45,196 @@ class PriorityQueue:
                 break
         else:
             self.push(item, priority)
-            
+
+
+class IndexedPriorityQueue:
+    """
+      A binary min-heap over integer items in range(capacity), e.g. flat tile indexes.
+
+      The heap position of every item is tracked, so update is a real decrease-key
+      in O(log n) instead of the linear scan and re-heapify done by PriorityQueue.
+      Items with equal priority are popped in insertion order.
+    """
+
+    def __init__(self, capacity):
+        self.heap = []
+        self.position = [-1] * capacity
+        self.key = [None] * capacity
+        self.count = 0
+
+    def push(self, item, priority):
+        self.key[item] = (priority, self.count)
+        self.count += 1
+        self.position[item] = len(self.heap)
+        self.heap.append(item)
+        self.__sift_up(len(self.heap) - 1)
+
+    def pop(self):
+        heap = self.heap
+        item = heap[0]
+        last = heap.pop()
+        self.position[item] = -1
+        if heap:
+            heap[0] = last
+            self.position[last] = 0
+            self.__sift_down(0)
+        return item
+
+    def isEmpty(self):
+        return len(self.heap) == 0
+
+    def update(self, item, priority):
+        # Same contract as PriorityQueue.update: push new items, lower the priority of
+        # queued items, and ignore updates that would not lower an item's priority.
+        index = self.position[item]
+        if index < 0:
+            self.push(item, priority)
+        elif priority < self.key[item][0]:
+            self.key[item] = (priority, self.key[item][1])
+            self.__sift_up(index)
+
+    def __sift_up(self, index):
+        heap, position, key = self.heap, self.position, self.key
+        item = heap[index]
+        item_key = key[item]
+        while index > 0:
+            parent_index = (index - 1) >> 1
+            parent = heap[parent_index]
+            if key[parent] <= item_key:
+                break
+            heap[index] = parent
+            position[parent] = index
+            index = parent_index
+        heap[index] = item
+        position[item] = index
+
+    def __sift_down(self, index):
+        heap, position, key = self.heap, self.position, self.key
+        size = len(heap)
+        item = heap[index]
+        item_key = key[item]
+        while True:
+            child_index = 2 * index + 1
+            if child_index >= size:
+                break
+            child = heap[child_index]
+            right_index = child_index + 1
+            if right_index < size and key[heap[right_index]] < key[child]:
+                child_index = right_index
+                child = heap[child_index]
+            if item_key <= key[child]:
+                break
+            heap[index] = child
+            position[child] = index
+            index = child_index
+        heap[index] = item
+        position[item] = index
+
+
+class BucketQueue:
+    """
+      A bucket (Dial's) priority queue over integer items in range(capacity) with
+      non-negative integer priorities, e.g. flat tile indexes keyed by integer path costs.
+
+      Every item is kept in a list per priority, so push and update are O(1) and pop only
+      walks forward over empty buckets to the next priority in use. That needs priorities
+      that don't go below the last one popped and stay within max_span of it, which holds for
+      Dijkstra and for A* with a consistent heuristic when max_span is the most a priority
+      can grow by in one expansion, so max_span + 1 buckets are reused in a circle. The first
+      priority pushed is the lowest that can be pushed before the first pop.
+      Any other priority is kept in a binary heap next to the buckets instead, so the queue
+      still pops in priority order, only slower while that heap has items in it.
+      Items with equal priority in the buckets are popped last in, first out.
+    """
+
+    def __init__(self, capacity, max_span):
+        self.max_span = max_span
+        self.buckets = [[] for i in range(max_span + 1)]
+        #(priority, count, item) of the items whose priority was outside the buckets' span
+        self.overflow = []
+        self.count = 0
+        #priority of every queued item, -1 if it isn't queued
+        self.priority = [-1] * capacity
+        #the last priority popped from the buckets, or the first one pushed
+        self.minimum = None
+        self.size = 0
+
+    def push(self, item, priority):
+        if self.minimum is None:
+            self.minimum = priority
+        self.__insert(item, priority)
+        self.size += 1
+
+    def pop(self):
+        overflow = self.overflow
+        if overflow:
+            return self.__pop_with_overflow()
+        buckets, priority = self.buckets, self.priority
+        num_buckets = len(buckets)
+        minimum = self.minimum
+        while True:
+            bucket = buckets[minimum % num_buckets]
+            while bucket:
+                item = bucket.pop()
+                #an update leaves the item's old entry behind, only the one at its priority counts
+                if priority[item] == minimum:
+                    priority[item] = -1
+                    self.minimum = minimum
+                    self.size -= 1
+                    return item
+            minimum += 1
+
+    def isEmpty(self):
+        return self.size == 0
+
+    def update(self, item, priority):
+        # Same contract as PriorityQueue.update: push new items, lower the priority of
+        # queued items, and ignore updates that would not lower an item's priority.
+        current = self.priority[item]
+        if current < 0:
+            self.push(item, priority)
+        elif priority < current:
+            self.__insert(item, priority)
+
+    def __insert(self, item, priority):
+        self.priority[item] = priority
+        if self.minimum <= priority <= self.minimum + self.max_span:
+            self.buckets[priority % len(self.buckets)].append(item)
+        else:
+            heapq.heappush(self.overflow, (priority, self.count, item))
+            self.count += 1
+
+    def __pop_with_overflow(self):
+        overflow, buckets, priority = self.overflow, self.buckets, self.priority
+        #entries left behind by updates or by the item being popped from a bucket
+        while overflow and priority[overflow[0][2]] != overflow[0][0]:
+            heapq.heappop(overflow)
+        if not overflow:
+            return self.pop()
+
+        #the lowest bucket priority that is still below the heap's lowest, if there is one
+        overflow_priority = overflow[0][0]
+        num_buckets = len(buckets)
+        minimum = self.minimum
+        while minimum < overflow_priority and minimum <= self.minimum + self.max_span:
+            bucket = buckets[minimum % num_buckets]
+            while bucket:
+                if priority[bucket[-1]] == minimum:
+                    item = bucket.pop()
+                    priority[item] = -1
+                    self.minimum = minimum
+                    self.size -= 1
+                    return item
+                bucket.pop()
+            minimum += 1
+
+        item = heapq.heappop(overflow)[2]
+        priority[item] = -1
+        #the buckets hold nothing below it any more, so their span can move up to it
+        self.minimum = max(self.minimum, overflow_priority)
+        self.size -= 1
+        return item
+
 
 class Stack:
     """
@@ -65,4 +256,52 @@ class Stack:
     def isEmpty(self):
         "Returns true if the stack is empty"
         return len(self.list) == 0
-    
\ No newline at end of file
+
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least recently used entry once it holds max_size
+    entries, and counts hits and misses so its effectiveness can be checked.
+    It can be shared between threads.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        "Return the value for 'key' and mark it most recently used, or default on a miss"
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        "Store 'value' under 'key', evicting the least recently used entry when full"
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        "Returns a dict of size, hits, misses, evictions and hit rate"
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'max_size': self.max_size, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def __len__(self):
+        return len(self.entries)
@@ -3,10 +3,11 @@ import numpy as np
 
 
 class VirtualMap():
-    def __init__(self, config, allow_barriers=False):
+    def __init__(self, config, allow_barriers=False, speed_array_path=None):
+        '''speed_array_path - the map's speeds (.npy), e.g. one of a MapCorpus, the default map's if None'''
         self.players = []
         
-        self.tile_speeds = np.load(config.map_default_speed_array)
+        self.tile_speeds = np.load(speed_array_path or config.map_default_speed_array)
         
         #we're not learning at tile level so remove obstacles
         if not allow_barriers:
@@ -38,10 +39,32 @@ class VirtualMap():
         
         self.blue_flag_area = [(x,y) for x in range(self.blue_flag_xy[0]-2, self.blue_flag_xy[0]+3) for y in range(self.blue_flag_xy[1]-2, self.blue_flag_xy[1]+3)]
         self.red_flag_area = [(x,y) for x in range(self.red_flag_xy[0]-2, self.red_flag_xy[0]+3) for y in range(self.red_flag_xy[1]-2, self.red_flag_xy[1]+3)]
+        
+        #[y, x] booleans of the same, every step looks a tile up in them instead of searching the lists
+        self.passable_mask = self.tile_speeds > 0
+        self.flag_area_masks = {'blue': np.zeros(self.tile_speeds.shape, dtype=bool), 
+                                'red': np.zeros(self.tile_speeds.shape, dtype=bool)}
+        for team, flag_area in [('blue', self.blue_flag_area), ('red', self.red_flag_area)]:
+            for x, y in flag_area:
+                if self.on_map((x, y)):
+                    self.flag_area_masks[team][y, x] = True
+                    
         self.blue_flag_in_play = False
         self.red_flag_in_play = False
         
         
+    def on_map(self, xy):
+        return 0 <= xy[1] < self.tile_speeds.shape[0] and 0 <= xy[0] < self.tile_speeds.shape[1]
+    
+    
+    def is_passable(self, xy):
+        return self.on_map(xy) and bool(self.passable_mask[xy[1], xy[0]])
+    
+    
+    def in_flag_area(self, team, xy):
+        return self.on_map(xy) and bool(self.flag_area_masks[team][xy[1], xy[0]])
+    
+    
     def get_closest_player_by_team(self, player, team):
         best_dist=float('inf')
         best_player = None
@@ -146,9 +169,10 @@ class VirtualPlayer():
         
         
 class VirtualGame():
-    def __init__(self, config):
+    def __init__(self, config, speed_array_path=None):
+        '''speed_array_path - the map to play on, see VirtualMap'''
         self.verbose = config.verbose
-        self.the_map = VirtualMap(config)
+        self.the_map = VirtualMap(config, speed_array_path=speed_array_path)
         if self.verbose:
             print('Map size: ', self.the_map.tile_speeds.shape)
         team_size = config.blue_team_size
@@ -236,16 +260,16 @@ class VirtualGame():
         new_xy = player.xy
         speed = 0
         #tile speeds is row by col, which equals y by x
-        if action=='w' and (player_y-1, player_x) not in self.the_map.not_allowed:
+        if action=='w' and self.the_map.is_passable((player_x, player_y-1)):
             new_xy = (player_x, player_y-1)
             speed = self.the_map.tile_speeds[player_y-1, player_x]
-        elif action=='s' and (player_y+1, player_x) not in self.the_map.not_allowed:
+        elif action=='s' and self.the_map.is_passable((player_x, player_y+1)):
             new_xy = (player_x, player_y+1)
             speed = self.the_map.tile_speeds[player_y+1, player_x]
-        elif action=='a' and (player_y, player_x-1) not in self.the_map.not_allowed:
+        elif action=='a' and self.the_map.is_passable((player_x-1, player_y)):
             new_xy = (player_x-1, player_y)
             speed = self.the_map.tile_speeds[player_y, player_x-1]
-        elif action=='d' and (player_y, player_x+1) not in self.the_map.not_allowed:
+        elif action=='d' and self.the_map.is_passable((player_x+1, player_y)):
             new_xy = (player_x+1, player_y)
             speed = self.the_map.tile_speeds[player_y, player_x+1]
         
@@ -283,7 +307,7 @@ class VirtualGame():
                 
         
         #player won
-        if player.team=='blue' and player.has_flag and new_xy in self.the_map.blue_flag_area:
+        if player.team=='blue' and player.has_flag and self.the_map.in_flag_area('blue', new_xy):
             for other_player in self.the_map.players:
                 if other_player.player_idx==player.player_idx:
                     continue
@@ -295,7 +319,7 @@ class VirtualGame():
             if self.verbose:
                 print('\tplayer won')
             return self.won_reward, True
-        elif player.team=='red' and player.has_flag and new_xy in self.the_map.red_flag_area:
+        elif player.team=='red' and player.has_flag and self.the_map.in_flag_area('red', new_xy):
             for other_player in self.the_map.players:
                 if other_player.player_idx==player.player_idx:
                     continue
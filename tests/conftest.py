@@ -0,0 +1,72 @@
+import os, sys, heapq
+import numpy as np
+import pytest
+
+#the game's modules import each other by name from the app directory
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, APP_PATH)
+
+from config import Config
+from benchmark_navigation import BenchmarkMap
+
+
+
+#a small fixed map: every terrain speed, lake walls across most of it and a pocket in the bottom left
+#that the lakes cut off
+SPEED_ROWS = ['aaaaabbbbbaaaaaaaaaa',
+              'aacccbbbbbaaddaaaaaa',
+              'aacccbbbbbaaddaaaaaa',
+              'aaaaaaaaa.aaaaaaaaaa',
+              'a................aaa',
+              'aaaaaaaaa.aaaabaaaaa',
+              'bbbbbaaaa.aaaabaaaaa',
+              'bbddbaaaa.aaaabaaccc',
+              'bbddbaaaaaaaaabaaccc',
+              'aaaaaaaaa.aaaaaaaaaa',
+              'aaa...aaa.aaaaaaaaaa',
+              'aaa.c.aaa.aaaaaaaaad']
+SPEED_OF = {'a': 10, 'b': 7, 'c': 4, 'd': 2, '.': 0}
+
+
+
+@pytest.fixture
+def config(monkeypatch):
+    #the resource paths are relative to the app directory, the game is run from there
+    monkeypatch.chdir(APP_PATH)
+    config = Config()
+    config.verbose = False
+    #clusters smaller than the map, so hierarchical searches cross several of them
+    config.navigation_cluster_size = 5
+    return config
+
+
+@pytest.fixture
+def tile_speeds():
+    return np.array([[SPEED_OF[c] for c in row] for row in SPEED_ROWS])
+
+
+@pytest.fixture
+def small_map(config, tile_speeds):
+    return BenchmarkMap(config, 'small', tile_speeds)
+
+
+def dijkstra_costs(step_costs, sources):
+    '''Reference cost from every tile to the nearest source (col, row), a plain Dijkstra over a (rows, cols) grid'''
+    rows, cols = step_costs.shape
+    costs = np.full((rows, cols), np.inf)
+    open_list = []
+    for col, row in sources:
+        costs[row, col] = 0
+        heapq.heappush(open_list, (0, row, col))
+    while open_list:
+        cost, row, col = heapq.heappop(open_list)
+        if cost > costs[row, col]:
+            continue
+        #moving from a neighbor into (row, col) costs step_costs[row, col], inf into a barricade
+        for next_row, next_col in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+            if 0 <= next_row < rows and 0 <= next_col < cols:
+                new_cost = cost + step_costs[row, col]
+                if new_cost < costs[next_row, next_col]:
+                    costs[next_row, next_col] = new_cost
+                    heapq.heappush(open_list, (new_cost, next_row, next_col))
+    return costs
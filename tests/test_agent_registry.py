@@ -0,0 +1,61 @@
+import math, random
+import pytest
+
+from agent_registry import AgentRegistry
+
+
+
+def random_players(rng, registry):
+    '''team -> player_idx -> the dict agent_info used to keep, for the same players added to registry'''
+    players = {'blue': {}, 'red': {}}
+    for team in players:
+        for player_idx in range(rng.randint(0, 8)):
+            xy = (rng.randint(0, 50), rng.randint(0, 50))
+            view = registry.add(team, player_idx, xy)
+            info = {'xy': xy, 'has_flag': rng.random() < 0.2, 'is_incapacitated': rng.random() < 0.4}
+            view['has_flag'], view['is_incapacitated'] = info['has_flag'], info['is_incapacitated']
+            players[team][player_idx] = info
+    return players
+
+
+def test_queries_match_loops_over_dicts():
+    rng = random.Random(0)
+    for trial in range(200):
+        registry = AgentRegistry(capacity=rng.choice([0, 1, 4]))
+        players = random_players(rng, registry)
+        asking = (rng.choice(['blue', 'red']), rng.randint(0, 4))
+        xy = (rng.randint(0, 50), rng.randint(0, 50))
+        for team, infos in players.items():
+            for incapacitated_only in [False, True]:
+                expected, expected_distance = None, float('inf')
+                for player_idx, info in infos.items():
+                    if (team, player_idx) == asking or (incapacitated_only and not info['is_incapacitated']):
+                        continue
+                    distance = math.hypot(xy[0] - info['xy'][0], xy[1] - info['xy'][1])
+                    if distance < expected_distance:
+                        expected, expected_distance = player_idx, distance
+                nearest = registry.get_nearest(xy, team=team, exclude=asking, incapacitated_only=incapacitated_only)
+                assert (nearest and nearest.player_idx) == expected
+
+            carriers = [player_idx for player_idx, info in infos.items() if info['has_flag']]
+            carrier = registry.get_flag_carrier(team)
+            assert (carrier and carrier.player_idx) == (carriers[0] if carriers else None)
+
+            if infos:
+                centroid = registry.get_centroid(team)
+                assert centroid[0] == pytest.approx(sum(info['xy'][0] for info in infos.values()) / len(infos))
+                assert centroid[1] == pytest.approx(sum(info['xy'][1] for info in infos.values()) / len(infos))
+
+            for player_idx, info in infos.items():
+                assert registry[team][player_idx]['xy'] == info['xy']
+                assert registry[team][player_idx]['is_incapacitated'] == info['is_incapacitated']
+            assert list(registry[team]) == list(infos)
+
+
+def test_positions_keep_their_fractions():
+    registry = AgentRegistry()
+    view = registry.add('blue', 0, (10, 20))
+    assert view['xy'] == (10.0, 20.0) and isinstance(view['xy'][0], float)
+    view['xy'] = (10.5, 20.0)
+    assert view['xy'] == (10.5, 20.0)
+    assert registry.get_centroid('blue') == (10.5, 20.0)
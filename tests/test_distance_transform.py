@@ -0,0 +1,75 @@
+from collections import deque
+import numpy as np
+
+import distance_transform
+from conftest import dijkstra_costs
+
+
+
+def test_cost_to_go_matches_dijkstra(tile_speeds):
+    step_costs = distance_transform.step_cost_grid(tile_speeds, 20)
+    sources = [[(0, 0)], [(19, 11), (4, 11)], [(17, 3)]]
+    costs = distance_transform.cost_to_go(step_costs, sources)
+    assert costs.shape == (3,) + tile_speeds.shape
+    for layer, layer_sources in enumerate(sources):
+        assert np.array_equal(costs[layer], dijkstra_costs(step_costs, layer_sources))
+
+
+def test_cost_to_go_max_rounds_only_overestimates(tile_speeds):
+    step_costs = distance_transform.step_cost_grid(tile_speeds, 20)
+    exact = distance_transform.cost_to_go(step_costs, [[(0, 0)]])
+    partial = distance_transform.cost_to_go(step_costs, [[(0, 0)]], max_rounds=1)
+    assert np.all(partial >= exact)
+
+
+def test_direction_grid_follows_the_costs_down(tile_speeds):
+    step_costs = distance_transform.step_cost_grid(tile_speeds, 20)
+    costs = distance_transform.cost_to_go(step_costs, [[(19, 0)]])[0]
+    directions = distance_transform.direction_grid(costs, step_costs)
+    offsets = {'w': (-1, 0), 's': (1, 0), 'd': (0, 1), 'a': (0, -1)}
+    rows, cols = np.where(np.isfinite(costs) & (tile_speeds > 0))
+    for row, col in zip(rows, cols):
+        if costs[row, col] == 0:
+            assert directions[row, col] == ''
+            continue
+        row_offset, col_offset = offsets[directions[row, col]]
+        next_row, next_col = row + row_offset, col + col_offset
+        assert costs[row, col] == costs[next_row, next_col] + step_costs[next_row, next_col]
+
+
+def test_cost_to_go_finishes_with_dijkstra_after_sweep_rounds():
+    #a serpentine corridor needs a round of sweeps per turn
+    tile_speeds = np.full((15, 12), 10)
+    for row in range(1, 15, 2):
+        tile_speeds[row, :] = 0
+        tile_speeds[row, 11 if row % 4 == 1 else 0] = 10
+    step_costs = distance_transform.step_cost_grid(tile_speeds, 20)
+    costs = distance_transform.cost_to_go(step_costs, [[(0, 0)], [(5, 14)]], sweep_rounds=1)
+    assert np.array_equal(costs[0], dijkstra_costs(step_costs, [(0, 0)]))
+    assert np.array_equal(costs[1], dijkstra_costs(step_costs, [(5, 14)]))
+
+
+def test_component_labels_match_flood_fill(tile_speeds):
+    passable = tile_speeds > 0
+    labels = distance_transform.component_labels(passable)
+    rows, cols = passable.shape
+
+    expected = np.full((rows, cols), -1)
+    for index in range(rows * cols):
+        row, col = divmod(index, cols)
+        if not passable[row, col] or expected[row, col] >= 0:
+            continue
+        #flood fill from the lowest index of each component, which is its label
+        expected[row, col] = index
+        open_list = deque([(row, col)])
+        while open_list:
+            row, col = open_list.popleft()
+            for next_row, next_col in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+                if (0 <= next_row < rows and 0 <= next_col < cols and passable[next_row, next_col]
+                        and expected[next_row, next_col] < 0):
+                    expected[next_row, next_col] = index
+                    open_list.append((next_row, next_col))
+
+    assert np.array_equal(labels, expected)
+    #the lakes cut the bottom left pocket off from the rest
+    assert len(set(labels[passable].tolist())) > 1
@@ -0,0 +1,64 @@
+import os, json
+import numpy as np
+import pytest
+
+from map_cache import MapCache
+
+
+
+@pytest.fixture
+def cache_config(config, tmp_path):
+    config.map_cache_path = str(tmp_path / 'cache')
+    return config
+
+
+def test_map_cache_round_trip(cache_config):
+    cache = MapCache(cache_config)
+    tile_speeds, map_path = cache.get_map(seed=5, pixel_dims=(200, 160))
+    #8 by 10 tiles inside a border tile on every side
+    assert tile_speeds.shape == (10, 12)
+    assert os.path.exists(map_path)
+
+    #the second call loads the same map from disk instead of generating it
+    modified = os.path.getmtime(map_path)
+    cached_speeds, cached_path = cache.get_map(seed=5, pixel_dims=(200, 160))
+    assert cached_path == map_path
+    assert os.path.getmtime(map_path) == modified
+    assert np.array_equal(cached_speeds, tile_speeds)
+    #callers get arrays they can change, not read only views of the files
+    assert tile_speeds.flags.writeable and cached_speeds.flags.writeable
+
+    with open(cache.manifest_path) as f:
+        manifest = json.load(f)
+    assert list(manifest) == [cache.get_key(5, (200, 160))]
+
+
+def test_map_cache_key_changes_with_the_settings(cache_config):
+    cache = MapCache(cache_config)
+    key = cache.get_key(5, (200, 160))
+    assert cache.get_key(5, (200, 160)) == key
+    assert cache.get_key(6, (200, 160)) != key
+    assert cache.get_key(5, (220, 160)) != key
+    cache_config.terrain_tile_size = 30
+    assert cache.get_key(5, (200, 160)) != key
+
+
+def test_map_cache_generates_a_damaged_entry_again(cache_config):
+    cache = MapCache(cache_config)
+    tile_speeds, map_path = cache.get_map(seed=5, pixel_dims=(200, 160))
+    speed_path = '%s/map_speed_%s.npy' % (cache.cache_path, cache.get_key(5, (200, 160)))
+    with open(speed_path, 'ab') as f:
+        f.write(b'damaged')
+
+    regenerated, regenerated_path = cache.get_map(seed=5, pixel_dims=(200, 160))
+    assert regenerated_path == map_path
+    assert np.array_equal(regenerated, tile_speeds)
+
+
+def test_map_cache_evicts_the_least_recently_used(cache_config):
+    cache_config.map_cache_max_bytes = 1
+    cache = MapCache(cache_config)
+    first_path = cache.get_map(seed=5, pixel_dims=(200, 160))[1]
+    second_path = cache.get_map(seed=6, pixel_dims=(200, 160))[1]
+    assert not os.path.exists(first_path)
+    assert os.path.exists(second_path)
@@ -0,0 +1,30 @@
+import os
+import numpy as np
+
+from map_corpus import MapCorpus, generate_corpus_map
+from map_generator import MapGenerator
+
+
+
+def test_generate_corpus_map_indexes_its_speed_file(config, tmp_path):
+    entry = generate_corpus_map((config, str(tmp_path), 3, (200, 160), False))
+    speed_path = '%s/%s' % (tmp_path, entry['speed_file'])
+    tile_speeds = np.load(speed_path)
+    assert entry['map_file'] is None
+    assert entry['generator_version'] == MapGenerator.version
+    #10 by 8 tiles inside the border
+    assert entry['tiles'] == [8, 10] and tile_speeds.shape == (10, 12)
+    assert sum(entry['terrain'].values()) == 80
+    assert entry['passable'] == int((tile_speeds[1:-1, 1:-1] > 0).sum())
+    assert 0 < entry['largest_component'] <= 1
+
+
+def test_build_skips_seeds_already_in_the_corpus(config, tmp_path):
+    corpus = MapCorpus(config, str(tmp_path))
+    entries = corpus.build([1, 2], (200, 160), processes=1)
+    assert sorted(entry['seed'] for entry in entries) == [1, 2]
+    assert corpus.build([1, 2, 3], (200, 160), processes=1)[0]['seed'] == 3
+    #a seed's file gone, it's generated again
+    os.remove('%s/%s' % (tmp_path, corpus.get_index()[2]['speed_file']))
+    assert [entry['seed'] for entry in corpus.build([1, 2, 3], (200, 160), processes=1)] == [2]
+    assert len(corpus.get_speed_paths()) == 3
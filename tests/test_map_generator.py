@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from map_generator import MapGenerator, PerlinNoise, PngWriter, TileAtlas
+
+
+
+def test_maps_are_the_same_whatever_the_chunk_size(config, tmp_path, monkeypatch):
+    maps = []
+    for chunk_tiles in [128, 3]:
+        monkeypatch.setattr(MapGenerator, 'chunk_tiles', chunk_tiles)
+        save_path = tmp_path / str(chunk_tiles)
+        save_path.mkdir()
+        tile_speeds, map_path = MapGenerator(config, seed=11).generate_map((260, 140), str(save_path))
+        maps.append((tile_speeds, np.asarray(Image.open(map_path))))
+
+    (speeds, pixels), (chunked_speeds, chunked_pixels) = maps
+    #13 by 7 tiles inside a border tile on every side
+    assert speeds.shape == (9, 15) and speeds.flags.writeable
+    assert pixels.shape == (7*config.terrain_tile_size + 2*config.map_border_size,
+                            13*config.terrain_tile_size + 2*config.map_border_size, 3)
+    assert np.array_equal(speeds, chunked_speeds)
+    assert np.array_equal(pixels, chunked_pixels)
+
+
+def test_speeds_only_match_the_full_map(config, tmp_path):
+    tile_speeds, map_path = MapGenerator(config, seed=11).generate_map((260, 140), str(tmp_path))
+    speeds_only, no_path = MapGenerator(config, seed=11).generate_map((260, 140), str(tmp_path), name='map_only',
+                                                                      save_image=False)
+    assert no_path is None
+    assert np.array_equal(speeds_only, tile_speeds)
+
+
+def test_noise_blocks_are_pieces_of_the_noise_square():
+    noise = PerlinNoise(5).generate_noise(120, num_octaves=4, persistence=0.5, grid_size=(50, 50))
+    generator = PerlinNoise(5)
+    blocks = [[generator.generate_block(120, (y0, y0 + 40), (x0, x0 + 60), num_octaves=4, persistence=0.5, 
+                                        grid_size=(50, 50)) for x0 in [0, 60]] for y0 in [0, 40, 80]]
+    raw = np.block(blocks)
+    assert np.array_equal(PerlinNoise.scale(raw, raw.min(), raw.max()), noise)
+    #the same seed gives the same noise, another seed other noise
+    assert np.array_equal(PerlinNoise(5).generate_noise(120, num_octaves=4, persistence=0.5, grid_size=(50, 50)), noise)
+    assert not np.array_equal(PerlinNoise(6).generate_noise(120, num_octaves=4, persistence=0.5, grid_size=(50, 50)), noise)
+
+
+def test_png_writer_strips_decode_to_the_image(tmp_path):
+    pixels = np.random.RandomState(0).randint(256, size=(37, 23, 3)).astype('uint8')
+    path = str(tmp_path / 'strips.png')
+    with PngWriter(path, 23, 37) as png:
+        for y0 in range(0, 37, 10):
+            png.write(pixels[y0:y0 + 10])
+    assert np.array_equal(np.asarray(Image.open(path)), pixels)
+
+    png = PngWriter(str(tmp_path / 'short.png'), 23, 37)
+    png.write(pixels[:30])
+    with pytest.raises(ValueError):
+        png.write(pixels[:10])
+    png.file.close()
+
+
+def loop_noise(seed, dim, num_octaves, persistence, grid_size, d_theta=0.05):
+    '''The noise of the original PerlinNoise, a pixel at a time'''
+    grads = np.random.RandomState(seed).uniform(-1, 1, (dim, dim, 2))
+    grads /= np.sqrt(np.sum(grads**2, 2))[:, :, None]
+    cos_t, sin_t = np.cos(d_theta), np.sin(d_theta)
+    grads = np.stack([cos_t*grads[:, :, 0] - sin_t*grads[:, :, 1], sin_t*grads[:, :, 0] + cos_t*grads[:, :, 1]], axis=2)
+    smoothstep = lambda t: t*t*t*(t*(t*6-15)+10)
+    linear_interp = lambda x0, x1, w: x0 + w * (x1 - x0)
+
+    def perlin(x, y):
+        px1, py1 = int(x/grid_size[0]), int(y/grid_size[1])
+        xingrid, yingrid = (x%grid_size[0]) / grid_size[0], (y%grid_size[1]) / grid_size[1]
+        x1y1dot = np.dot(grads[px1, py1], np.array([xingrid, yingrid]))
+        x1y2dot = np.dot(grads[px1, py1 + 1], np.array([xingrid, yingrid-1]))
+        x2y1dot = np.dot(grads[px1 + 1, py1], np.array([xingrid-1, yingrid]))
+        x2y2dot = np.dot(grads[px1 + 1, py1 + 1], np.array([xingrid-1, yingrid-1]))
+        cx, cy = smoothstep(xingrid), smoothstep(yingrid)
+        return linear_interp(linear_interp(x1y1dot, x2y1dot, cx), linear_interp(x1y2dot, x2y2dot, cx), cy)
+
+    m = np.zeros((dim, dim))
+    for y in range(dim):
+        for x in range(dim):
+            total, freq, amp, max_val = 0, 1, 1, 0
+            for i in range(num_octaves):
+                total += perlin(x*freq, y*freq) * amp
+                max_val += amp
+                amp *= persistence
+                freq *= 2
+            m[y, x] = total/max_val
+    m += abs(m.min())
+    m = (m * 255)/m.max()
+    return m.astype('uint8')
+
+
+def test_noise_is_the_same_as_a_pixel_at_a_time():
+    for seed, dim, num_octaves, grid_size in [(5, 40, 3, (10, 10)), (9, 33, 2, (8, 12))]:
+        noise = PerlinNoise(seed).generate_noise(dim, num_octaves=num_octaves, persistence=0.5, grid_size=grid_size)
+        assert np.array_equal(noise, loop_noise(seed, dim, num_octaves, 0.5, grid_size))
+
+
+
+def load_tiles(config):
+    return {terrain: Image.open('%s/%s_tile_%d.png' % (config.map_terrain_tiles_path, terrain, config.terrain_tile_size))
+            for terrain in config.terrain_speeds}
+
+
+def test_tile_atlas_matches_blending_and_rotating_the_tiles(config):
+    tiles = load_tiles(config)
+    atlas = TileAtlas(tiles, MapGenerator.terrain_blends, blend_levels=5)
+    #every terrain unblended, and the 3 that blend at every level
+    assert len(atlas.variants) == len(tiles) + 3*5
+    for (terrain, level), rotations in atlas.variants.items():
+        tile = tiles[terrain]
+        if level is not None:
+            tile = Image.blend(tiles[terrain], tiles[MapGenerator.terrain_blends[terrain]], alpha=level/4*0.5)
+        for k, rotation in enumerate(TileAtlas.rotations):
+            expected = np.asarray(tile.rotate(rotation).convert('RGB'))
+            assert np.array_equal(np.asarray(rotations[rotation].convert('RGB')), expected)
+            assert np.array_equal(atlas.pixels[atlas.variant_ids[(terrain, level)], k], expected)
+    #alphas go to the closest level
+    assert atlas.get_tile('hill', 90, alpha=0.6) is atlas.variants[('hill', 2)][90]
+    assert atlas.get_tile('lake', 180) is atlas.variants[('lake', None)][180]
+
+
+def test_every_tile_of_a_map_is_a_variant_of_its_terrain(config, tmp_path):
+    tile_speeds, map_path = MapGenerator(config, seed=4).generate_map((260, 140), str(tmp_path))
+    pixels = np.asarray(Image.open(map_path))
+    atlas = MapGenerator.tile_atlases[(config.map_terrain_tiles_path, config.terrain_tile_size, 
+                                       config.terrain_blend_levels)]
+    size, border = config.terrain_tile_size, config.map_border_size
+    terrain_of_speed = {speed: terrain for terrain, speed in config.terrain_speeds.items()}
+    for row in range(tile_speeds.shape[0] - 2):
+        for col in range(tile_speeds.shape[1] - 2):
+            terrain = terrain_of_speed[tile_speeds[row + 1, col + 1]]
+            tile = pixels[border + row*size:border + (row + 1)*size, border + col*size:border + (col + 1)*size]
+            variants = [atlas.variant_ids[key] for key in atlas.variant_ids if key[0] == terrain]
+            assert any(np.array_equal(tile, atlas.pixels[variant, k]) for variant in variants 
+                       for k in range(len(TileAtlas.rotations)))
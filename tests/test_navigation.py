@@ -0,0 +1,268 @@
+import random
+import numpy as np
+import pytest
+
+import distance_transform
+from benchmark_navigation import BenchmarkMap
+from conftest import dijkstra_costs
+from hierarchical_navigation import HierarchicalNavigation
+
+
+
+def tile_pairs(tile_speeds, count=60, seed=0):
+    '''Random (start, goal) pairs of passable (col, row) tiles, some of them unreachable from each other'''
+    rows, cols = np.where(tile_speeds > 0)
+    tiles = list(zip(cols.tolist(), rows.tolist()))
+    rng = random.Random(seed)
+    return [(rng.choice(tiles), rng.choice(tiles)) for i in range(count)]
+
+
+def reference_cost(small_map, start, goal):
+    step_costs = distance_transform.step_cost_grid(small_map.tile_speeds, small_map.tile_size)
+    return dijkstra_costs(step_costs, [goal])[start[1], start[0]]
+
+
+def check_path(small_map, search, start, goal):
+    '''The cost of search's path from start to goal, inf if it found none'''
+    nav = small_map.navigation
+    xy1, xy2 = small_map.tile_to_xy(*start), small_map.tile_to_xy(*goal)
+    path = search(xy1, xy2)
+    if start == goal:
+        assert path == []
+        return 0
+    if not path:
+        return np.inf
+    #the path has to end on the goal as well as cost what it claims
+    offsets = {'w': (0, -1), 's': (0, 1), 'd': (1, 0), 'a': (-1, 0)}
+    col, row = start
+    for action in path:
+        col, row = col + offsets[action][0], row + offsets[action][1]
+    assert (col, row) == goal
+    return nav.path_cost(xy1, path)
+
+
+@pytest.mark.parametrize('max_cost', [256, 0])
+def test_a_star_finds_the_cheapest_paths_with_either_open_list(config, tile_speeds, max_cost):
+    #integer step costs are ordered by BucketQueue, with max_cost 0 they're floats in IndexedPriorityQueue
+    config.navigation_bucket_queue_max_cost = max_cost
+    small_map = BenchmarkMap(config, 'small', tile_speeds)
+    assert (small_map.navigation.queue_max_cost is None) == (max_cost == 0)
+    for start, goal in tile_pairs(small_map.tile_speeds):
+        expected = reference_cost(small_map, start, goal)
+        assert check_path(small_map, small_map.navigation.a_star, start, goal) == pytest.approx(expected)
+
+
+def test_a_star_paths_end_on_the_goal_or_are_empty(small_map):
+    nav = small_map.navigation
+    for start, goal in tile_pairs(small_map.tile_speeds, seed=5):
+        expected = reference_cost(small_map, start, goal)
+        #check_path follows the actions to the goal, and [] comes back for the same tile or no path at all
+        cost = check_path(small_map, nav.a_star, start, goal)
+        assert np.isfinite(cost) == np.isfinite(expected)
+    #a goal off the map or on a lake
+    assert nav.a_star(small_map.tile_to_xy(0, 0), small_map.tile_to_xy(40, 0)) == []
+    assert nav.a_star(small_map.tile_to_xy(0, 0), small_map.tile_to_xy(9, 4)) == []
+
+
+def test_d_star_lite_costs_match_and_follow_a_moving_target(small_map):
+    nav = small_map.navigation
+    step_costs = distance_transform.step_cost_grid(small_map.tile_speeds, small_map.tile_size)
+    offsets = {'w': (0, -1), 's': (0, 1), 'd': (1, 0), 'a': (-1, 0)}
+    start, goal = (0, 0), (19, 11)
+    planner = nav.pursuit_planner(small_map.tile_to_xy(*start), small_map.tile_to_xy(*goal))
+    #the target walks up the right edge, the pursuer along the top
+    for step in range(6):
+        start, goal = (step, 0), (19, 11 - step)
+        action = nav.update_pursuit(planner, small_map.tile_to_xy(*start), small_map.tile_to_xy(*goal))
+        assert planner.complete
+        #the search stays rooted where the target was until it drifts far enough from there
+        root_row, root_col = divmod(planner.goal, nav.cols)
+        costs = dijkstra_costs(step_costs, [(root_col, root_row)])
+        assert planner.get_cost() == pytest.approx(costs[start[1], start[0]])
+        #its next move starts one of the cheapest paths there
+        col, row = start[0] + offsets[action][0], start[1] + offsets[action][1]
+        assert step_costs[row, col] + costs[row, col] == pytest.approx(costs[start[1], start[0]])
+    #and it has by now
+    assert planner.goal != 11 * nav.cols + 19
+
+
+def test_breadth_first_finds_paths_where_there_are_some(small_map):
+    for start, goal in tile_pairs(small_map.tile_speeds, seed=2):
+        expected = reference_cost(small_map, start, goal)
+        cost = check_path(small_map, small_map.navigation.breadth_first, start, goal)
+        assert np.isfinite(cost) == np.isfinite(expected)
+        assert cost >= expected - 1e-9
+
+
+def test_a_star_without_landmarks_finds_the_cheapest_paths(small_map):
+    small_map.navigation.landmark_costs = None
+    for start, goal in tile_pairs(small_map.tile_speeds, seed=1):
+        expected = reference_cost(small_map, start, goal)
+        assert check_path(small_map, small_map.navigation.a_star, start, goal) == pytest.approx(expected)
+
+
+def test_nearest_goal_picks_the_cheapest_goal(small_map):
+    nav = small_map.navigation
+    goals = [(19, 0), (0, 11), (4, 11)]
+    for start, _ in tile_pairs(small_map.tile_speeds, count=30, seed=4):
+        costs = [reference_cost(small_map, start, goal) for goal in goals]
+        index, path = nav.nearest_goal(small_map.tile_to_xy(*start), [small_map.tile_to_xy(*goal) for goal in goals])
+        if start in goals:
+            continue
+        if not np.isfinite(min(costs)):
+            assert (index, path) == (None, [])
+            continue
+        assert costs[index] == pytest.approx(min(costs))
+        assert nav.path_cost(small_map.tile_to_xy(*start), path) == pytest.approx(min(costs))
+
+
+def test_a_star_and_nearest_goal_starting_on_a_barricade(small_map):
+    nav = small_map.navigation
+    rows, cols = np.where(small_map.tile_speeds == 0)
+    barricades = list(zip(cols.tolist(), rows.tolist()))
+    goals = [(0, 0), (19, 11), (19, 0), (0, 11), (4, 11)]
+    for start in barricades:
+        for goal in goals:
+            expected = reference_cost(small_map, start, goal)
+            assert check_path(small_map, nav.a_star, start, goal) == pytest.approx(expected)
+            index, path = nav.nearest_goal(small_map.tile_to_xy(*start), [small_map.tile_to_xy(*goal)])
+            cost = nav.path_cost(small_map.tile_to_xy(*start), path) if path else np.inf
+            assert cost == pytest.approx(expected)
+
+
+def test_plan_many_shares_searches_and_finds_the_cheapest_paths(small_map):
+    nav = small_map.navigation
+    goal = (19, 0)
+    starts = [(0, 0), (5, 8), (12, 11), (4, 11), (19, 0)]
+    requests = [(small_map.tile_to_xy(*start), small_map.tile_to_xy(*goal), 'astar') for start in starts]
+    #a duplicate and a request with a goal of its own
+    requests += [requests[0], (small_map.tile_to_xy(0, 0), small_map.tile_to_xy(0, 11), 'astar')]
+    paths = nav.plan_many(requests)
+
+    #one reverse search for the shared goal, one search for the other
+    assert nav.plan_stats['unique'] == 6 and nav.plan_stats['searches'] == 2
+    assert paths[5] == paths[0]
+    for (xy1, xy2, nav_type), path, start in zip(requests, paths, starts):
+        expected = reference_cost(small_map, start, goal)
+        assert check_path(small_map, lambda xy1, xy2: path, start, goal) == pytest.approx(expected)
+    #the pocket can't reach the goal, and the paths were left in the path cache
+    assert paths[3] == []
+    assert nav.get_path(*requests[1]) == paths[1]
+
+
+def test_plan_many_reverse_searches_stay_within_the_frame_budget(config, small_map):
+    nav = small_map.navigation
+    goal_xy = small_map.tile_to_xy(19, 0)
+    requests = [(small_map.tile_to_xy(*start), goal_xy, 'astar') for start in [(0, 0), (5, 8), (12, 11)]]
+
+    config.navigation_frame_expansions = 10
+    nav.begin_frame()
+    #the budget runs out before the reverse search finishes, the players search for themselves
+    assert nav.plan_many(requests) == [None] * 3
+    assert nav.frame_expansions_left == 0
+
+    config.navigation_frame_expansions = 10000
+    nav.begin_frame()
+    assert all(nav.plan_many(requests))
+    nav.end_frame()
+
+
+def test_plan_many_skips_starts_that_cannot_reach_the_goal(small_map):
+    nav = small_map.navigation
+    #the pocket can't reach the goal, the other start is next to it
+    requests = [(small_map.tile_to_xy(*start), small_map.tile_to_xy(19, 0), 'astar') for start in [(4, 11), (18, 0)]]
+    expansions = nav.expansions
+    assert nav.plan_many(requests) == [[], ['d']]
+    #the reverse search stops at the start next to the goal instead of flooding the map for the pocket
+    assert nav.expansions - expansions <= 5
+
+
+def test_continue_search_spreads_a_search_over_frames(config, small_map):
+    nav = small_map.navigation
+    config.navigation_frame_expansions = 5
+    start, goal = (0, 0), (19, 11)
+    search = nav.start_search(small_map.tile_to_xy(*start), small_map.tile_to_xy(*goal), 'astar')
+    frames = 0
+    path = None
+    while path is None:
+        nav.begin_frame()
+        path = nav.continue_search(search)
+        assert search.last_expansions <= 5
+        frames += 1
+    assert frames > 1
+    cost = check_path(small_map, lambda xy1, xy2: path, start, goal)
+    assert cost == pytest.approx(reference_cost(small_map, start, goal))
+
+
+def test_theta_star_waypoints_end_on_the_goal_and_cost_about_the_cheapest(small_map):
+    nav = small_map.navigation
+    for start, goal in tile_pairs(small_map.tile_speeds, seed=9):
+        expected = reference_cost(small_map, start, goal)
+        xy1 = small_map.tile_to_xy(*start)
+        waypoints = nav.theta_star(xy1, small_map.tile_to_xy(*goal))
+        if start == goal or not np.isfinite(expected):
+            assert waypoints == []
+            continue
+        assert small_map.xy_to_cr(*waypoints[-1]) == goal
+        #a straight line is only taken where it's no slower than the grid path
+        cost = nav.path_cost(xy1, waypoints)
+        assert expected - 1e-9 <= cost <= expected * 1.1
+
+
+def test_flow_fields_lead_every_tile_down_the_cheapest_path(small_map):
+    nav = small_map.navigation
+    goal_sets = [[(19, 0)], [(0, 11), (1, 11), (0, 10)]]
+    step_costs = distance_transform.step_cost_grid(small_map.tile_speeds, small_map.tile_size)
+    offsets = {'w': (0, -1), 's': (0, 1), 'd': (1, 0), 'a': (-1, 0)}
+    for flow_field, goal_tiles in zip(nav.flow_fields(goal_sets), goal_sets):
+        expected = dijkstra_costs(step_costs, goal_tiles)
+        for start, goal in tile_pairs(small_map.tile_speeds, seed=3):
+            col, row = start
+            assert flow_field.get_cost(col, row) == expected[row, col]
+            #following the directions from any tile that can reach a goal ends on one at the cost to go
+            cost = 0
+            while flow_field.get_direction(col, row):
+                action = flow_field.get_direction(col, row)
+                col, row = col + offsets[action][0], row + offsets[action][1]
+                cost += step_costs[row, col]
+            if np.isfinite(expected[start[1], start[0]]):
+                assert (col, row) in goal_tiles
+                assert cost == pytest.approx(expected[start[1], start[0]])
+            else:
+                assert (col, row) == start
+    #off the map there is no direction
+    assert nav.flow_field([(19, 0)]).get_direction(20, 0) == ''
+
+
+@pytest.fixture
+def every_map_hierarchical(monkeypatch):
+    '''Search the small map's clusters with the abstract graph rather than leave it to A* like small maps are'''
+    monkeypatch.setattr(HierarchicalNavigation, 'min_clusters', 0)
+
+
+def test_hierarchical_a_star_paths_are_close_to_the_cheapest(small_map, every_map_hierarchical):
+    for start, goal in tile_pairs(small_map.tile_speeds, seed=3):
+        expected = reference_cost(small_map, start, goal)
+        cost = check_path(small_map, small_map.navigation.hierarchical_a_star, start, goal)
+        assert np.isfinite(cost) == np.isfinite(expected)
+        if np.isfinite(expected):
+            assert expected - 1e-9 <= cost <= expected * 1.25 + 1e-9
+
+
+def test_hierarchical_a_star_builds_its_graph_and_searches_within_the_frame_budget(config, small_map,
+                                                                                   every_map_hierarchical):
+    nav = small_map.navigation
+    config.navigation_frame_expansions = 5
+    start, goal = (0, 0), (19, 11)
+    search = nav.start_search(small_map.tile_to_xy(*start), small_map.tile_to_xy(*goal), 'hpa')
+    frames = 0
+    path = None
+    while path is None:
+        nav.begin_frame()
+        path = nav.continue_search(search)
+        assert search.last_expansions <= 5
+        frames += 1
+    assert nav.hierarchical_navigation.is_built()
+    assert frames > 10
+    cost = check_path(small_map, lambda xy1, xy2: path, start, goal)
+    assert cost <= reference_cost(small_map, start, goal) * 1.25 + 1e-9
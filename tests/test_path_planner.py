@@ -0,0 +1,64 @@
+import time
+import pytest
+
+from path_planner import PathPlanner
+
+
+
+class SlicedSearch():
+    '''Stands in for a BudgetedSearch that takes a given number of slices to finish'''
+    def __init__(self, key, slices):
+        self.key = key
+        self.slices = slices
+        self.steps = 0
+        self.done = False
+        self.path = None
+
+
+    def step(self, max_expansions=None, deadline=None):
+        self.steps += 1
+        if self.steps >= self.slices:
+            self.done = True
+            self.path = ['d'] * self.slices
+        return self.done
+
+
+
+def test_paused_workers_wait_until_resumed(small_map):
+    planner = PathPlanner(small_map.navigation, workers=1)
+    planner.pause()
+    search = SlicedSearch('key', 3)
+    future = planner.submit_search(search)
+    #a worker finishes the slice it is on, then waits
+    time.sleep(0.05)
+    assert search.steps == 1 and not future.done()
+    #the same search submitted again shares the running one's future
+    assert planner.submit_search(SlicedSearch('key', 3)) is future
+
+    planner.resume()
+    assert future.result(timeout=5) == ('d', 'd', 'd')
+    assert search.steps == 3
+    assert small_map.navigation.path_cache.get('key') == ('d', 'd', 'd')
+    planner.shutdown()
+
+
+def test_planner_searches_find_the_same_paths(small_map):
+    nav = small_map.navigation
+    xy1, xy2 = small_map.tile_to_xy(0, 0), small_map.tile_to_xy(19, 11)
+    expected = nav.a_star(xy1, xy2)
+    nav.path_cache.clear()
+
+    nav.start_planner(2)
+    try:
+        search = nav.start_search(xy1, xy2, 'astar')
+        assert search.future is not None
+        path = None
+        deadline = time.perf_counter() + 5
+        while path is None and time.perf_counter() < deadline:
+            nav.begin_frame()
+            path = nav.continue_search(search)
+            nav.end_frame()
+            time.sleep(0.001)
+        assert path == expected
+    finally:
+        nav.stop_planner()
@@ -0,0 +1,69 @@
+import os
+import pytest
+
+#players import pygame_utils, which needs no display for these tests
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from benchmark_navigation import BenchmarkMap
+from player import Player
+
+
+
+class PlayerMap(BenchmarkMap):
+    '''The parts of TheMap a player steering along waypoints uses'''
+    def get_speed(self, tile_col, tile_row):
+        #the small map has no border, off the map is as good as a barricade
+        rows, cols = self.tile_speeds.shape
+        if 0 <= tile_row < rows and 0 <= tile_col < cols:
+            return int(self.tile_speeds[tile_row, tile_col])
+        return 0
+
+
+
+@pytest.fixture
+def player(config, tile_speeds):
+    the_map = PlayerMap(config, 'small', tile_speeds)
+    player = Player(*the_map.tile_to_xy(0, 0), 0, 'blue', 'thetastar', the_map, config)
+    #count the searches the player starts
+    player.searches = 0
+    start_search = the_map.navigation.start_search
+    def counting_start_search(*args):
+        player.searches += 1
+        return start_search(*args)
+    the_map.navigation.start_search = counting_start_search
+    return player
+
+
+def walk(player, xy, ticks):
+    '''Take ticks steps along the player's waypoints to xy, the steps into barricades are blocked'''
+    offsets = {'w': (0, -1), 's': (0, 1), 'a': (-1, 0), 'd': (1, 0)}
+    for i in range(ticks):
+        action = player.get_waypoint_direction_to_xy(xy)[0]
+        x = player.x + offsets[action][0] * player.speed
+        y = player.y + offsets[action][1] * player.speed
+        if player.the_map.get_speed(*player.the_map.xy_to_cr(x, y)):
+            player.x, player.y = x, y
+
+
+def test_waypoints_lead_to_the_goal_with_one_search(player):
+    goal_xy = player.the_map.tile_to_xy(19, 11)
+    walk(player, goal_xy, 200)
+    assert player.the_map.xy_to_cr(player.x, player.y) == (19, 11)
+    assert player.searches == 1
+
+
+def test_waypoints_are_searched_again_once_left_behind(player, config):
+    goal_xy = player.the_map.tile_to_xy(19, 11)
+    walk(player, goal_xy, 5)
+    assert player.searches == 1
+
+    #pushed well off the line to the next waypoint, onto the bottom row
+    player.x, player.y = player.the_map.tile_to_xy(8, 11)
+    walk(player, goal_xy, 1)
+    assert player.searches == 2
+
+    #held still, it searches again on the tick after navigation_waypoint_stall_ticks without coming closer
+    for i in range((config.navigation_waypoint_stall_ticks + 1) * 2 + 1):
+        player.get_waypoint_direction_to_xy(goal_xy)
+    assert player.searches == 4
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from the_map import TheMap
+
+
+
+@pytest.fixture
+def the_map(config):
+    the_map = TheMap(config)
+    rows, cols = the_map.tile_speeds.shape
+    the_map.set_flag_location('blue', 3 * the_map.tile_size + 5, (rows // 2) * the_map.tile_size + 5)
+    the_map.set_flag_location('red', (cols - 4) * the_map.tile_size + 5, (rows // 2) * the_map.tile_size + 5)
+    return the_map
+
+
+def test_mask_queries_match_the_tile_rules(the_map):
+    rows, cols = the_map.tile_speeds.shape
+    #every tile and a ring of tiles off the map
+    tile_rows, tile_cols = [index.ravel() for index in np.indices((rows + 2, cols + 2)) - 1]
+    on_map = (tile_rows >= 0) & (tile_rows < rows) & (tile_cols >= 0) & (tile_cols < cols)
+
+    for team, flag_area_tiles in [('blue', the_map.blue_flag_area_tiles), ('red', the_map.red_flag_area_tiles)]:
+        in_flag_areas = the_map.in_flag_areas(team, tile_cols, tile_rows)
+        in_enemy_territories = the_map.in_enemy_territories(team, tile_cols, tile_rows)
+        for tile_col, tile_row, in_area, in_territory, inside in zip(tile_cols, tile_rows, in_flag_areas,
+                                                                     in_enemy_territories, on_map):
+            assert in_area == ((tile_row, tile_col) in flag_area_tiles and inside)
+            assert in_area == the_map.in_flag_area(team, tile_col, tile_row)
+            assert in_territory == (inside and the_map.in_enemy_territory(team, tile_col))
+        assert in_flag_areas.sum() == len(flag_area_tiles)
+
+    passable = the_map.are_passable(tile_cols, tile_rows)
+    for tile_col, tile_row, is_passable, inside in zip(tile_cols, tile_rows, passable, on_map):
+        assert is_passable == (inside and the_map.get_speed(tile_col, tile_row) > 0)
+        assert is_passable == the_map.is_passable(tile_col, tile_row)
+
+
+def test_tiles_in_mask_takes_the_shape_of_its_tiles(the_map):
+    tile_cols = np.array([[0, 1], [2, -1]])
+    tile_rows = np.array([[0, 0], [0, 0]])
+    result = the_map.tiles_in_mask(the_map.passable_mask, tile_cols, tile_rows)
+    assert result.shape == (2, 2) and not result[1, 1]
+    #xy_to_cr gives the tiles of arrays of x and y
+    xs, ys = np.array([5, 25, 45]), np.array([5, 5, 5])
+    assert np.array_equal(the_map.are_passable(*the_map.xy_to_cr(xs, ys)), the_map.passable_mask[0, :3])
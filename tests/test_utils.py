@@ -0,0 +1,107 @@
+import random
+
+from utils import IndexedPriorityQueue, BucketQueue, PriorityQueue
+
+
+
+def pop_all(queue):
+    items = []
+    while not queue.isEmpty():
+        items.append(queue.pop())
+    return items
+
+
+def test_indexed_priority_queue_decrease_key():
+    queue = IndexedPriorityQueue(10)
+    for item, priority in [(0, 5), (1, 3), (2, 8), (3, 6)]:
+        queue.push(item, priority)
+    queue.update(2, 1)
+    #not lower, ignored
+    queue.update(1, 9)
+    queue.update(4, 4)
+    assert pop_all(queue) == [2, 1, 4, 0, 3]
+
+
+def test_indexed_priority_queue_ties_pop_in_insertion_order():
+    queue = IndexedPriorityQueue(10)
+    for item in [4, 2, 7, 1]:
+        queue.push(item, 3)
+    queue.update(7, 3)
+    assert pop_all(queue) == [4, 2, 7, 1]
+
+
+def test_indexed_priority_queue_matches_priority_queue():
+    rng = random.Random(1)
+    indexed, reference = IndexedPriorityQueue(50), PriorityQueue()
+    for i in range(300):
+        item, priority = rng.randrange(50), rng.randrange(100)
+        indexed.update(item, priority)
+        reference.update(item, priority)
+    assert pop_all(indexed) == pop_all(reference)
+
+
+def test_bucket_queue_wraps_around_its_buckets():
+    #priorities climb far past the 4 buckets, a few at a time like a Dijkstra frontier
+    queue = BucketQueue(100, 3)
+    queue.push(0, 0)
+    popped = []
+    while not queue.isEmpty():
+        item = queue.pop()
+        popped.append(item)
+        #item k is pushed at k + 1 by item k - 2, and lowered to k by item k - 1
+        for next_item, priority in [(item + 1, item + 1), (item + 2, item + 3)]:
+            if next_item < 100:
+                queue.update(next_item, priority)
+    assert popped == list(range(100))
+    assert queue.minimum == 99
+
+
+def test_bucket_queue_ties_pop_last_in_first_out():
+    queue = BucketQueue(10, 2)
+    for item in [3, 5, 1]:
+        queue.push(item, 4)
+    assert pop_all(queue) == [1, 5, 3]
+
+
+def test_bucket_queue_update_lowers_priority():
+    queue = BucketQueue(10, 5)
+    queue.push(0, 0)
+    queue.push(1, 5)
+    queue.push(2, 3)
+    queue.update(1, 1)
+    #not lower, ignored
+    queue.update(2, 4)
+    assert pop_all(queue) == [0, 1, 2]
+
+
+def test_bucket_queue_priorities_outside_the_span():
+    queue = BucketQueue(10, 2)
+    queue.push(0, 10)
+    #above the buckets' span
+    queue.push(1, 25)
+    queue.push(2, 11)
+    assert queue.pop() == 0
+    #below the last priority popped
+    queue.push(3, 4)
+    queue.update(1, 12)
+    queue.push(4, 40)
+    assert pop_all(queue) == [3, 2, 1, 4]
+    assert queue.isEmpty()
+
+
+def test_bucket_queue_matches_a_heap_with_any_priorities():
+    for seed in range(200):
+        rng = random.Random(seed)
+        queue, expected = BucketQueue(30, rng.randint(1, 6)), {}
+        for i in range(150):
+            if expected and rng.random() < 0.4:
+                lowest = min(expected.values())
+                assert expected.pop(queue.pop()) == lowest
+            else:
+                item, priority = rng.randrange(30), rng.randrange(60)
+                queue.update(item, priority)
+                expected[item] = min(expected.get(item, priority), priority)
+        while expected:
+            lowest = min(expected.values())
+            assert expected.pop(queue.pop()) == lowest
+        assert queue.isEmpty()